@@ -0,0 +1,9 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Benchmarks for development, kept apart from the management commands
+(and the Docker image) of production.  Run them from the top-level directory,
+e.g. ``python3 -m benchmarks.statusparsing --help``.
+Those that need Django set it up in their ``main`` function.
+"""
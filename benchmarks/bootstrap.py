@@ -0,0 +1,114 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Compares the regular import of new issues with bootstrapping (using COPY)
+on synthetic issues, inside transactions that are rolled back
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections.abc import Iterator
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+import django
+from django.db import transaction
+
+from wnpp_debian_net.debbugs import DebbugsWnppClient, IssueProperty, IssueStatus
+
+_COUNT_PACKAGES = 5000
+_EPOCH_SECONDS = 1_600_000_000  # arbitrary
+
+
+class _SyntheticDebbugsWnppClient(DebbugsWnppClient):
+    """
+    Serves synthetic issues from memory, rather than from Debbugs' SOAP service
+    """
+
+    def __init__(self, count_issues: int):
+        super().__init__()
+        self._count_issues = count_issues
+
+    def connect(self):
+        pass
+
+    def fetch_ids_of_issues_with_status(self, status: IssueStatus) -> list[int]:
+        if status != IssueStatus.OPEN:
+            return []
+        return list(range(1, self._count_issues + 1))
+
+    def fetch_issues(self, issue_ids, properties=None) -> Iterator[tuple[int, dict[str, str]]]:
+        for issue_id in issue_ids:
+            yield (
+                issue_id,
+                {
+                    IssueProperty.DATE.value: str(_EPOCH_SECONDS + issue_id),
+                    IssueProperty.LAST_MODIFIED.value: str(_EPOCH_SECONDS + 2 * issue_id),
+                    IssueProperty.ORIGINATOR.value: f"Originator {issue_id} <{issue_id}@example.org>",
+                    IssueProperty.OWNER.value: "",
+                    IssueProperty.SUBJECT.value: (
+                        f"ITP: package{issue_id % _COUNT_PACKAGES} -- Synthetic package {issue_id}"
+                    ),
+                },
+            )
+
+
+def _measure(count_issues: int, bootstrap: bool) -> tuple[float, int]:
+    """
+    Returns the seconds taken and the number of issues imported
+    (as seen right before rolling back)
+    """
+    # NOTE: These need Django to be set up already
+    from wnpp_debian_net.management.commands.importdebbugs import (
+        Command as ImportDebbugsCommand,
+    )
+    from wnpp_debian_net.models import DebianWnpp
+
+    with TemporaryDirectory() as tempdir, transaction.atomic():
+        if DebianWnpp.objects.exists():
+            sys.exit("Benchmarking needs a database without any issues.")
+
+        started = time.perf_counter()
+        ImportDebbugsCommand(stdout=StringIO(), stderr=StringIO()).handle(
+            client=_SyntheticDebbugsWnppClient(count_issues),
+            cache_dir=tempdir,
+            bootstrap=bootstrap,
+        )
+        seconds = time.perf_counter() - started
+        count_issues_imported = DebianWnpp.objects.count()
+
+        transaction.set_rollback(True)
+
+    return seconds, count_issues_imported
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.bootstrap")
+    parser.add_argument("--issues", metavar="COUNT", type=int, default=50_000)
+    options = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wnpp_debian_net.settings")
+    django.setup()
+
+    print(f"Importing {options.issues} synthetic issues...")
+
+    seconds_of_mode: dict[str, float] = {}
+    for label, bootstrap in (("Regular import", False), ("Bootstrapping", True)):
+        seconds, count_issues_imported = _measure(options.issues, bootstrap=bootstrap)
+        if count_issues_imported != options.issues:
+            sys.exit(f"{label} is incomplete.")
+        print(f"{label}: {seconds:.3f} s")
+        seconds_of_mode[label] = seconds
+
+    print(
+        f"Bootstrapping took"
+        f" {seconds_of_mode['Bootstrapping'] / seconds_of_mode['Regular import']:.0%}"
+        " of the time of the regular import."
+    )
+
+
+if __name__ == "__main__":
+    main()
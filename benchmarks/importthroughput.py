@@ -0,0 +1,119 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Measures end-to-end throughput of importdebbugs against a local fake Debbugs server,
+inside transactions that are rolled back
+"""
+
+import argparse
+import os
+import sys
+import time
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+import django
+from django.db import transaction
+
+from wnpp_debian_net.debbugs import DebbugsWnppClient, PooledHttpTransport
+from wnpp_debian_net.fake_debbugs_server import FakeDebbugsServer
+
+
+def _measure(
+    count_issues: int,
+    latency_seconds: float = 0.0,
+    error_rate: float = 0.0,
+    max_requests_in_flight: int | None = None,
+) -> tuple[float, int, FakeDebbugsServer]:
+    """
+    Returns the seconds taken, the number of issues imported
+    (as seen right before rolling back) and the server, for its counters.
+    Uses the default of importdebbugs unless ``max_requests_in_flight`` is given.
+    """
+    # NOTE: These need Django to be set up already
+    from wnpp_debian_net.management.commands.importdebbugs import (
+        _DEFAULT_MAX_REQUESTS_IN_FLIGHT,
+    )
+    from wnpp_debian_net.management.commands.importdebbugs import (
+        Command as ImportDebbugsCommand,
+    )
+    from wnpp_debian_net.models import DebianWnpp
+
+    if max_requests_in_flight is None:
+        max_requests_in_flight = _DEFAULT_MAX_REQUESTS_IN_FLIGHT
+
+    with (
+        FakeDebbugsServer(
+            count_issues, latency_seconds=latency_seconds, error_rate=error_rate
+        ) as server,
+        TemporaryDirectory() as tempdir,
+        transaction.atomic(),
+    ):
+        if DebianWnpp.objects.exists():
+            sys.exit("Benchmarking needs a database without any issues.")
+
+        client = DebbugsWnppClient(
+            transport=PooledHttpTransport(pool_size=max_requests_in_flight),
+            location=server.location,
+        )
+        started = time.perf_counter()
+        ImportDebbugsCommand(stdout=StringIO(), stderr=StringIO()).handle(
+            client=client,
+            cache_dir=tempdir,
+            max_requests_in_flight=max_requests_in_flight,
+        )
+        seconds = time.perf_counter() - started
+        count_issues_imported = DebianWnpp.objects.count()
+
+        transaction.set_rollback(True)
+
+    return seconds, count_issues_imported, server
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.importthroughput")
+    parser.add_argument(
+        "--issues",
+        dest="counts_issues",
+        metavar="COUNT",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000],
+    )
+    parser.add_argument(
+        "--latency", dest="latency_seconds", metavar="SECONDS", type=float, default=0.0
+    )
+    parser.add_argument("--error-rate", dest="error_rate", metavar="RATE", type=float, default=0.0)
+    parser.add_argument(
+        "--max-requests-in-flight",
+        dest="max_requests_in_flight",
+        metavar="COUNT",
+        type=int,
+        default=None,  # i.e. that of importdebbugs
+    )
+    options = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wnpp_debian_net.settings")
+    django.setup()
+
+    for count_issues in options.counts_issues:
+        print(f"Importing {count_issues} issues from a fake Debbugs server...")
+        seconds, count_issues_imported, server = _measure(
+            count_issues,
+            latency_seconds=options.latency_seconds,
+            error_rate=options.error_rate,
+            max_requests_in_flight=options.max_requests_in_flight,
+        )
+        if count_issues_imported != count_issues:
+            sys.exit(f"Import is incomplete ({count_issues_imported} of {count_issues} issues).")
+        print(
+            f"Imported {count_issues} issues in {seconds:.3f} s"
+            f" ({count_issues / seconds:.0f} issues/s)"
+            f" with {server.count_requests} request(s)"
+            f" and {server.count_errors} injected error(s)."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Compares regex-based parsing of popcon files with streaming parsing
+for parse time and peak RSS, based on a synthetic file
+"""
+
+import argparse
+import gzip
+import os
+import resource
+import sys
+import time
+from collections.abc import Callable
+from importlib import resources
+from tempfile import TemporaryDirectory
+
+from wnpp_debian_net.management.commands import tests
+from wnpp_debian_net.popcon import POPCON_LINE_EXTRACTOR, iterate_popcon_entries_in_file
+
+_HEADER_BASENAME = "by_inst_binary_head_13_tail_4.txt"
+_COUNT_HEADER_LINES = 11
+
+
+def _parse_via_regex(filename: str) -> dict[str, dict[str, str]]:
+    """
+    Parses a popcon file the way ``importpopcon`` used to before streaming parsing,
+    to serve as a baseline
+    """
+    with gzip.open(filename, "r") as f:
+        content = f.read().decode("utf-8", errors="backslashreplace")
+
+    entries: dict[str, dict[str, str]] = {}
+    for line in content.split("\n"):
+        match = POPCON_LINE_EXTRACTOR.search(line.rstrip())
+        if match is None:
+            continue
+
+        stats = match.groupdict()
+
+        package_name = stats["name"]
+        if package_name == "Total":
+            continue
+        del stats["name"]
+
+        entries[package_name] = stats
+    return entries
+
+
+def _parse_via_streaming(filename: str) -> dict[str, tuple[int, ...]]:
+    return {entry[0]: entry[1:] for entry in iterate_popcon_entries_in_file(filename)}
+
+
+def _write_synthetic_file(filename: str, count_packages: int) -> None:
+    path = resources.files(tests.__name__).joinpath("popcon_test_data", _HEADER_BASENAME)
+    header_lines = path.read_text().splitlines(keepends=True)[:_COUNT_HEADER_LINES]
+    with gzip.open(filename, "wt") as f:
+        f.writelines(header_lines)
+        for rank in range(1, count_packages + 1):
+            f.write(
+                f"{rank:<5} package{rank:<24} {2 * rank:>6} {rank:>6} {rank % 997:>5}"
+                f" {rank % 89:>5} {rank % 7:>5} (Maintainer {rank})\n"
+            )
+        f.write(f"{count_packages:<5} Total {count_packages**2} 0 0 0 0 0\n")
+
+
+def _measure_peak_rss_growth(parse: Callable[[str], dict], filename: str) -> int:
+    """
+    Parses in a forked child process, so that its peak RSS is not masked
+    by the peak of any earlier parsing in this process
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # i.e. child
+        try:
+            os.close(read_fd)
+            rss_before_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            parse(filename)
+            rss_after_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_fd, str(rss_after_kib - rss_before_kib).encode())
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        growth_kib = int(f.read() or 0)
+    os.waitpid(pid, 0)
+    return growth_kib * 1024
+
+
+def _measure(parse: Callable[[str], dict], filename: str, rounds: int) -> tuple[float, int]:
+    peak_rss_growth_bytes = _measure_peak_rss_growth(parse, filename)
+
+    seconds_of_round: list[float] = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        parse(filename)
+        seconds_of_round.append(time.perf_counter() - started)
+
+    return min(seconds_of_round), peak_rss_growth_bytes  # i.e. the least disturbed round
+
+
+def _parsers_agree(filename: str) -> bool:
+    return {
+        package_name: tuple(int(value) for value in stats.values())
+        for package_name, stats in _parse_via_regex(filename).items()
+    } == _parse_via_streaming(filename)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.popconparsing")
+    parser.add_argument("--packages", metavar="COUNT", type=int, default=200_000)
+    parser.add_argument("--rounds", metavar="COUNT", type=int, default=5)
+    options = parser.parse_args(argv)
+
+    with TemporaryDirectory() as tempdir:
+        filename = os.path.join(tempdir, "by_inst.gz")
+        _write_synthetic_file(filename, options.packages)
+        print(f"Parsing a popcon file of {os.path.getsize(filename)} bytes...")
+
+        if not _parsers_agree(filename):
+            sys.exit("Parsers disagree about the file.")
+
+        regex_seconds, regex_peak_bytes = _measure(_parse_via_regex, filename, options.rounds)
+        print(f"Regex: {regex_seconds:.3f} s, peak RSS +{regex_peak_bytes / 2**20:.1f} MiB")
+
+        seconds, peak_bytes = _measure(_parse_via_streaming, filename, options.rounds)
+        print(f"Streaming: {seconds:.3f} s, peak RSS +{peak_bytes / 2**20:.1f} MiB")
+
+    print(
+        f"Streaming parsing took {seconds / regex_seconds:.0%} of the time"
+        f" and {peak_bytes / max(regex_peak_bytes, 1):.0%} of the peak RSS growth."
+    )
+
+
+if __name__ == "__main__":
+    main()
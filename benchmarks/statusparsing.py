@@ -0,0 +1,135 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Compares DOM-based and streaming parsing of Debbugs' get_status responses
+for parse time and peak memory, based on a recorded response
+"""
+
+import argparse
+import base64
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from importlib import resources
+
+import yaml
+from pysimplesoap.simplexml import SimpleXMLElement
+
+from wnpp_debian_net import tests
+from wnpp_debian_net.debbugs import DebbugsWnppClient, IssueProperty
+
+_CASSETTE_BASENAME = "DebbugsWnppClientTest.test_fetch_issues.yaml"
+_MAP_TAG_NAME = b"s-gensym3"
+_PROJECTION = (
+    IssueProperty.DATE,
+    IssueProperty.LAST_MODIFIED,
+    IssueProperty.MERGEDWITH,
+    IssueProperty.ORIGINATOR,
+    IssueProperty.OWNER,
+    IssueProperty.SUBJECT,
+)
+
+
+def _decode_base64_as_needed(candidate: str | None) -> str | None:
+    if candidate is None:
+        return None
+
+    try:
+        return base64.decodebytes(candidate.encode("ascii")).decode()
+    except ValueError:
+        return candidate
+
+
+def _parse_via_dom(content: bytes) -> dict[int, dict[str, str]]:
+    """
+    Parses a ``get_status`` response the way ``DebbugsWnppClient.fetch_issues``
+    used to before streaming parsing, to serve as a baseline
+    """
+    soap_result = SimpleXMLElement(content)
+    properties_of_issue: dict[int, dict[str, str]] = {}
+    map_element = soap_result._element.getElementsByTagName(_MAP_TAG_NAME.decode())[0]
+    for item_element in map_element.childNodes:
+        key_element = item_element.childNodes[0]
+        value_element = item_element.childNodes[1]
+
+        issue_id = int(key_element.firstChild.nodeValue)
+        properties_of_issue[issue_id] = {
+            node.tagName: _decode_base64_as_needed(node.firstChild.nodeValue)
+            for node in value_element.childNodes
+            if node.firstChild is not None
+        }
+    return properties_of_issue
+
+
+def _parse_via_streaming(content: bytes) -> dict[int, dict[str, str]]:
+    return dict(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+
+def _parse_via_streaming_projected(content: bytes) -> dict[int, dict[str, str]]:
+    return dict(DebbugsWnppClient.iterate_issues_in_status_response(content, _PROJECTION))
+
+
+def _load_recorded_response() -> bytes:
+    path = resources.files(tests.__name__).joinpath("cassettes", _CASSETTE_BASENAME)
+    cassette_doc = yaml.safe_load(path.read_text())
+    return cassette_doc["interactions"][0]["response"]["body"]["string"].encode("utf-8")
+
+
+def _inflate(content: bytes, copies: int) -> bytes:
+    """
+    Repeats the ``<item>`` elements of the map ``copies`` times
+    to simulate responses to bigger batches
+    """
+    map_start = content.index(b">", content.index(b"<" + _MAP_TAG_NAME)) + 1
+    map_end = content.index(b"</" + _MAP_TAG_NAME)
+    return content[:map_start] + content[map_start:map_end] * copies + content[map_end:]
+
+
+def _measure(parse: Callable[[bytes], dict], content: bytes, rounds: int) -> tuple[float, int]:
+    seconds_of_round: list[float] = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        parse(content)
+        seconds_of_round.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        parse(content)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(seconds_of_round), peak_bytes  # i.e. the least disturbed round
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.statusparsing")
+    parser.add_argument("--copies", metavar="COUNT", type=int, default=1000)
+    parser.add_argument("--rounds", metavar="COUNT", type=int, default=5)
+    options = parser.parse_args(argv)
+
+    content = _inflate(_load_recorded_response(), options.copies)
+    print(f"Parsing a response of {len(content)} bytes...")
+
+    if _parse_via_dom(content) != _parse_via_streaming(content):
+        sys.exit("Parsers disagree about the response.")
+
+    dom_seconds, dom_peak_bytes = _measure(_parse_via_dom, content, options.rounds)
+    print(f"DOM: {dom_seconds:.3f} s, peak {dom_peak_bytes / 2**20:.1f} MiB")
+
+    for label, parse in (
+        ("Streaming", _parse_via_streaming),
+        ("Streaming with projection", _parse_via_streaming_projected),
+    ):
+        seconds, peak_bytes = _measure(parse, content, options.rounds)
+        print(f"{label}: {seconds:.3f} s, peak {peak_bytes / 2**20:.1f} MiB")
+        print(
+            f"{label} parsing took {seconds / dom_seconds:.0%} of the time"
+            f" and {peak_bytes / dom_peak_bytes:.0%} of the peak memory."
+        )
+
+
+if __name__ == "__main__":
+    main()
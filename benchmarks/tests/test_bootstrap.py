@@ -0,0 +1,18 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+from django.test import TestCase
+from parameterized import parameterized
+
+from wnpp_debian_net.models import DebianWnpp
+
+from ..bootstrap import _measure
+
+
+class MeasureTest(TestCase):
+    @parameterized.expand([("regular import", False), ("bootstrapping", True)])
+    def test_all_issues_imported_then_rolled_back(self, _label, bootstrap):
+        _seconds, count_issues_imported = _measure(20, bootstrap=bootstrap)
+
+        self.assertEqual(count_issues_imported, 20)
+        self.assertFalse(DebianWnpp.objects.exists())
@@ -0,0 +1,23 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from wnpp_debian_net.models import DebianWnpp
+
+from ..importthroughput import _measure
+
+
+class MeasureTest(TestCase):
+    @patch("wnpp_debian_net.debbugs._sleep")  # i.e. no back-off in between retries
+    def test_all_issues_imported_despite_errors_then_rolled_back(self, _sleep_mock):
+        _seconds, count_issues_imported, server = _measure(
+            40, error_rate=0.5, max_requests_in_flight=2
+        )
+
+        self.assertEqual(count_issues_imported, 40)
+        self.assertGreater(server.count_errors, 0)
+        self.assertGreater(server.count_requests, server.count_errors)
+        self.assertFalse(DebianWnpp.objects.exists())
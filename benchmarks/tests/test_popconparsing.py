@@ -0,0 +1,21 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from ..popconparsing import _parse_via_streaming, _parsers_agree, _write_synthetic_file
+
+
+class SyntheticFileTest(TestCase):
+    def test_parsers_agree(self):
+        with TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "by_inst.gz")
+            _write_synthetic_file(filename, count_packages=100)
+
+            entries = _parse_via_streaming(filename)
+            self.assertTrue(_parsers_agree(filename))
+
+        self.assertEqual(len(entries), 100)
+        self.assertEqual(entries["package7"], (14, 7, 7, 7, 0))
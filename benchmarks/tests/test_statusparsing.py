@@ -0,0 +1,38 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+from unittest import TestCase
+
+from ..statusparsing import (
+    _PROJECTION,
+    _inflate,
+    _load_recorded_response,
+    _parse_via_dom,
+    _parse_via_streaming,
+    _parse_via_streaming_projected,
+)
+
+
+class ParsersAgreeTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = _inflate(_load_recorded_response(), copies=2)
+
+    def test_streaming_matches_dom(self):
+        properties_of_issue = _parse_via_dom(self.content)
+
+        self.assertEqual(len(properties_of_issue), 3)
+        self.assertEqual(_parse_via_streaming(self.content), properties_of_issue)
+
+    def test_projection_is_subset_of_dom(self):
+        names_of_interest = {p.value for p in _PROJECTION}
+        expected_properties_of_issue = {
+            issue_id: {
+                name: value for name, value in properties.items() if name in names_of_interest
+            }
+            for issue_id, properties in _parse_via_dom(self.content).items()
+        }
+
+        self.assertEqual(
+            _parse_via_streaming_projected(self.content), expected_properties_of_issue
+        )
@@ -0,0 +1,134 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any
+
+from django.db.models import Model, Q, QuerySet
+
+
+class CursorPage:
+    """
+    A page of keyset (or cursor) pagination, compatible with the parts of
+    ``django.core.paginator.Page`` that templates use for listing the items
+    """
+
+    def __init__(
+        self,
+        object_list: list[Model],
+        start_index: int,
+        next_cursor: str | None,
+        count: int | None = None,
+    ):
+        self.object_list = object_list
+        self._start_index = start_index
+        self.next_cursor = next_cursor
+        self.count = count
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def start_index(self) -> int:
+        return self._start_index
+
+    def end_index(self) -> int:
+        return self._start_index + len(self.object_list) - 1
+
+
+def encode_cursor(key_value: Any, pk: int, start_index: int) -> str:
+    """
+    Produces an opaque token for the position right after the item with
+    the given sort key value and primary key, that starts at ``start_index``
+    """
+    if isinstance(key_value, datetime):
+        key_value = key_value.isoformat()  # i.e. with microseconds, unlike DjangoJSONEncoder
+    payload = json.dumps([key_value, pk, start_index], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Any, int, int]:
+    """
+    Reverses ``encode_cursor``, raises ``ValueError`` for malformed tokens
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key_value, pk, start_index = json.loads(payload)
+    except binascii.Error, UnicodeDecodeError, TypeError:
+        raise ValueError(f"Malformed cursor {cursor!r}") from None
+    if not isinstance(pk, int) or not isinstance(start_index, int) or start_index < 1:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+    return key_value, pk, start_index
+
+
+def paginate_by_cursor(
+    queryset: QuerySet,
+    key: str,
+    descending: bool,
+    nullable: bool,
+    cursor: str,
+    per_page: int,
+    count: int | None = None,
+) -> CursorPage:
+    """
+    Fetches the page after ``cursor`` (or the first page for an empty cursor)
+    of ``queryset`` ordered by ``key`` with the primary key as a tiebreaker,
+    without ``OFFSET``, so that an index on ``(key, pk)`` serves any page alike.
+
+    Rows with a NULL key are ordered the way PostgreSQL does by default,
+    i.e. last when ascending and first when descending, and fetched separately
+    so that both parts of the order remain plain index ranges.
+    """
+    direction_prefix = "-" if descending else ""
+    beyond = "lt" if descending else "gt"
+    ordered = queryset.order_by(direction_prefix + key, direction_prefix + "pk")
+
+    # NOTE: Segments are pairs of (whether the key is NULL, queryset), in order of output
+    if not nullable:
+        segments = [(False, ordered)]
+    else:
+        segments = [
+            (True, ordered.filter(**{f"{key}__isnull": True})),
+            (False, ordered.filter(**{f"{key}__isnull": False})),
+        ]
+        if not descending:
+            segments.reverse()
+
+    if cursor:
+        key_value, pk, start_index = decode_cursor(cursor)
+        while segments and segments[0][0] != (key_value is None):
+            del segments[0]
+        if not segments:
+            raise ValueError(f"Malformed cursor {cursor!r}")
+
+        if key_value is None:
+            after_cursor = Q(**{f"pk__{beyond}": pk})
+        else:
+            # NOTE: The first condition is the one that the index range can start from,
+            #       the second one only skips ties with the last item of the previous page.
+            after_cursor = Q(**{f"{key}__{beyond}e": key_value}) & (
+                Q(**{f"{key}__{beyond}": key_value}) | Q(**{f"pk__{beyond}": pk})
+            )
+        segments[0] = (segments[0][0], segments[0][1].filter(after_cursor))
+    else:
+        start_index = 1
+
+    object_list: list[Model] = []
+    for _, segment in segments:
+        object_list += segment[: per_page + 1 - len(object_list)]
+        if len(object_list) > per_page:
+            break
+
+    if len(object_list) > per_page:
+        del object_list[per_page:]
+        last_item = object_list[-1]
+        next_cursor = encode_cursor(getattr(last_item, key), last_item.pk, start_index + per_page)
+    else:
+        next_cursor = None
+
+    return CursorPage(object_list, start_index, next_cursor, count)
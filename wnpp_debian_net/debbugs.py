@@ -2,17 +2,28 @@
 # Licensed under GNU Affero GPL v3 or later
 
 import base64
+import inspect
+import threading
 import time
-from collections.abc import Callable
+from collections.abc import Callable, Collection, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import timedelta
 from enum import Enum
 from functools import wraps
+from itertools import islice
 from urllib.error import URLError
-from xml.parsers.expat import ExpatError
+from xml.parsers.expat import ExpatError, ParserCreate
 
+import requests
 from django.utils.timezone import now
-from pysimplesoap.client import SoapClient
+from pysimplesoap.client import SoapClient, SoapFault
 from pysimplesoap.simplexml import SimpleXMLElement
+from pysimplesoap.transport import TransportBase
+from requests.adapters import HTTPAdapter
+
+_SOAP_LOCATION = "https://bugs.debian.org/cgi-bin/soap.cgi"
+_PARSE_CHUNK_SIZE = 64 * 1024
+_DEFAULT_TIMEOUT_SECONDS = 60
 
 
 class IssueProperty(Enum):
@@ -62,31 +73,61 @@ class DebbugsRequestError(Exception):
 def _wrap_exceptions(f):
     """
     Turn low-level/internal exceptions to something that is part of the public interface.
+    Generator functions are covered all the way through iteration.
     """
+    exception_classes = (ExpatError, URLError, requests.RequestException)
+
+    if inspect.isgeneratorfunction(f):
+
+        @wraps(f)
+        def wrapped_generator(*args, **wargs):
+            try:
+                return (yield from f(*args, **wargs))
+            except exception_classes as e:
+                raise DebbugsRequestError(e)
+
+        return wrapped_generator
 
     @wraps(f)
     def wrapped(*args, **wargs):
         try:
             return f(*args, **wargs)
-        except (ExpatError, URLError) as e:
+        except exception_classes as e:
             raise DebbugsRequestError(e)
 
     return wrapped
 
 
+def _sleep(seconds: float, stopping: threading.Event | None) -> None:
+    """
+    Sleeps for ``seconds`` or until ``stopping`` (if given) is set, whatever comes first
+    """
+    if stopping is None:
+        time.sleep(seconds)
+    else:
+        stopping.wait(seconds)
+
+
 def _retry(
-    func: Callable, times: int, exception_classes: tuple[Exception], notify: Callable[[str], None]
+    func: Callable,
+    times: int,
+    exception_classes: tuple[Exception],
+    notify: Callable[[str], None],
+    stopping: threading.Event | None = None,
 ) -> Callable:
     """
     Decorates ``func`` with retry for up to ``times`` times with exponential back-off
     while ignoring all exception classes in ``exception_classes``.
     Calls out to ``notify`` for notification targeting humans.
+    Once ``stopping`` (if given) is set, back-off ends early and no further attempts are made.
     """
 
     @wraps(func)
     def wrapped(*args, **kwargs):
         started_at = now()
         for i in range(times):
+            if stopping is not None and stopping.is_set():
+                raise DebbugsRequestError(f"Stopped before attempt {i + 1}")
             try:
                 res = func(*args, **kwargs)
             except exception_classes:
@@ -101,7 +142,7 @@ def _retry(
                     f"{message_prefix} — sleeping for {sleep_duration_seconds} second(s)"
                     f" until {sleep_until} to try up to {times - i - 1} time(s) more"
                 )
-                time.sleep(sleep_duration_seconds)
+                _sleep(sleep_duration_seconds, stopping)
             else:
                 if i > 0:
                     notify(f"Attempt {i + 1} succeeded (after trying for {now() - started_at})")
@@ -111,40 +152,315 @@ def _retry(
 
 
 class DebbugsRetry:
-    def __init__(self, func: Callable, notify: Callable[[str], None]):
+    def __init__(
+        self,
+        func: Callable,
+        notify: Callable[[str], None],
+        stopping: threading.Event | None = None,
+    ):
         self.__func = func
         self.__notify = notify
+        self.__stopping = stopping
 
     def __call__(self, *args, **kwargs):
         func_with_retry = _retry(
-            self.__func, times=8, exception_classes=(DebbugsRequestError,), notify=self.__notify
+            self.__func,
+            times=8,
+            exception_classes=(DebbugsRequestError,),
+            notify=self.__notify,
+            stopping=self.__stopping,
         )
         return func_with_retry(*args, **kwargs)
 
 
+class PooledHttpTransport(TransportBase):
+    """
+    PySimpleSOAP transport that keeps connections alive for re-use across requests
+    (and threads) and that accepts gzip-compressed responses
+    """
+
+    _wrapper_name = "requests"
+    _wrapper_version = f"requests {requests.__version__}"
+
+    def __init__(self, pool_size: int = 1, timeout: float | None = _DEFAULT_TIMEOUT_SECONDS):
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.headers["Accept-Encoding"] = "gzip"
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        self._timeout = timeout
+
+    def request(self, url, method="GET", body=None, headers=None, stream: bool = False):
+        """
+        Returns the headers and the body of the response, the latter either as a whole
+        or, with ``stream``, as an iterator of chunks as they come in
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        response = self._session.request(
+            method, url, data=body, headers=headers, timeout=self._timeout, stream=stream
+        )
+
+        # NOTE: Like with PySimpleSOAP's urllib2 transport, status 500 is not an error
+        #       because SOAP faults come with status 500
+        if response.status_code != 500:
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+
+        # NOTE: Either way with gzip already decoded
+        if stream:
+            return response.headers, self._iterate_chunks(response)
+        return response.headers, response.content
+
+    @staticmethod
+    def _iterate_chunks(response: requests.Response) -> Iterator[bytes]:
+        try:
+            yield from response.iter_content(_PARSE_CHUNK_SIZE)
+        finally:
+            # NOTE: This hands the connection back to the pool if the body has been read
+            #       completely, and discards it otherwise
+            response.close()
+
+    def _count_requests_and_connections(self) -> tuple[int, int]:
+        count_requests = count_connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                count_requests += pool.num_requests
+                count_connections += pool.num_connections
+        return count_requests, count_connections
+
+    @property
+    def count_connections_opened(self) -> int:
+        _, count_connections = self._count_requests_and_connections()
+        return count_connections
+
+    @property
+    def count_connections_reused(self) -> int:
+        count_requests, count_connections = self._count_requests_and_connections()
+        return count_requests - count_connections
+
+
+def _decode_base64(candidate: str) -> str:
+    # Some bugs have base64 encoded titles or contact info
+    # e.g. 842114 (https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=842114)
+    try:
+        return base64.b64decode(candidate.encode("ascii")).decode()
+    except ValueError:  # incl. UnicodeEncodeError, UnicodeDecodeError and binascii.Error
+        return candidate
+
+
+class _StreamingHttpTransport:
+    """
+    View of a ``PooledHttpTransport`` whose responses come as iterators of chunks
+    """
+
+    def __init__(self, transport: PooledHttpTransport):
+        self._transport = transport
+
+    def request(self, url, method="GET", body=None, headers=None):
+        return self._transport.request(url, method, body=body, headers=headers, stream=True)
+
+
+class _SoapClient(SoapClient):
+    """
+    ``SoapClient`` that can hand out raw response bodies
+    (rather than ``SimpleXMLElement`` trees) for streaming parsing
+    """
+
+    _PLACEHOLDER_RESPONSE = b"<Envelope/>"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._raw_response_requested = False
+
+    def send(self, method, xml):
+        if not self._raw_response_requested:
+            return super().send(method, xml)
+
+        http = self.http
+        if isinstance(http, PooledHttpTransport):
+            self.http = _StreamingHttpTransport(http)
+        try:
+            super().send(method, xml)
+        finally:
+            self.http = http
+        # NOTE: This spares SoapClient.call building a DOM tree of the actual response
+        return self._PLACEHOLDER_RESPONSE
+
+    def call_raw(self, method, *args, **kwargs) -> bytes | Iterator[bytes]:
+        """
+        Returns the raw response body, as an iterator of chunks as they come in
+        if the transport is a ``PooledHttpTransport``, or as a whole otherwise
+        """
+        self._raw_response_requested = True
+        try:
+            self.call(method, *args, **kwargs)
+        finally:
+            self._raw_response_requested = False
+        return self.content
+
+
+class _StatusResponseParser:
+    """
+    Streaming (expat-based) parser for ``get_status`` responses
+    that emits pairs of issue ID and issue properties as soon as they are complete,
+    without ever materializing a DOM tree.
+
+    The structure of a response is::
+
+        <soap:Envelope><soap:Body><get_statusResponse>
+          <s-gensym3>  <!-- i.e. the map -->
+            <item><key>ISSUE_ID</key><value><PROPERTY>VALUE</PROPERTY>..</value></item>
+            ..
+          </s-gensym3>
+        </get_statusResponse></soap:Body></soap:Envelope>
+    """
+
+    _MAP_TAG_NAME = "s-gensym3"
+    _FAULT_TAG_NAMES = ("faultcode", "faultstring")
+    _BASE64_TYPE_SUFFIX = ":base64Binary"
+
+    def __init__(self, wanted_tag_names: Collection[str] | None = None):
+        self._wanted_tag_names = wanted_tag_names
+        self._parser = ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._on_start_element
+        self._parser.EndElementHandler = self._on_end_element
+        self._parser.CharacterDataHandler = self._on_character_data
+
+        self._depth = 0
+        self._map_depth: int | None = None
+        self._issue_id: int | None = None
+        self._issue_properties: dict[str, str | None] = {}
+        self._text_parts: list[str] | None = None
+        self._property_wanted = False
+        self._property_is_base64 = False
+        self._property_has_child_element = False
+        self._fault: dict[str, str] = {}
+        self._completed_issues: list[tuple[int, dict[str, str | None]]] = []
+
+    def _on_start_element(self, tag_name: str, attributes: dict[str, str]) -> None:
+        self._depth += 1
+
+        if self._map_depth is None:
+            if tag_name == self._MAP_TAG_NAME:
+                self._map_depth = self._depth
+            elif tag_name in self._FAULT_TAG_NAMES:
+                self._text_parts = []
+            return
+
+        relative_depth = self._depth - self._map_depth
+        if relative_depth == 1:  # i.e. <item>
+            self._issue_id = None
+            self._issue_properties = {}
+        elif relative_depth == 2 and tag_name == "key":
+            self._text_parts = []
+        elif relative_depth == 3:  # i.e. property element inside <value>
+            self._property_wanted = (
+                self._wanted_tag_names is None or tag_name in self._wanted_tag_names
+            )
+            if not self._property_wanted:
+                return  # i.e. without collecting any text
+            self._text_parts = []
+            self._property_is_base64 = attributes.get("xsi:type", "").endswith(
+                self._BASE64_TYPE_SUFFIX
+            )
+            self._property_has_child_element = False
+        elif relative_depth == 4:  # i.e. child element of a property, e.g. of an array
+            if self._property_wanted and not self._text_parts:
+                # NOTE: Like with ``node.firstChild.nodeValue`` before, the value
+                #       of properties starting with a child element is ``None``
+                self._property_has_child_element = True
+            self._text_parts = None
+
+    def _on_end_element(self, tag_name: str) -> None:
+        relative_depth = None if self._map_depth is None else self._depth - self._map_depth
+        self._depth -= 1
+
+        if relative_depth is None:
+            if tag_name in self._FAULT_TAG_NAMES and self._text_parts is not None:
+                self._fault[tag_name] = "".join(self._text_parts)
+                self._text_parts = None
+        elif relative_depth == 0:  # i.e. </s-gensym3>
+            self._map_depth = None
+        elif relative_depth == 1:  # i.e. </item>
+            if self._issue_id is not None:
+                self._completed_issues.append((self._issue_id, self._issue_properties))
+        elif relative_depth == 2 and tag_name == "key":
+            key = "".join(self._text_parts)
+            try:
+                self._issue_id = int(key)
+            except ValueError:
+                raise DebbugsRequestError(f"Malformed issue ID {key!r} in response")
+            self._text_parts = None
+        elif relative_depth == 3:
+            if not self._property_wanted:
+                return
+            if self._text_parts:
+                value = "".join(self._text_parts)
+                if self._property_is_base64:
+                    value = _decode_base64(value)
+                self._issue_properties[tag_name] = value
+            elif self._property_has_child_element:
+                self._issue_properties[tag_name] = None
+            self._text_parts = None
+
+    def _on_character_data(self, text: str) -> None:
+        if self._text_parts is not None:
+            self._text_parts.append(text)
+
+    def feed(self, data: bytes, final: bool = False) -> list[tuple[int, dict[str, str | None]]]:
+        """
+        Parses the next chunk of the response and returns all issues completed by it.
+        Raises ``SoapFault`` if the (final) response turns out to be a SOAP fault
+        and ``DebbugsRequestError`` for issue IDs that are not numbers.
+        """
+        self._parser.Parse(data, final)
+
+        if final and self._fault:
+            raise SoapFault(self._fault.get("faultcode"), self._fault.get("faultstring"))
+
+        completed_issues, self._completed_issues = self._completed_issues, []
+        return completed_issues
+
+
 class DebbugsWnppClient:
-    def __init__(self):
-        self._client = None
+    def __init__(self, transport: TransportBase | None = None, location: str | None = None):
+        """
+        Uses PySimpleSOAP's default transport unless a ``transport`` is given,
+        e.g. a ``PooledHttpTransport`` that would then be shared among all threads.
+        Talks to Debbugs at bugs.debian.org unless another SOAP ``location`` is given.
+        """
+        self.transport = transport
+        self._location = location
+        self._thread_local = threading.local()
 
     def connect(self):
-        self._client = SoapClient(location="https://bugs.debian.org/cgi-bin/soap.cgi")
+        soap_client = _SoapClient(location=self._location or _SOAP_LOCATION)
+        if self.transport is not None:
+            soap_client.http = self.transport
+        self._thread_local.soap_client = soap_client
+
+    @property
+    def _client(self) -> _SoapClient:
+        # NOTE: SoapClient keeps state of the latest request (e.g. in ``.response``)
+        #       so every thread needs a SoapClient instance of its own
+        try:
+            return self._thread_local.soap_client
+        except AttributeError:
+            self.connect()
+            return self._thread_local.soap_client
 
     @staticmethod
     def _to_soap_kwargs(*iter):
         return {f"arg{i}": v for i, v in enumerate(iter)}
 
-    @staticmethod
-    def _decode_base64_as_needed(candidate: str | None) -> str | None:
-        # Some bugs have base64 encoded titles or contact info
-        # e.g. 842114 (https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=842114)
-        if candidate is None:
-            return None
-
-        try:
-            return base64.decodebytes(candidate.encode("ascii")).decode()
-        except ValueError, UnicodeEncodeError:
-            return candidate
-
     @_wrap_exceptions
     def fetch_ids_of_issues_with_status(self, status: IssueStatus) -> list[int]:
         result: SimpleXMLElement = self._client.get_bugs(
@@ -155,24 +471,115 @@ class DebbugsWnppClient:
             for item_element in result._element.getElementsByTagName("item")
         ]
 
-    @_wrap_exceptions
-    def fetch_issues(self, issue_ids: list[int]) -> dict[int, dict[str, str]]:
-        properties_of_issue: dict[int, dict[str, str]] = {}
-
-        soap_result: SimpleXMLElement = self._client.get_status(**self._to_soap_kwargs(*issue_ids))
-
-        map_element = soap_result._element.getElementsByTagName("s-gensym3")[0]
-        for item_element in map_element.childNodes:
-            key_element = item_element.childNodes[0]
-            value_element = item_element.childNodes[1]
-
-            issue_id = int(key_element.firstChild.nodeValue)
-            issue_properties = {
-                node.tagName: self._decode_base64_as_needed(node.firstChild.nodeValue)
-                for node in value_element.childNodes
-                if node.firstChild is not None
-            }
-
-            properties_of_issue[issue_id] = issue_properties
+    @staticmethod
+    def iterate_issues_in_status_response(
+        content: bytes | Iterable[bytes], properties: Collection[IssueProperty] | None = None
+    ) -> Iterator[tuple[int, dict[str, str | None]]]:
+        """
+        Parses the raw body of a ``get_status`` response incrementally,
+        given as a whole or as chunks as they come in,
+        yielding pairs of issue ID and issue properties.
+        Only ``properties`` (if given) are extracted, all others are skipped.
+        Values are only base64-decoded where their ``xsi:type`` says base64.
+        """
+        parser = _StatusResponseParser(
+            wanted_tag_names=None if properties is None else {p.value for p in properties}
+        )
+        chunks = content
+        if isinstance(content, bytes):
+            chunks = (
+                content[offset : offset + _PARSE_CHUNK_SIZE]
+                for offset in range(0, len(content), _PARSE_CHUNK_SIZE)
+            )
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.feed(b"", final=True)
 
-        return properties_of_issue
+    @_wrap_exceptions
+    def fetch_issues(
+        self, issue_ids: list[int], properties: Collection[IssueProperty] | None = None
+    ) -> Iterator[tuple[int, dict[str, str]]]:
+        """
+        Yields pairs of issue ID and issue properties while the response is still coming in
+        (with a ``PooledHttpTransport``, see ``_SoapClient.call_raw``)
+        """
+        content = self._client.call_raw("get_status", **self._to_soap_kwargs(*issue_ids))
+        yield from self.iterate_issues_in_status_response(content, properties)
+
+    def fetch_issues_concurrently(
+        self,
+        issue_id_batches: Iterable[list[int]],
+        max_requests_in_flight: int,
+        notify: Callable[[str], None],
+        report_batch: Callable[[list[int], float, int], None] | None = None,
+        properties: Collection[IssueProperty] | None = None,
+        stopping: threading.Event | None = None,
+    ) -> Iterator[tuple[list[int], dict[int, dict[str, str]]]]:
+        """
+        Fetches batches of issues with up to ``max_requests_in_flight`` requests in flight,
+        each batch with retry of its own (see ``DebbugsRetry``).
+        Yields pairs of issue IDs and their properties in order of completion
+        rather than in order of submission.
+        Calls ``report_batch`` (if given) with the issue IDs, the duration in seconds
+        of the successful attempt and the number of attempts, for each batch
+        right before yielding it.
+        Only ``properties`` (if given) are fetched, see ``fetch_issues``.
+        Once ``stopping`` (if given) is set, e.g. by a consumer on another thread
+        that cannot close this generator while it is waiting for requests,
+        no further attempts are made, see ``DebbugsRetry``.
+        """
+
+        def fetch_issues_with_retry(issue_ids: list[int]):
+            count_attempts = 0
+            seconds_taken = 0.0
+
+            def fetch_issues_measured(issue_ids: list[int]):
+                nonlocal count_attempts, seconds_taken
+                count_attempts += 1
+                started = time.monotonic()
+                try:
+                    # NOTE: Any error is to happen in here, for retry
+                    return dict(self.fetch_issues(issue_ids, properties))
+                finally:
+                    seconds_taken = time.monotonic() - started
+
+            properties_of_issue = DebbugsRetry(
+                fetch_issues_measured, notify=notify, stopping=stopping
+            )(issue_ids)
+            return properties_of_issue, seconds_taken, count_attempts
+
+        issue_id_batches = iter(issue_id_batches)
+        issue_ids_of_future: dict[Future, list[int]] = {}
+        if stopping is None:
+            stopping = threading.Event()
+
+        executor = ThreadPoolExecutor(
+            max_workers=max_requests_in_flight, thread_name_prefix="debbugs"
+        )
+        try:
+            while True:
+                for issue_ids in islice(
+                    issue_id_batches, max_requests_in_flight - len(issue_ids_of_future)
+                ):
+                    future = executor.submit(fetch_issues_with_retry, issue_ids)
+                    issue_ids_of_future[future] = issue_ids
+
+                if not issue_ids_of_future:
+                    break
+
+                done, _ = wait(issue_ids_of_future, return_when=FIRST_COMPLETED)
+                for future in done:
+                    issue_ids = issue_ids_of_future.pop(future)
+                    properties_of_issue, seconds_taken, count_attempts = future.result()
+                    if report_batch is not None:
+                        report_batch(issue_ids, seconds_taken, count_attempts)
+                    yield issue_ids, properties_of_issue
+        except BaseException:
+            # NOTE: Requests that are already running cannot be cancelled, but their retries
+            #       (incl. back-off) can, so that the threads of the executor, that the
+            #       interpreter joins at exit, end with their current attempt, at the latest.
+            stopping.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            executor.shutdown()
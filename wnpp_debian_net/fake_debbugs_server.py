@@ -0,0 +1,187 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import base64
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+_FIRST_IDENT = 100_000
+_EPOCH_SECONDS = 1_600_000_000  # arbitrary
+_KINDS = ("ITP", "RFP", "O", "RFA", "ITA", "RFH")
+
+_ENVELOPE_START = (
+    b'<?xml version="1.0" encoding="UTF-8"?><soap:Envelope'
+    b' soap:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"'
+    b' xmlns:apachens="http://xml.apache.org/xml-soap"'
+    b' xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"'
+    b' xmlns:soapenc="http://schemas.xmlsoap.org/soap/encoding/"'
+    b' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soap:Body>'
+)
+_ENVELOPE_END = b"</soap:Body></soap:Envelope>"
+
+
+class _FakeDebbugsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # for keep-alive
+
+    def _respond(self, status: HTTPStatus, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request_body = self.rfile.read(int(self.headers["Content-Length"]))
+        fake: FakeDebbugsServer = self.server.fake
+        fake.count_request()
+
+        if fake.latency_seconds:
+            time.sleep(fake.latency_seconds)
+
+        soap_body = ET.fromstring(request_body).find(
+            "{http://schemas.xmlsoap.org/soap/envelope/}Body"
+        )
+        method_element = soap_body[0]
+        method_name = method_element.tag.rsplit("}", 1)[-1]
+        args = [arg.text for arg in method_element]
+
+        if method_name == "get_bugs":
+            response_body = fake.render_get_bugs_response(status=args[args.index("status") + 1])
+        elif method_name == "get_status":
+            response_body = fake.render_get_status_response([int(arg) for arg in args])
+        else:
+            self._respond(HTTPStatus.NOT_FOUND, b"")
+            return
+
+        error = fake.pick_error()
+        if error == "status":
+            self._respond(HTTPStatus.SERVICE_UNAVAILABLE, b"")
+        elif error == "truncation":
+            self._respond(HTTPStatus.OK, response_body[: len(response_body) // 2])
+        else:
+            self._respond(HTTPStatus.OK, response_body)
+
+    def log_message(self, *args): ...
+
+
+class FakeDebbugsServer:
+    """
+    Local stand-in for Debbugs' SOAP service (on localhost, served from a thread)
+    that answers ``get_bugs`` and ``get_status`` for a generated corpus of ``count_issues``
+    WNPP issues, for benchmarks and tests of whole import runs without network access.
+
+    Every request is delayed by ``latency_seconds``, and a share of ``error_rate``
+    of all responses is either an HTTP error or truncated XML.
+    """
+
+    def __init__(
+        self,
+        count_issues: int,
+        latency_seconds: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.count_issues = count_issues
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.count_requests = 0
+        self.count_errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()  # i.e. for the counters and the random generator
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def issue_ids(self) -> range:
+        return range(_FIRST_IDENT, _FIRST_IDENT + self.count_issues)
+
+    @property
+    def location(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/cgi-bin/soap.cgi"
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeDebbugsRequestHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *_exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.count_requests += 1
+
+    def pick_error(self) -> str | None:
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return None
+            self.count_errors += 1
+            return self._random.choice(("status", "truncation"))
+
+    @staticmethod
+    def is_forwarded(ident: int) -> bool:
+        return ident % 10 == 0
+
+    @staticmethod
+    def properties_of(ident: int) -> dict[str, str]:
+        kind = _KINDS[ident % len(_KINDS)]
+        return {
+            "date": str(_EPOCH_SECONDS + ident),
+            "last_modified": str(_EPOCH_SECONDS + 2 * ident),
+            "mergedwith": str(ident - 1) if ident % 50 == 0 else "",
+            "originator": f"Originator {ident} <originator{ident}@example.org>",
+            "owner": f"owner{ident}@example.org" if kind in ("ITP", "ITA") else "",
+            "package": "wnpp",
+            "severity": "wishlist",
+            "subject": f"{kind}: package{ident} -- Synthetic package number {ident} — “fake”",
+        }
+
+    def render_get_bugs_response(self, status: str) -> bytes:
+        forwarded = status == "forwarded"
+        items = "".join(
+            f'<item xsi:type="xsd:int">{ident}</item>'
+            for ident in self.issue_ids
+            if self.is_forwarded(ident) == forwarded
+        )
+        return (
+            _ENVELOPE_START
+            + b'<get_bugsResponse xmlns="None"><soapenc:Array xsi:type="soapenc:Array">'
+            + items.encode()
+            + b"</soapenc:Array></get_bugsResponse>"
+            + _ENVELOPE_END
+        )
+
+    def _render_value(self, name: str, value: str) -> str:
+        if not value:
+            return f'<{name} xsi:type="xsd:string" />'
+        if value.isascii():
+            return f'<{name} xsi:type="xsd:string">{escape(value)}</{name}>'
+        encoded = base64.b64encode(value.encode()).decode()  # like Debbugs does for non-ASCII
+        return f'<{name} xsi:type="xsd:base64Binary">{encoded}</{name}>'
+
+    def render_get_status_response(self, issue_ids: list[int]) -> bytes:
+        items = "".join(
+            f'<item><key xsi:type="xsd:int">{ident}</key><value>'
+            + "".join(
+                self._render_value(name, value)
+                for name, value in self.properties_of(ident).items()
+            )
+            + "</value></item>"
+            for ident in issue_ids
+            if ident in self.issue_ids
+        )
+        return (
+            _ENVELOPE_START
+            + b'<get_statusResponse xmlns="None"><s-gensym3 xsi:type="apachens:Map">'
+            + items.encode()
+            + b"</s-gensym3></get_statusResponse>"
+            + _ENVELOPE_END
+        )
@@ -0,0 +1,127 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import datetime
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from collections.abc import Iterable
+
+
+class Phase:
+    CLOSE = "close"
+    ADD = "add"
+    STALE = "stale"
+    UPSERT = "upsert"
+
+
+class Checkpoint:
+    """
+    Progress of a run, persisted to a file after every committed batch,
+    so that a run that got interrupted (e.g. killed by cron) can be continued
+    by the next run rather than redone from scratch.
+
+    Progress within a phase is the highest issue ID up to which all issues
+    (in ascending order) have been committed; since batches are committed
+    in order of completion, that can lag behind the latest batch a bit.
+    """
+
+    PHASES_OF_MODE = {
+        "regular": (Phase.CLOSE, Phase.ADD, Phase.STALE),
+        "quick": (Phase.CLOSE, Phase.ADD),
+        "upsert": (Phase.CLOSE, Phase.UPSERT),
+    }
+
+    def __init__(self, filename: str, mode: str):
+        self._filename = filename
+        self._phases = self.PHASES_OF_MODE[mode]
+        self._mode = mode
+        self._ids_digest = self._digest([])
+        self.phase = self._phases[0]
+        self.last_ident: int | None = None
+        self._uncommitted_ids: deque[int] = deque()
+        self._committed_ids: set[int] = set()
+
+    @staticmethod
+    def _digest(issue_ids: Iterable[int]) -> str:
+        return hashlib.sha256(",".join(str(i) for i in sorted(issue_ids)).encode()).hexdigest()
+
+    def load(self, ids_of_remote_open_issues: Iterable[int], max_age: datetime.timedelta) -> bool:
+        """
+        Restores the progress of an interrupted run, provided that it is recent enough
+        and that it was working on the very same set of remote open issues
+        (as fetched anew by the caller) because otherwise, progress is meaningless.
+        """
+        try:
+            with open(self._filename) as f:
+                doc = json.load(f)
+            if doc["mode"] != self._mode or doc["phase"] not in self._phases:
+                return False
+            if time.time() - float(doc["saved_at"]) > max_age.total_seconds():
+                return False
+            if doc["digest"] != self._digest(ids_of_remote_open_issues):
+                return False
+            last_ident = None if doc["last_ident"] is None else int(doc["last_ident"])
+        except OSError, ValueError, KeyError, TypeError:
+            return False
+
+        self._ids_digest = doc["digest"]
+        self.phase = doc["phase"]
+        self.last_ident = last_ident
+        return True
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self._filename), exist_ok=True)
+        temp_filename = f"{self._filename}.tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(
+                {
+                    "mode": self._mode,
+                    "saved_at": time.time(),
+                    "digest": self._ids_digest,
+                    "phase": self.phase,
+                    "last_ident": self.last_ident,
+                },
+                f,
+            )
+        os.replace(temp_filename, self._filename)  # i.e. atomically
+
+    def start(self, ids_of_remote_open_issues: Iterable[int]) -> None:
+        self._ids_digest = self._digest(ids_of_remote_open_issues)
+        self.phase = self._phases[0]
+        self.last_ident = None
+        self._save()
+
+    def has_completed(self, phase: str) -> bool:
+        return self._phases.index(phase) < self._phases.index(self.phase)
+
+    def begin(self, phase: str, issue_ids: Iterable[int] = ()) -> list[int]:
+        """
+        Enters ``phase`` and returns those of ``issue_ids`` (in ascending order)
+        that have not been committed in that phase before
+        """
+        issue_ids = list(issue_ids)
+        if phase == self.phase and self.last_ident is not None:
+            issue_ids = [i for i in issue_ids if i > self.last_ident]
+        else:
+            self.phase = phase
+            self.last_ident = None
+        self._uncommitted_ids = deque(issue_ids)
+        self._committed_ids = set()
+        self._save()
+        return issue_ids
+
+    def commit(self, issue_ids: list[int]) -> None:
+        self._committed_ids.update(issue_ids)
+        while self._uncommitted_ids and self._uncommitted_ids[0] in self._committed_ids:
+            self.last_ident = self._uncommitted_ids.popleft()
+            self._committed_ids.discard(self.last_ident)
+        self._save()
+
+    def clear(self) -> None:
+        try:
+            os.remove(self._filename)
+        except FileNotFoundError:
+            pass
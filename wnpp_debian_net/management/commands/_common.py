@@ -1,6 +1,16 @@
 # Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
 # Licensed under GNU Affero GPL v3 or later
 
+import datetime
+import io
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from django.db import DatabaseError, connection
+
+SYNC_ADVISORY_LOCK_KEY = 0x776E7070  # i.e. "wnpp" in ASCII
+
 
 class ReportingMixin:
     def _error(self, text: str) -> None:
@@ -11,3 +21,83 @@ class ReportingMixin:
 
     def _success(self, text: str) -> None:
         self.stdout.write(self.style.SUCCESS(text))
+
+
+@contextmanager
+def sync_advisory_lock() -> Iterator[bool]:
+    """
+    Takes PostgreSQL advisory lock ``SYNC_ADVISORY_LOCK_KEY`` if available,
+    to protect against concurrent syncs (e.g. by another instance during a deployment).
+    The lock is held by the database session, so taking it again from within
+    (e.g. an import run by syncd) succeeds.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+        (locked,) = cursor.fetchone()
+    try:
+        yield locked
+    finally:
+        if locked:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+            except DatabaseError:
+                pass  # i.e. the lock went away with the connection already
+
+
+def _to_copy_text(value: Any) -> str:
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows_into(
+    cursor, table_name: str, column_names: Sequence[str], rows: Iterable[Sequence[Any]]
+) -> None:
+    """
+    Loads ``rows`` into table ``table_name`` using PostgreSQL's ``COPY ... FROM STDIN``
+    (in text format), which is a lot cheaper than ``INSERT`` for many rows
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_to_copy_text(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    cursor.copy_expert(f"COPY {table_name} ({', '.join(column_names)}) FROM STDIN", buffer)
+
+
+def sync_popcon_copies(cursor, issue_ids: Iterable[int] | None = None) -> int:
+    """
+    Brings the copies of popcon stats in ``debian_wnpp`` (columns ``popcon_inst``
+    and ``popcon_vote``) up to date with ``debian_popcon``, for issues ``issue_ids``
+    or all issues, and returns the number of issues updated
+    """
+    if issue_ids is None:
+        scope, params = "", []
+    else:
+        scope, params = "WHERE w.ident = ANY(%s)", [list(issue_ids)]
+    cursor.execute(
+        f"""
+        UPDATE debian_wnpp AS target SET popcon_inst = source.inst, popcon_vote = source.vote
+        FROM (
+            SELECT w.ident, COALESCE(p.inst, 0) AS inst, COALESCE(p.vote, 0) AS vote
+            FROM debian_wnpp w LEFT JOIN debian_popcon p ON p.package = w.project
+            {scope}
+        ) AS source
+        WHERE target.ident = source.ident
+            AND (target.popcon_inst, target.popcon_vote) IS DISTINCT FROM (source.inst, source.vote)
+        """,
+        params,
+    )
+    return cursor.rowcount
@@ -0,0 +1,161 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import json
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
+from typing import Any
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size for ``get_status`` requests that grows while requests complete
+    well within ``target_seconds`` and shrinks when they do not or had to be retried
+    (e.g. due to timeouts or truncated XML).
+    The last size that worked well is persisted to a file, for the next run to start with.
+    """
+
+    DEFAULT = 100
+    MINIMUM = 10
+    MAXIMUM = 1000
+    TARGET_SECONDS = 10.0
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self.size = self._load()
+        self._last_good_size = self.size
+
+    def _load(self) -> int:
+        try:
+            with open(self._filename) as f:
+                size = int(json.load(f)["batch_size"])
+        except OSError, ValueError, KeyError, TypeError:
+            return self.DEFAULT
+        return min(max(size, self.MINIMUM), self.MAXIMUM)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self._filename), exist_ok=True)
+        # NOTE: The file is shared by the worker processes of shards, hence the process ID
+        temp_filename = f"{self._filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "w") as f:
+            json.dump({"batch_size": self._last_good_size}, f)
+        os.replace(temp_filename, self._filename)  # i.e. atomically
+
+    def adjust(self, batch_size: int, seconds_taken: float, count_attempts: int) -> None:
+        if count_attempts > 1:
+            self.size = max(self.MINIMUM, min(self.size, batch_size) // 2)
+            return
+
+        if seconds_taken > self.TARGET_SECONDS:
+            self.size = max(self.MINIMUM, int(batch_size * self.TARGET_SECONDS / seconds_taken))
+            return
+
+        self._last_good_size = batch_size
+        if batch_size >= self.size:  # i.e. not a leftover batch that was small by nature
+            self.size = min(self.MAXIMUM, self.size + max(1, self.size // 4))
+
+
+class Prefetcher:
+    """
+    Drives iterator ``source`` (i.e. the fetching stage of a pipeline)
+    from a thread of its own, up to ``max_prefetched`` items ahead
+    of the consuming thread (i.e. the writing stage).
+    ``source`` can have functions run on the consuming thread using ``run_in_consumer``
+    (e.g. for queries, since database connections are not to be shared across threads).
+    Event ``stopping`` (if given) is set when the consuming thread is done,
+    for ``source`` to stop early, e.g. rather than wait for retries.
+    """
+
+    _CALL = object()
+    _END = object()
+
+    def __init__(
+        self, source: Iterator, max_prefetched: int, stopping: threading.Event | None = None
+    ):
+        self._source = source
+        self._queue: queue.Queue = queue.Queue(maxsize=max_prefetched)
+        self._stopping = threading.Event() if stopping is None else stopping
+        self._thread = threading.Thread(target=self._produce, name="prefetcher", daemon=True)
+        self.seconds_producing = 0.0
+        self.seconds_waiting = 0.0
+
+    def _put(self, entry) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                try:
+                    item = next(self._source)
+                except StopIteration:
+                    self._put((self._END, None))
+                    return
+                finally:
+                    self.seconds_producing += time.monotonic() - started
+                self._put((item, None))
+        except BaseException as e:
+            self._put((self._END, e))
+        finally:
+            close = getattr(self._source, "close", None)  # i.e. generators only
+            if close is not None:
+                close()
+
+    def run_in_consumer(self, func: Callable[[], Any]) -> Any:
+        """
+        Has the consuming thread run ``func`` once it is done with the items before,
+        and returns the result; for use by ``source`` only
+        """
+        future: Future = Future()
+        self._put((self._CALL, (func, future)))
+        while not self._stopping.is_set():
+            try:
+                return future.result(timeout=0.1)
+            except TimeoutError:
+                continue
+        future.cancel()
+        return future.result()  # i.e. raises CancelledError unless ``func`` completed
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, _exc_value, _traceback):
+        self._stopping.set()
+        if exc_type is None:
+            self._thread.join()
+        # NOTE: Otherwise (e.g. for KeyboardInterrupt) we do not wait for requests in flight
+        #       that the fetching stage may be blocked on; with ``stopping`` shared with it,
+        #       it will stop once they are done, without any further retries.
+
+    def __iter__(self):
+        while True:
+            started = time.monotonic()
+            item, details = self._queue.get()
+            self.seconds_waiting += time.monotonic() - started
+
+            if item is self._CALL:
+                func, future = details
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func())
+                    except BaseException as e:
+                        future.set_exception(e)
+                        raise
+                continue
+
+            if item is self._END:
+                if details is not None:  # i.e. an error
+                    raise details
+                return
+
+            yield item
@@ -0,0 +1,64 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections.abc import Iterable
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management import CommandError
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """
+    Parses e.g. ``"2/4"`` into ``(2, 4)``, i.e. the third of four shards
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Malformed shard {text!r}, expected e.g. 0/4")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard {text!r} is out of range")
+    return index, count
+
+
+def run_shard_workers(
+    ids_of_remote_open_issues: Iterable[int], count_shards: int, arguments: list[str]
+) -> None:
+    """
+    Runs ``importdebbugs --shard=K/N`` (with extra ``arguments``) in ``count_shards``
+    worker processes, hands ``ids_of_remote_open_issues`` over to them
+    and waits for all of them to finish
+    """
+    with TemporaryDirectory() as tempdir:
+        ids_filename = os.path.join(tempdir, "ids_of_remote_open_issues.json")
+        with open(ids_filename, "w") as f:
+            json.dump(sorted(ids_of_remote_open_issues), f)
+
+        workers: list[subprocess.Popen] = []
+        try:
+            for index in range(count_shards):
+                argv = [
+                    sys.executable,
+                    str(settings.BASE_DIR / "manage.py"),
+                    "importdebbugs",
+                    f"--shard={index}/{count_shards}",
+                    f"--ids-from={ids_filename}",
+                    *arguments,
+                ]
+                workers.append(subprocess.Popen(argv))
+            returncodes = [worker.wait() for worker in workers]
+        except BaseException:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+            raise
+
+    failed_shards = [f"{i}/{count_shards}" for i, code in enumerate(returncodes) if code != 0]
+    if failed_shards:
+        raise CommandError(f"Worker process(es) of shard(s) {', '.join(failed_shards)} failed.")
@@ -0,0 +1,345 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+"""
+Raw SQL of importdebbugs, for writing whole batches of issues with a single statement per table
+"""
+
+import datetime
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from ...models import EventKind
+from ...popcon import POPCON_FIELD_NAMES
+from ._common import copy_rows_into
+
+WNPP_COLUMNS_OF_DATABASE_KEY = {
+    "ident": "ident",
+    "open_person": "open_person",
+    "open_stamp": "open_stamp",
+    "mod_stamp": "mod_stamp",
+    "kind": "type",
+    "popcon_id": "project",
+    "description": "description",
+    "charge_person": "charge_person",
+    "cron_stamp": "cron_stamp",
+    "has_smaller_sibling": "has_smaller_sibling",
+    "remote_hash": "remote_hash",
+    "next_refresh_at": "next_refresh_at",
+}
+
+# i.e. ident, kind, project, description, event, event_stamp
+LogEntry = tuple[int, str, str, str, EventKind, datetime.datetime]
+
+
+def close_all_issues_but(
+    cursor, ids_of_open_issues: Iterable[int], now: datetime.datetime
+) -> list[int]:
+    """
+    Logs closing of and deletes all issues but ``ids_of_open_issues``,
+    and returns the IDs of the issues closed
+    """
+    # NOTE: The IDs of all open issues (10k+) are sent to PostgreSQL once, as an array,
+    #       and detection, logging and deletion of closed issues are a single statement.
+    cursor.execute(
+        """
+        WITH closed AS (
+            DELETE FROM debian_wnpp
+            WHERE ident <> ALL(%(ids_of_open_issues)s::int[])
+            RETURNING ident, type, project, description
+        )
+        INSERT INTO debian_log_index
+            (ident, type, project, description, log_stamp, event, event_stamp)
+        SELECT ident, type, project, description, %(now)s, %(event)s, %(now)s
+        FROM closed
+        RETURNING ident
+        """,
+        {
+            "ids_of_open_issues": sorted(ids_of_open_issues),
+            "now": now,
+            "event": EventKind.CLOSED.value,
+        },
+    )
+    return sorted(ident for (ident,) in cursor.fetchall())
+
+
+def select_ids_of_issues_to_upsert(
+    cursor, ids_of_remote_open_issues: Iterable[int], now: datetime.datetime
+) -> list[int]:
+    """
+    Returns those of ``ids_of_remote_open_issues`` that are either not known locally
+    or due for a refresh, in ascending order
+    """
+    cursor.execute(
+        """
+        SELECT remote.ident
+        FROM unnest(%(ids_of_remote_open_issues)s::int[]) AS remote (ident)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM debian_wnpp AS local
+            WHERE local.ident = remote.ident AND local.next_refresh_at > %(now)s
+        )
+        ORDER BY remote.ident
+        """,
+        {
+            "ids_of_remote_open_issues": sorted(ids_of_remote_open_issues),
+            "now": now,
+        },
+    )
+    return [ident for (ident,) in cursor.fetchall()]
+
+
+def touch_issues(
+    cursor,
+    issue_ids: list[int],
+    next_refresh_ats: list[datetime.datetime],
+    now: datetime.datetime,
+) -> None:
+    """
+    Bumps the cron_stamp of issues ``issue_ids`` and reschedules their next refresh
+    """
+    cursor.execute(
+        """
+        UPDATE debian_wnpp AS w
+        SET cron_stamp = %(now)s, next_refresh_at = touched.next_refresh_at
+        FROM unnest(
+            %(issue_ids)s::int[], %(next_refresh_ats)s::timestamptz[]
+        ) AS touched (ident, next_refresh_at)
+        WHERE w.ident = touched.ident
+        """,
+        {
+            "now": now,
+            "issue_ids": issue_ids,
+            "next_refresh_ats": next_refresh_ats,
+        },
+    )
+
+
+def insert_missing_popcons(cursor, popcon_rows: Sequence[Sequence[str | int | None]]) -> None:
+    """
+    Inserts those of ``popcon_rows`` (i.e. package name and ``POPCON_FIELD_NAMES``)
+    whose packages are not known yet
+    """
+    cursor.execute(
+        """
+        INSERT INTO debian_popcon (package, inst, vote, old, recent, nofiles)
+        SELECT * FROM unnest(
+            %(package)s::varchar[],
+            %(inst)s::int[],
+            %(vote)s::int[],
+            %(old)s::int[],
+            %(recent)s::int[],
+            %(nofiles)s::int[]
+        )
+        ON CONFLICT (package) DO NOTHING
+        """,
+        {
+            column_name: [popcon_row[i] for popcon_row in popcon_rows]
+            for i, column_name in enumerate(("package",) + POPCON_FIELD_NAMES)
+        },
+    )
+
+
+def upsert_issues(
+    cursor,
+    rows: list[dict[str, Any]],
+    issue_ids: list[int],
+    now: datetime.datetime,
+    minimum_refresh_interval: datetime.timedelta,
+) -> list[tuple]:
+    """
+    Inserts or updates those issues of ``rows`` that actually differ from what is known locally,
+    and returns them with their previous kind (if any) and whether they were inserted.
+    All other issues of ``issue_ids`` (i.e. unchanged or with a malformed subject)
+    only get their cron_stamp bumped and their next refresh rescheduled.
+    """
+    # NOTE: Sub-statements all see the same snapshot, so "previous" still holds
+    #       the kinds from before the upsert.
+    cursor.execute(
+        """
+        WITH incoming AS (
+            SELECT * FROM unnest(
+                %(ident)s::int[],
+                %(open_person)s::varchar[],
+                %(open_stamp)s::timestamptz[],
+                %(mod_stamp)s::timestamptz[],
+                %(kind)s::varchar[],
+                %(project)s::varchar[],
+                %(description)s::varchar[],
+                %(charge_person)s::varchar[],
+                %(has_smaller_sibling)s::boolean[],
+                %(remote_hash)s::varchar[],
+                %(remote_change_interval)s::interval[],
+                %(next_refresh_at)s::timestamptz[]
+            ) AS t (
+                ident, open_person, open_stamp, mod_stamp, type, project, description,
+                charge_person, has_smaller_sibling, remote_hash, remote_change_interval,
+                next_refresh_at
+            )
+        ), previous AS (
+            SELECT ident, type FROM debian_wnpp WHERE ident = ANY(%(issue_ids)s::int[])
+        ), upserted AS (
+            INSERT INTO debian_wnpp AS w (
+                ident, open_person, open_stamp, mod_stamp, type, project, description,
+                charge_person, has_smaller_sibling, remote_hash, remote_change_interval,
+                next_refresh_at, cron_stamp
+            )
+            SELECT
+                ident, open_person, open_stamp, mod_stamp, type, project, description,
+                charge_person, has_smaller_sibling, remote_hash, remote_change_interval,
+                next_refresh_at, %(now)s
+            FROM incoming
+            ON CONFLICT (ident) DO UPDATE SET
+                open_person = EXCLUDED.open_person,
+                open_stamp = EXCLUDED.open_stamp,
+                mod_stamp = EXCLUDED.mod_stamp,
+                type = EXCLUDED.type,
+                project = EXCLUDED.project,
+                description = EXCLUDED.description,
+                charge_person = EXCLUDED.charge_person,
+                has_smaller_sibling = EXCLUDED.has_smaller_sibling,
+                remote_hash = EXCLUDED.remote_hash,
+                remote_change_interval = EXCLUDED.remote_change_interval,
+                next_refresh_at = EXCLUDED.next_refresh_at,
+                cron_stamp = EXCLUDED.cron_stamp
+            WHERE (
+                w.open_person, w.open_stamp, w.mod_stamp, w.type, w.project,
+                w.description, w.charge_person, w.has_smaller_sibling
+            ) IS DISTINCT FROM (
+                EXCLUDED.open_person, EXCLUDED.open_stamp, EXCLUDED.mod_stamp,
+                EXCLUDED.type, EXCLUDED.project, EXCLUDED.description,
+                EXCLUDED.charge_person, EXCLUDED.has_smaller_sibling
+            )
+            RETURNING
+                w.ident, w.type, w.project, w.description, w.open_stamp, w.mod_stamp,
+                w.xmax = 0 AS inserted
+        ), touched AS (
+            UPDATE debian_wnpp AS w SET
+                cron_stamp = %(now)s,
+                remote_hash = coalesce(
+                    (SELECT i.remote_hash FROM incoming AS i WHERE i.ident = w.ident),
+                    w.remote_hash
+                ),
+                next_refresh_at = coalesce(
+                    (SELECT i.next_refresh_at FROM incoming AS i WHERE i.ident = w.ident),
+                    %(now)s + %(minimum_refresh_interval)s
+                )
+            WHERE ident = ANY(%(issue_ids)s::int[])
+                AND ident NOT IN (SELECT ident FROM upserted)
+        )
+        SELECT upserted.*, previous.type AS old_kind
+        FROM upserted LEFT JOIN previous USING (ident)
+        ORDER BY upserted.ident
+        """,
+        {
+            "ident": [row["ident"] for row in rows],
+            "open_person": [row["open_person"] for row in rows],
+            "open_stamp": [row["open_stamp"] for row in rows],
+            "mod_stamp": [row["mod_stamp"] for row in rows],
+            "kind": [row["kind"] for row in rows],
+            "project": [row["popcon_id"] for row in rows],
+            "description": [row["description"] for row in rows],
+            "charge_person": [row["charge_person"] for row in rows],
+            "has_smaller_sibling": [row["has_smaller_sibling"] for row in rows],
+            "remote_hash": [row["remote_hash"] for row in rows],
+            "remote_change_interval": [row["remote_change_interval"] for row in rows],
+            "next_refresh_at": [row["next_refresh_at"] for row in rows],
+            "minimum_refresh_interval": minimum_refresh_interval,
+            "issue_ids": sorted(issue_ids),
+            "now": now,
+        },
+    )
+    return cursor.fetchall()
+
+
+def insert_log_entries(
+    cursor, log_entries: list[LogEntry], now: datetime.datetime
+) -> dict[int, int]:
+    """
+    Inserts ``log_entries`` and returns their log IDs by issue ID
+    """
+    cursor.execute(
+        """
+        INSERT INTO debian_log_index
+            (ident, type, project, description, log_stamp, event, event_stamp)
+        SELECT ident, type, project, description, %(now)s, event, event_stamp
+        FROM unnest(
+            %(ident)s::int[],
+            %(kind)s::varchar[],
+            %(project)s::varchar[],
+            %(description)s::varchar[],
+            %(event)s::varchar[],
+            %(event_stamp)s::timestamptz[]
+        ) AS t (ident, type, project, description, event, event_stamp)
+        RETURNING ident, log_id
+        """,
+        {
+            "ident": [entry[0] for entry in log_entries],
+            "kind": [entry[1] for entry in log_entries],
+            "project": [entry[2] for entry in log_entries],
+            "description": [entry[3] for entry in log_entries],
+            "event": [entry[4].value for entry in log_entries],
+            "event_stamp": [entry[5] for entry in log_entries],
+            "now": now,
+        },
+    )
+    return dict(cursor.fetchall())
+
+
+def insert_kind_changes(cursor, kind_changes: list[tuple[int, str, str]]) -> None:
+    """
+    Inserts ``kind_changes``, i.e. triples of log ID, old kind and new kind
+    """
+    cursor.execute(
+        """
+        INSERT INTO debian_log_mods (log_id, before_type, after_type)
+        SELECT * FROM unnest(
+            %(log_id)s::int[], %(old_kind)s::varchar[], %(new_kind)s::varchar[]
+        )
+        """,
+        {
+            "log_id": [log_id for log_id, _old_kind, _new_kind in kind_changes],
+            "old_kind": [old_kind for _log_id, old_kind, _new_kind in kind_changes],
+            "new_kind": [new_kind for _log_id, _old_kind, new_kind in kind_changes],
+        },
+    )
+
+
+def select_known_packages(cursor, package_names: Iterable[str]) -> set[str]:
+    cursor.execute(
+        "SELECT package FROM debian_popcon WHERE package = ANY(%s::varchar[])",
+        [sorted(package_names)],
+    )
+    return {package for (package,) in cursor.fetchall()}
+
+
+def copy_issues_into_database(
+    cursor, rows: list[dict[str, Any]], log_stamp: datetime.datetime
+) -> None:
+    """
+    Loads new issues ``rows`` (see ``WNPP_COLUMNS_OF_DATABASE_KEY``)
+    and log entries on their opening using ``COPY``
+    """
+    copy_rows_into(
+        cursor,
+        "debian_wnpp",
+        list(WNPP_COLUMNS_OF_DATABASE_KEY.values()),
+        ([row[key] for key in WNPP_COLUMNS_OF_DATABASE_KEY] for row in rows),
+    )
+
+    copy_rows_into(
+        cursor,
+        "debian_log_index",
+        ("ident", "type", "project", "description", "log_stamp", "event", "event_stamp"),
+        (
+            (
+                row["ident"],
+                row["kind"],
+                row["popcon_id"],
+                row["description"],
+                log_stamp,
+                EventKind.OPENED.value,
+                row["open_stamp"],
+            )
+            for row in rows
+        ),
+    )
@@ -2,16 +2,26 @@
 # Licensed under GNU Affero GPL v3 or later
 
 import datetime
+import hashlib
+import json
+import math
+import operator
+import os
 import re
 import sys
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager, nullcontext
 from functools import partial
-from itertools import islice
+from itertools import chain, islice
 from signal import SIGINT
 from typing import Any
 
 from django.core.management import CommandError
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
 from django.utils.text import Truncator
 from django.utils.timezone import now
 
@@ -21,12 +31,32 @@ from ...debbugs import (
     DebbugsWnppClient,
     IssueProperty,
     IssueStatus,
+    PooledHttpTransport,
 )
 from ...models import DebianLogIndex, DebianLogMods, DebianPopcon, DebianWnpp, EventKind
-from ._common import ReportingMixin
-
-_BATCH_SIZE = 100
-_MAXIMUM_STALE_DELTA = datetime.timedelta(hours=2)
+from ...popcon import POPCON_FIELD_NAMES, PopconLookup
+from . import _sql
+from ._checkpoint import Checkpoint, Phase
+from ._common import ReportingMixin, copy_rows_into, sync_advisory_lock, sync_popcon_copies
+from ._pipeline import AdaptiveBatchSize, Prefetcher
+from ._shards import parse_shard, run_shard_workers
+
+_DEFAULT_MAX_REQUESTS_IN_FLIGHT = 4
+_DEFAULT_RESUME_WINDOW_MINUTES = 60
+_MAX_PREFETCHED_BATCHES = 2
+_PROPERTIES_OF_INTEREST = (  # i.e. those used by Command._to_database_keys
+    IssueProperty.DATE,
+    IssueProperty.LAST_MODIFIED,
+    IssueProperty.MERGEDWITH,
+    IssueProperty.ORIGINATOR,
+    IssueProperty.OWNER,
+    IssueProperty.SUBJECT,
+)
+_MINIMUM_REFRESH_INTERVAL = datetime.timedelta(hours=2)
+_MAXIMUM_REFRESH_INTERVAL = datetime.timedelta(days=7)
+_REFRESH_INTERVAL_PER_DUST = 0.1  # e.g. issues last modified 10 days ago are refreshed daily
+_CHANGE_INTERVAL_SMOOTHING = 0.5  # i.e. the weight of the latest interval between changes
+_STALE_PAGE_SIZE = 2000
 
 
 class _MalformedSubject(ValueError):
@@ -35,104 +65,184 @@ class _MalformedSubject(ValueError):
 
 class Command(ReportingMixin, BaseCommand):
     help = "Import remote WNPP issues from Debbugs' SOAP service into the local database"
+    stealth_options = ("client", "cache_dir")  # e.g. for syncd and tests
 
-    def _close_all_issues_but(self, ids_of_open_wnpp_issues):
-        self._notice("[1/3] Closing issues locally that have been closed remotely...")
-        log_entries_to_create: list[DebianLogIndex] = []
+    _shard: tuple[int, int] | None = None  # i.e. all issues
 
-        for issue in DebianWnpp.objects.exclude(ident__in=ids_of_open_wnpp_issues).iterator():
-            self._notice(f"Detected that issue #{issue.ident} has been as closed, remotely")
-            log_entries_to_create.append(
-                self._create_log_entry_from(issue, EventKind.CLOSED, now())
-            )
+    def _restrict_to_shard(self, issue_ids: Iterable[int]) -> list[int]:
+        if self._shard is None:
+            return list(issue_ids)
+        index, count = self._shard
+        return [ident for ident in issue_ids if ident % count == index]
+
+    def _restrict_queryset_to_shard(self, issues_qs):
+        if self._shard is None:
+            return issues_qs
+        index, count = self._shard
+        return issues_qs.alias(ident_modulo=Mod("ident", count)).filter(ident_modulo=index)
 
-        if log_entries_to_create:
-            with transaction.atomic():
-                DebianLogIndex.objects.bulk_create(log_entries_to_create)
-                self._success(f"Logged closing of {len(log_entries_to_create)} issue(s)")
+    def _close_all_issues_but(self, ids_of_remote_open_issues, phases: int = 3):
+        self._notice(f"[1/{phases}] Closing issues locally that have been closed remotely...")
 
-                DebianWnpp.objects.exclude(ident__in=ids_of_open_wnpp_issues).delete()
-                self._success(f"Deleted {len(log_entries_to_create)} issue(s)")
+        with connection.cursor() as cursor:
+            ids_of_closed_issues = _sql.close_all_issues_but(
+                cursor, ids_of_remote_open_issues, now()
+            )
+
+        if ids_of_closed_issues:
+            for ident in ids_of_closed_issues:
+                self._notice(f"Detected that issue #{ident} has been as closed, remotely")
+            self._success(f"Logged closing of and deleted {len(ids_of_closed_issues)} issue(s)")
         else:
             self._notice("No existing issues deleted.")
 
-    def _fetch_issues(self, issue_ids: list[int]) -> dict[int, dict[str, str]]:
-        flat_issue_ids = ", ".join(str(i) for i in issue_ids)
-        self._notice(f"Fetching {len(issue_ids)} issue(s): {flat_issue_ids}...")
-        properties_of_issue = DebbugsRetry(self._client.fetch_issues, notify=self._notice)(
-            issue_ids
+    def _iterate_issue_id_batches(self, issue_ids: Iterable[int]) -> Iterator[list[int]]:
+        it = iter(issue_ids)
+        while True:
+            batch = list(islice(it, 0, self._batch_size.size))
+            if not batch:
+                break
+
+            flat_issue_ids = ", ".join(str(i) for i in batch)
+            self._notice(f"Fetching {len(batch)} issue(s): {flat_issue_ids}...")
+            yield batch
+
+    @contextmanager
+    def _fetch_issues_in_batches(self, issue_ids: Iterable[int]) -> Iterator[Prefetcher]:
+        """
+        Fetches issues in batches while the caller is busy writing previous batches
+        to the database, and reports on the overlap achieved.
+        """
+        # NOTE: Everything passed in here will be run from another thread,
+        #       so it must not make use of the database connection of this thread
+        #       other than through ``self._prefetcher.run_in_consumer``.
+        # NOTE: The prefetcher sets ``stopping`` when we are done, e.g. on KeyboardInterrupt,
+        #       so that pending retries of requests are cancelled rather than awaited at exit.
+        stopping = threading.Event()
+        batches = self._client.fetch_issues_concurrently(
+            self._iterate_issue_id_batches(issue_ids),
+            max_requests_in_flight=self._max_requests_in_flight,
+            notify=self._notice,
+            report_batch=self._adjust_batch_size,
+            properties=_PROPERTIES_OF_INTEREST,
+            stopping=stopping,
         )
 
-        return properties_of_issue
+        # NOTE: Assigned before the prefetcher gets started, for ``batches`` to find it
+        self._prefetcher = Prefetcher(
+            batches, max_prefetched=_MAX_PREFETCHED_BATCHES, stopping=stopping
+        )
+        with self._prefetcher as prefetcher:
+            yield prefetcher
 
-    @staticmethod
-    def _create_missing_pocons_for(package_names: list[str]) -> list[DebianPopcon]:
+        seconds_overlapped = max(0.0, prefetcher.seconds_producing - prefetcher.seconds_waiting)
+        self._notice(
+            f"Fetching took {prefetcher.seconds_producing:.1f} second(s),"
+            f" {seconds_overlapped:.1f} second(s) of which overlapped"
+            " with writing to the database."
+        )
+
+    def _adjust_batch_size(
+        self, issue_ids: list[int], seconds_taken: float, count_attempts: int
+    ) -> None:
+        previous_size = self._batch_size.size
+        self._batch_size.adjust(len(issue_ids), seconds_taken, count_attempts)
+        if self._batch_size.size != previous_size:
+            self._notice(
+                f"Adjusted batch size from {previous_size} to {self._batch_size.size}"
+                f" (after {len(issue_ids)} issue(s) took {seconds_taken:.1f} second(s)"
+                f" in {count_attempts} attempt(s))."
+            )
+
+    def _create_missing_pocons_for(self, package_names: set[str]) -> list[DebianPopcon]:
         existing_packages = set(
             DebianPopcon.objects.filter(package__in=package_names).values_list(
                 "package", flat=True
             )
         )
         missing_packages = package_names - existing_packages
-        return [DebianPopcon(package=package) for package in missing_packages]
-
-    def _add_any_new_issues_from(self, ids_of_remote_open_issues):
+        # NOTE: Stats are taken from the snapshots of importpopcon where available,
+        #       e.g. for packages that a scoped popcon import has left out.
+        stats_of_package = self._popcon_lookup.stats_of(missing_packages)
+        return [
+            DebianPopcon(package=package, **stats_of_package.get(package, {}))
+            for package in missing_packages
+        ]
+
+    def _popcon_rows_for(self, package_names: list[str]) -> list[tuple[str | int | None, ...]]:
+        stats_of_package = self._popcon_lookup.stats_of(package_names)
+        return [
+            (package, *(stats_of_package.get(package, {}).get(f) for f in POPCON_FIELD_NAMES))
+            for package in package_names
+        ]
+
+    def _add_any_new_issues_from(self, ids_of_remote_open_issues, phases: int = 3):
         ids_of_issues_already_known_locally = set(
             DebianWnpp.objects.values_list("ident", flat=True)
         )
         ids_of_new_issues_to_create = sorted(
             set(ids_of_remote_open_issues) - ids_of_issues_already_known_locally
         )
+        ids_of_new_issues_to_create = self._checkpoint.begin(
+            Phase.ADD, self._restrict_to_shard(ids_of_new_issues_to_create)
+        )
         count_issues_left_to_import = len(ids_of_new_issues_to_create)
         self._notice(
-            f"[2/3] Starting to import {count_issues_left_to_import} "
+            f"[2/{phases}] Starting to import {count_issues_left_to_import} "
             f"(={len(ids_of_remote_open_issues)}-{len(ids_of_issues_already_known_locally)})"
             " new remote issue(s) locally..."
         )
 
-        it = iter(ids_of_new_issues_to_create)
-        while True:
-            issue_ids = list(islice(it, 0, _BATCH_SIZE))
-            if not issue_ids:
-                break
-
-            self._notice(
-                f"Importing next {min(_BATCH_SIZE, count_issues_left_to_import)} issue(s) of {count_issues_left_to_import} left to import..."
-            )
-            count_issues_left_to_import -= _BATCH_SIZE
+        with self._fetch_issues_in_batches(ids_of_new_issues_to_create) as batches:
+            for issue_ids, remote_properties_of_issue in batches:
+                self._notice(
+                    f"Importing next {len(issue_ids)} issue(s) of {count_issues_left_to_import} left to import..."
+                )
+                count_issues_left_to_import -= len(issue_ids)
 
-            log_entries_to_create: list[DebianLogIndex] = []
-            issues_to_create: list[DebianWnpp] = []
+                log_entries_to_create: list[DebianLogIndex] = []
+                issues_to_create: list[DebianWnpp] = []
 
-            remote_properties_of_issue = self._fetch_issues(issue_ids)
+                future_local_properties_of_issue, popcons_to_create = (
+                    self._analyze_remote_properties(remote_properties_of_issue)
+                )
 
-            future_local_properties_of_issue, popcons_to_create = self._analyze_remote_properties(
-                remote_properties_of_issue
-            )
+                for issue_id, properties in future_local_properties_of_issue.items():
+                    issue = DebianWnpp(**properties)
+                    issues_to_create.append(issue)
+                    log_entries_to_create.append(
+                        self._create_log_entry_from(issue, EventKind.OPENED, issue.open_stamp)
+                    )
 
-            for issue_id, properties in future_local_properties_of_issue.items():
-                issue = DebianWnpp(**properties)
-                issues_to_create.append(issue)
-                log_entries_to_create.append(
-                    self._create_log_entry_from(issue, EventKind.OPENED, issue.open_stamp)
-                )
+                if issues_to_create:
+                    with transaction.atomic():
+                        if popcons_to_create:
+                            # NOTE: Worker processes of other shards may have just created
+                            #       some of these as well, for issues of the same package.
+                            DebianPopcon.objects.bulk_create(
+                                popcons_to_create, ignore_conflicts=True
+                            )
+                            self._success(
+                                f"Created {len(popcons_to_create)} missing popcon entries"
+                            )
 
-            if issues_to_create:
-                with transaction.atomic():
-                    if popcons_to_create:
-                        DebianPopcon.objects.bulk_create(popcons_to_create)
-                        self._success(f"Created {len(popcons_to_create)} missing popcon entries")
+                        DebianLogIndex.objects.bulk_create(log_entries_to_create)
+                        self._success(
+                            f"Logged upcoming creation of {len(log_entries_to_create)} issue(s)"
+                        )
 
-                    DebianLogIndex.objects.bulk_create(log_entries_to_create)
-                    self._success(
-                        f"Logged upcoming creation of {len(log_entries_to_create)} issue(s)"
-                    )
+                        DebianWnpp.objects.bulk_create(issues_to_create)
+                        with connection.cursor() as cursor:
+                            sync_popcon_copies(cursor, future_local_properties_of_issue)
+                        self._success(f"Created {len(issues_to_create)} new issues")
+                else:
+                    self._notice("No new issues created.")
 
-                    DebianWnpp.objects.bulk_create(issues_to_create)
-                    self._success(f"Created {len(issues_to_create)} new issues")
-            else:
-                self._notice("No new issues created.")
+                self._checkpoint.commit(issue_ids)
 
-    def _analyze_remote_properties(self, remote_properties_of_issue):
+    def _convert_remote_properties(
+        self, remote_properties_of_issue: dict[int, dict[str, str]]
+    ) -> dict[int, dict[str, Any]]:
         future_local_properties_of_issue: dict[int, dict[str, Any]] = {}
         for issue_id, properties in remote_properties_of_issue.items():
             self._notice(f"Processing upcoming issue {issue_id}...")
@@ -143,6 +253,12 @@ class Command(ReportingMixin, BaseCommand):
             except _MalformedSubject as e:
                 self._error(str(e))
                 continue
+        return future_local_properties_of_issue
+
+    def _analyze_remote_properties(self, remote_properties_of_issue):
+        future_local_properties_of_issue = self._convert_remote_properties(
+            remote_properties_of_issue
+        )
 
         # NOTE: PostgreSQL is not forgiving about absent foreign keys,
         #       so we'll need to create any missing DebianPopcon instances
@@ -154,11 +270,52 @@ class Command(ReportingMixin, BaseCommand):
 
         return future_local_properties_of_issue, popcons_to_create
 
-    def _update_stale_existing_issues(self, ids_of_remote_open_issues):
-        stale_issues_qs = DebianWnpp.objects.filter(
-            ident__in=ids_of_remote_open_issues, cron_stamp__lt=now() - _MAXIMUM_STALE_DELTA
-        )
-        count_issues_left_to_update = stale_issues_qs.count()
+    def _iterate_pages_of_stale_issue_ids(
+        self, due_by: datetime.datetime, run_query: Callable[[Callable], Any] = operator.call
+    ) -> Iterator[list[int]]:
+        """
+        Keyset pagination over issues due for a refresh, most overdue first.
+        Every page is a range scan on index (next_refresh_at, ident) of constant cost,
+        no matter how many pages came before.
+        Queries are made through ``run_query``, e.g. on the thread owning the connection.
+        """
+        last_seen: tuple[datetime.datetime, int] | None = None
+        while True:
+            stale_issues_qs = self._restrict_queryset_to_shard(
+                DebianWnpp.objects.filter(next_refresh_at__lte=due_by)
+            )
+            if last_seen is not None:
+                # NOTE: The redundant lower bound keeps this a range scan on the index.
+                last_next_refresh_at, last_ident = last_seen
+                stale_issues_qs = stale_issues_qs.filter(
+                    Q(next_refresh_at__gt=last_next_refresh_at)
+                    | Q(next_refresh_at=last_next_refresh_at, ident__gt=last_ident),
+                    next_refresh_at__gte=last_next_refresh_at,
+                )
+            page = run_query(
+                partial(
+                    list,
+                    stale_issues_qs.order_by("next_refresh_at", "ident").values_list(
+                        "next_refresh_at", "ident"
+                    )[:_STALE_PAGE_SIZE],
+                )
+            )
+            if not page:
+                break
+
+            last_seen = page[-1]
+            yield [ident for _next_refresh_at, ident in page]
+
+    def _update_stale_existing_issues(self):
+        # NOTE: Issues closed remotely have been deleted locally in phase 1 already,
+        #       so all local issues are known to be open remotely.
+        # NOTE: Issues updated before an interruption are no longer stale,
+        #       so there is no need to skip any issues when resuming this phase.
+        self._checkpoint.begin(Phase.STALE)
+        due_by = now()
+        count_issues_left_to_update = self._restrict_queryset_to_shard(
+            DebianWnpp.objects.filter(next_refresh_at__lte=due_by)
+        ).count()
 
         self._notice(
             f"[3/3] Starting to apply remote changes to {count_issues_left_to_update} stale local issue(s)..."
@@ -167,91 +324,289 @@ class Command(ReportingMixin, BaseCommand):
             self._notice("No stale issues found, none updated.")
             return
 
-        while True:
-            log_entries_to_create: list[DebianLogIndex] = []
-            kind_change_log_entries_to_create: list[DebianLogMods] = []
-            issues_to_update: list[DebianWnpp] = list(
-                stale_issues_qs.order_by("cron_stamp", "ident")[:_BATCH_SIZE]
+        # NOTE: A single pipeline spans all pages, so that it does not drain at page boundaries;
+        #       the fetching stage has the pages queried by this thread, in between batches.
+        ids_of_stale_issues = chain.from_iterable(
+            self._iterate_pages_of_stale_issue_ids(
+                due_by, run_query=lambda query: self._prefetcher.run_in_consumer(query)
             )
-            if not issues_to_update:
-                break
+        )
+        with self._fetch_issues_in_batches(ids_of_stale_issues) as batches:
+            for issue_ids, remote_properties_of_issue in batches:
+                self._notice(
+                    f"Updating next {len(issue_ids)} stale issue(s) of {count_issues_left_to_update} left to update..."
+                )
+                count_issues_left_to_update -= len(issue_ids)
+
+                self._update_stale_issues_from(issue_ids, remote_properties_of_issue)
+                self._checkpoint.commit(issue_ids)
+
+    def _touch_unchanged_issues_from(
+        self, issue_ids: list[int], remote_properties_of_issue: dict[int, dict[str, str]]
+    ) -> list[int]:
+        """
+        Bumps the cron_stamp (and reschedules the next refresh) of those issues
+        whose remote properties hash to what was stored at their last import,
+        and returns the IDs of all other issues.
+        """
+        remote_hash_of_issue = {
+            issue_id: self._hash_remote_properties(properties)
+            for issue_id, properties in remote_properties_of_issue.items()
+        }
+        change_interval_of_unchanged_issue = {
+            ident: change_interval
+            for ident, remote_hash, change_interval in DebianWnpp.objects.filter(
+                ident__in=issue_ids
+            ).values_list("ident", "remote_hash", "remote_change_interval")
+            if remote_hash is not None and remote_hash == remote_hash_of_issue.get(ident)
+        }
+        ids_of_unchanged_issues = sorted(change_interval_of_unchanged_issue)
+
+        if ids_of_unchanged_issues:
+            next_refresh_ats = [
+                self._next_refresh_at(
+                    self._from_epoch_seconds(
+                        int(remote_properties_of_issue[ident][IssueProperty.LAST_MODIFIED.value])
+                    ),
+                    change_interval_of_unchanged_issue[ident],
+                )
+                for ident in ids_of_unchanged_issues
+            ]
+            with connection.cursor() as cursor:
+                _sql.touch_issues(cursor, ids_of_unchanged_issues, next_refresh_ats, now())
+            self._notice(f"Found {len(ids_of_unchanged_issues)} issue(s) unchanged.")
+
+        unchanged = set(ids_of_unchanged_issues)
+        return [ident for ident in issue_ids if ident not in unchanged]
+
+    def _update_stale_issues_from(
+        self, issue_ids: list[int], remote_properties_of_issue: dict[int, dict[str, str]]
+    ) -> None:
+        issue_ids = self._touch_unchanged_issues_from(issue_ids, remote_properties_of_issue)
+        if not issue_ids:
+            return
+        remote_properties_of_issue = {
+            ident: remote_properties_of_issue[ident]
+            for ident in issue_ids
+            if ident in remote_properties_of_issue
+        }
 
-            self._notice(
-                f"Updating next {min(_BATCH_SIZE, count_issues_left_to_update)} stale issue(s) of {count_issues_left_to_update} left to update..."
+        log_entries_to_create: list[DebianLogIndex] = []
+        kind_change_log_entries_to_create: list[DebianLogMods] = []
+        issues_to_update: list[DebianWnpp] = list(
+            DebianWnpp.objects.filter(ident__in=issue_ids).order_by("ident")
+        )
+        issue_fields_to_bulk_update: set[str] = {
+            "cron_stamp",
+            "next_refresh_at",
+        }  # will be grown as needed
+
+        future_local_properties_of_issue, popcons_to_create = self._analyze_remote_properties(
+            remote_properties_of_issue
+        )
+
+        # Turn remote data into database instances (to persist later)
+        for i, issue in enumerate(issues_to_update):
+            try:
+                database_field_map = future_local_properties_of_issue[issue.ident]
+            except KeyError:  # when self._analyze_remote_properties had to drop the issue
+                issue.cron_stamp = now()
+                issue.next_refresh_at = issue.cron_stamp + _MINIMUM_REFRESH_INTERVAL
+                continue
+
+            database_field_map = self._with_change_history(
+                database_field_map, issue.mod_stamp, issue.remote_change_interval
             )
-            count_issues_left_to_update -= _BATCH_SIZE
+            fields_about_to_change = self._detect_and_report_diff(issue, database_field_map)
+
+            if fields_about_to_change:
+                issue_fields_to_bulk_update |= fields_about_to_change
+
+                old_kind_backup = issue.kind
+                for field_name in fields_about_to_change:
+                    setattr(issue, field_name, database_field_map[field_name])
 
-            issue_ids = [issue.ident for issue in issues_to_update]
-            issue_fields_to_bulk_update: set[str] = {
-                "cron_stamp",
-            }  # will be grown as needed
+                log_entry = self._create_log_entry_from(issue, EventKind.MODIFIED, issue.mod_stamp)
+                log_entries_to_create.append(log_entry)
 
-            # Fetch remote data
-            remote_properties_of_issue = self._fetch_issues(issue_ids)
+                if old_kind_backup != issue.kind:
+                    kind_change_log_entries_to_create.append(
+                        DebianLogMods(
+                            log=log_entry,
+                            old_kind=old_kind_backup,
+                            new_kind=issue.kind,
+                        )
+                    )
 
-            future_local_properties_of_issue, popcons_to_create = self._analyze_remote_properties(
-                remote_properties_of_issue
+        with transaction.atomic():
+            # Persist log entries
+            DebianLogIndex.objects.bulk_create(log_entries_to_create)
+            self._success(f"Logged upcoming updates to {len(log_entries_to_create)} issue(s)")
+
+            if popcons_to_create:
+                # NOTE: See _add_any_new_issues_from on why conflicts are ignored
+                DebianPopcon.objects.bulk_create(popcons_to_create, ignore_conflicts=True)
+                self._success(f"Created {len(popcons_to_create)} missing popcon entries")
+
+            # Persist kind change extra log entries
+            if kind_change_log_entries_to_create:
+                # NOTE: We need to apply the just-written primary keys or we'll get this error:
+                #       django.db.utils.IntegrityError: null value in column "log_id" of relation "debian_log_mods" violates not-null constraint
+                for kind_change_log_entry in kind_change_log_entries_to_create:
+                    kind_change_log_entry.log_id = kind_change_log_entry.log.log_id
+
+                DebianLogMods.objects.bulk_create(kind_change_log_entries_to_create)
+                self._success(
+                    f"Logged upcoming changes in kind of {len(kind_change_log_entries_to_create)} issue(s)"
+                )
+            else:
+                self._notice("No changes in kind recognized.")
+
+            # Persist actual issues
+            DebianWnpp.objects.bulk_update(issues_to_update, fields=issue_fields_to_bulk_update)
+            if "popcon_id" in issue_fields_to_bulk_update:
+                with connection.cursor() as cursor:
+                    sync_popcon_copies(cursor, issue_ids)
+            self._success(f"Updated {len(issues_to_update)} existing issue(s)")
+
+    def _upsert_new_and_stale_issues_from(self, ids_of_remote_open_issues):
+        # NOTE: Issues closed remotely have been deleted locally in phase 1 already,
+        #       so new and stale issues are all that is left to take care of.
+        with connection.cursor() as cursor:
+            ids_of_issues_to_upsert = _sql.select_ids_of_issues_to_upsert(
+                cursor, ids_of_remote_open_issues, now()
             )
 
-            # Turn remote data into database instances (to persist later)
-            for i, issue in enumerate(issues_to_update):
-                try:
-                    database_field_map = future_local_properties_of_issue[issue.ident]
-                except KeyError:  # when self._analyze_remote_properties had to drop the issue
-                    issue.cron_stamp = now()
-                    continue
+        ids_of_issues_to_upsert = self._checkpoint.begin(Phase.UPSERT, ids_of_issues_to_upsert)
+        count_issues_left_to_upsert = len(ids_of_issues_to_upsert)
+        self._notice(
+            f"[2/2] Starting to upsert {count_issues_left_to_upsert} new or stale remote issue(s) locally..."
+        )
+        if not count_issues_left_to_upsert:
+            self._notice("No new or stale issues found, none upserted.")
+            return
 
-                fields_about_to_change = self._detect_and_report_diff(issue, database_field_map)
+        with self._fetch_issues_in_batches(ids_of_issues_to_upsert) as batches:
+            for issue_ids, remote_properties_of_issue in batches:
+                self._notice(
+                    f"Upserting next {len(issue_ids)} issue(s) of {count_issues_left_to_upsert} left to upsert..."
+                )
+                count_issues_left_to_upsert -= len(issue_ids)
+
+                self._upsert_issues_from(issue_ids, remote_properties_of_issue)
+                self._checkpoint.commit(issue_ids)
+
+    def _upsert_issues_from(
+        self, issue_ids: list[int], remote_properties_of_issue: dict[int, dict[str, str]]
+    ) -> None:
+        """
+        Writes a batch of fetched issues with a single statement per table.
+        Rows are only rewritten if they actually differ from what is known locally;
+        rows that do not differ only get their cron_stamp bumped and their next refresh rescheduled.
+        """
+        future_local_properties_of_issue = self._convert_remote_properties(
+            remote_properties_of_issue
+        )
+        log_stamp = now()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            previous_of_issue = {
+                ident: (mod_stamp, change_interval)
+                for ident, mod_stamp, change_interval in DebianWnpp.objects.filter(
+                    ident__in=future_local_properties_of_issue
+                ).values_list("ident", "mod_stamp", "remote_change_interval")
+            }
+            rows = [
+                self._with_change_history(
+                    future_local_properties_of_issue[ident],
+                    *previous_of_issue.get(ident, (None, None)),
+                )
+                for ident in sorted(future_local_properties_of_issue)
+            ]
 
-                if fields_about_to_change:
-                    issue_fields_to_bulk_update |= fields_about_to_change
+            # NOTE: PostgreSQL is not forgiving about absent foreign keys,
+            #       so any missing DebianPopcon rows need to go in first.
+            popcon_rows = self._popcon_rows_for(sorted({row["popcon_id"] for row in rows}))
+            _sql.insert_missing_popcons(cursor, popcon_rows)
 
-                    old_kind_backup = issue.kind
-                    for field_name in fields_about_to_change:
-                        setattr(issue, field_name, database_field_map[field_name])
+            upserted_issues = _sql.upsert_issues(
+                cursor, rows, issue_ids, log_stamp, _MINIMUM_REFRESH_INTERVAL
+            )
+            sync_popcon_copies(cursor, [ident for ident, *_ in upserted_issues])
+
+            log_entries: list[_sql.LogEntry] = [
+                (ident, kind, project, description, EventKind.OPENED, open_stamp)
+                if inserted
+                else (ident, kind, project, description, EventKind.MODIFIED, mod_stamp)
+                for ident, kind, project, description, open_stamp, mod_stamp, inserted, _ in (
+                    upserted_issues
+                )
+            ]
+
+            log_id_of_issue: dict[int, int] = {}
+            if log_entries:
+                log_id_of_issue = _sql.insert_log_entries(cursor, log_entries, log_stamp)
+
+            kind_changes = [
+                (log_id_of_issue[ident], old_kind, kind)
+                for ident, kind, *_, inserted, old_kind in upserted_issues
+                if not inserted and old_kind != kind
+            ]
+            if kind_changes:
+                _sql.insert_kind_changes(cursor, kind_changes)
+
+        count_created = sum(1 for *_, inserted, _old_kind in upserted_issues if inserted)
+        count_updated = len(upserted_issues) - count_created
+        count_unchanged = len(issue_ids) - len(upserted_issues)
+        self._success(
+            f"Created {count_created} new issue(s), updated {count_updated} changed issue(s)"
+            f" ({len(kind_changes)} in kind), left {count_unchanged} issue(s) unchanged"
+        )
 
-                    log_entry = self._create_log_entry_from(
-                        issue, EventKind.MODIFIED, issue.mod_stamp
-                    )
-                    log_entries_to_create.append(log_entry)
-
-                    if old_kind_backup != issue.kind:
-                        kind_change_log_entries_to_create.append(
-                            DebianLogMods(
-                                log=log_entry,
-                                old_kind=old_kind_backup,
-                                new_kind=issue.kind,
-                            )
-                        )
+    def _bootstrap_from(self, ids_of_remote_open_issues):
+        if DebianWnpp.objects.exists():
+            raise CommandError(
+                "Bootstrapping is for empty databases only, but table debian_wnpp is not empty."
+            )
 
-            with transaction.atomic():
-                # Persist log entries
-                DebianLogIndex.objects.bulk_create(log_entries_to_create)
-                self._success(f"Logged upcoming updates to {len(log_entries_to_create)} issue(s)")
-
-                if popcons_to_create:
-                    DebianPopcon.objects.bulk_create(popcons_to_create)
-                    self._success(f"Created {len(popcons_to_create)} missing popcon entries")
-
-                # Persist kind change extra log entries
-                if kind_change_log_entries_to_create:
-                    # NOTE: We need to apply the just-written primary keys or we'll get this error:
-                    #       django.db.utils.IntegrityError: null value in column "log_id" of relation "debian_log_mods" violates not-null constraint
-                    for kind_change_log_entry in kind_change_log_entries_to_create:
-                        kind_change_log_entry.log_id = kind_change_log_entry.log.log_id
-
-                    DebianLogMods.objects.bulk_create(kind_change_log_entries_to_create)
-                    self._success(
-                        f"Logged upcoming changes in kind of {len(kind_change_log_entries_to_create)} issue(s)"
-                    )
-                else:
-                    self._notice("No changes in kind recognized.")
+        count_issues_left_to_import = len(ids_of_remote_open_issues)
+        self._notice(
+            f"[1/1] Starting to bootstrap {count_issues_left_to_import} remote issue(s) locally..."
+        )
 
-                # Persist actual issues
-                DebianWnpp.objects.bulk_update(
-                    issues_to_update, fields=issue_fields_to_bulk_update
+        # NOTE: All of the load is a single transaction, with foreign key checks
+        #       deferred to its end, so that the order of tables is of no concern.
+        with (
+            self._fetch_issues_in_batches(sorted(ids_of_remote_open_issues)) as batches,
+            transaction.atomic(),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+            involved_packages: set[str] = set()
+            for issue_ids, remote_properties_of_issue in batches:
+                self._notice(
+                    f"Importing next {len(issue_ids)} issue(s) of {count_issues_left_to_import} left to import..."
                 )
-                self._success(f"Updated {len(issues_to_update)} existing issue(s)")
+                count_issues_left_to_import -= len(issue_ids)
+
+                rows = list(self._convert_remote_properties(remote_properties_of_issue).values())
+                _sql.copy_issues_into_database(cursor, rows, log_stamp=now())
+                involved_packages |= {row["popcon_id"] for row in rows}
+                self._success(f"Created {len(rows)} new issues")
+
+            missing_packages = involved_packages - _sql.select_known_packages(
+                cursor, involved_packages
+            )
+            copy_rows_into(
+                cursor,
+                "debian_popcon",
+                ("package",) + POPCON_FIELD_NAMES,
+                self._popcon_rows_for(sorted(missing_packages)),
+            )
+            self._success(f"Created {len(missing_packages)} missing popcon entries")
+
+            sync_popcon_copies(cursor)
 
     @staticmethod
     def _parse_wnpp_issue_subject(subject) -> tuple[str, str, str]:
@@ -270,6 +625,70 @@ class Command(ReportingMixin, BaseCommand):
         dt = dt.replace(tzinfo=datetime.UTC)
         return dt
 
+    @staticmethod
+    def _hash_remote_properties(issue_properties: dict[str, str]) -> str:
+        normalized_properties = {
+            property_.value: str(issue_properties[property_.value]).strip()
+            for property_ in _PROPERTIES_OF_INTEREST
+            if issue_properties.get(property_.value) is not None
+        }
+        return hashlib.sha256(
+            json.dumps(normalized_properties, sort_keys=True).encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _next_refresh_at(
+        mod_stamp: datetime.datetime, change_interval: datetime.timedelta | None = None
+    ) -> datetime.datetime:
+        """
+        Schedules the next refresh of an issue depending on how long ago
+        it has last been modified remotely and, once known, how often it has been
+        modified remotely (see ``DebianWnpp.remote_change_interval``):
+        Issues that see a lot of activity are refreshed often, while issues
+        that have been dormant for years are only refreshed every ``_MAXIMUM_REFRESH_INTERVAL``.
+        The two are combined by geometric mean, so that e.g. an issue that used to change
+        every few days is refreshed more often than its dust alone would suggest,
+        and a long dormant issue that just saw its first change in years less often.
+        """
+        now_ = now()
+        expected_change_interval = max(now_ - mod_stamp, datetime.timedelta())
+        if change_interval is not None:
+            expected_change_interval = datetime.timedelta(
+                seconds=math.sqrt(
+                    expected_change_interval.total_seconds() * change_interval.total_seconds()
+                )
+            )
+        interval = expected_change_interval * _REFRESH_INTERVAL_PER_DUST
+        return now_ + min(max(interval, _MINIMUM_REFRESH_INTERVAL), _MAXIMUM_REFRESH_INTERVAL)
+
+    @classmethod
+    def _with_change_history(
+        cls,
+        database_field_map: dict[str, Any],
+        previous_mod_stamp: datetime.datetime | None,
+        previous_change_interval: datetime.timedelta | None,
+    ) -> dict[str, Any]:
+        """
+        Adds the remote change interval (see ``DebianWnpp.remote_change_interval``)
+        to ``database_field_map``, with a remote change since ``previous_mod_stamp``
+        (if any) taken into account, and reschedules the next refresh accordingly
+        """
+        change_interval = previous_change_interval
+        mod_stamp = database_field_map["mod_stamp"]
+        if previous_mod_stamp is not None and mod_stamp > previous_mod_stamp:
+            observed_interval = mod_stamp - previous_mod_stamp
+            if change_interval is None:
+                change_interval = observed_interval
+            else:
+                change_interval += (
+                    observed_interval - change_interval
+                ) * _CHANGE_INTERVAL_SMOOTHING
+        return {
+            **database_field_map,
+            "remote_change_interval": change_interval,
+            "next_refresh_at": cls._next_refresh_at(mod_stamp, change_interval),
+        }
+
     @classmethod
     def _to_database_keys(cls, issue_id: int, issue_properties: dict[str, str]) -> dict[str, Any]:
         _MAX_DESCRIPTION_LENGTH = DebianWnpp._meta.get_field("description").max_length
@@ -302,6 +721,8 @@ class Command(ReportingMixin, BaseCommand):
             "charge_person": charge_person,
             "cron_stamp": now(),
             "has_smaller_sibling": has_smaller_sibling,
+            "remote_hash": cls._hash_remote_properties(issue_properties),
+            "next_refresh_at": cls._next_refresh_at(mod_stamp),
         }
 
     @staticmethod
@@ -321,7 +742,12 @@ class Command(ReportingMixin, BaseCommand):
             old_value = getattr(issue, field_name)
             if new_value != old_value:
                 fields_that_changed.add(field_name)
-                if field_name != "cron_stamp":
+                if field_name not in (
+                    "cron_stamp",
+                    "next_refresh_at",
+                    "remote_hash",
+                    "remote_change_interval",
+                ):
                     self._notice(f"--- {issue.ident}.{field_name} = {self._shy_quote(old_value)}")
                     self._notice(f"+++ {issue.ident}.{field_name} = {self._shy_quote(new_value)}")
         return fields_that_changed
@@ -340,23 +766,142 @@ class Command(ReportingMixin, BaseCommand):
             event_stamp=when,
         )
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-requests-in-flight",
+            dest="max_requests_in_flight",
+            metavar="COUNT",
+            type=int,
+            default=_DEFAULT_MAX_REQUESTS_IN_FLIGHT,
+        )
+        mode_group = parser.add_mutually_exclusive_group()
+        mode_group.add_argument("--upsert", dest="upsert", action="store_true")
+        mode_group.add_argument("--bootstrap", dest="bootstrap", action="store_true")
+        mode_group.add_argument("--quick", dest="quick", action="store_true")
+        mode_group.add_argument("--shard", dest="shard", metavar="K/N", type=parse_shard)
+        mode_group.add_argument("--shards", dest="count_shards", metavar="N", type=int)
+        parser.add_argument("--ids-from", dest="ids_filename", metavar="FILE")
+        parser.add_argument(
+            "--resume-window",
+            dest="resume_window_minutes",
+            metavar="MINUTES",
+            type=int,
+            default=_DEFAULT_RESUME_WINDOW_MINUTES,
+        )
+
+    def _report_connection_usage(self):
+        transport = self._client.transport
+        if not isinstance(transport, PooledHttpTransport):
+            return
+
+        self._notice(
+            f"Opened {transport.count_connections_opened} connection(s) to Debbugs"
+            f" and re-used connections {transport.count_connections_reused} time(s)."
+        )
+
     def handle(self, *args, **options):
-        self._client = options.get("client") or DebbugsWnppClient()
+        self._max_requests_in_flight = options.get(
+            "max_requests_in_flight", _DEFAULT_MAX_REQUESTS_IN_FLIGHT
+        )
+        self._client = options.get("client") or DebbugsWnppClient(
+            transport=PooledHttpTransport(pool_size=self._max_requests_in_flight)
+        )
+        cache_dir = options.get("cache_dir", os.path.expanduser("~/.local/cache"))
+        self._popcon_lookup = PopconLookup(download_cache_dir=cache_dir)
+        self._batch_size = AdaptiveBatchSize(
+            os.path.join(cache_dir, "importdebbugs_batch_size.json")
+        )
+        bootstrap = options.get("bootstrap", False)
+        upsert = options.get("upsert", False)
+        quick = options.get("quick", False)
+        self._shard = options.get("shard")
+        count_shards = options.get("count_shards")
+        mode = "upsert" if upsert else "quick" if quick else "regular"
+        shard_suffix = "" if self._shard is None else "_shard_{}_of_{}".format(*self._shard)
+        self._checkpoint = Checkpoint(
+            os.path.join(cache_dir, f"importdebbugs_{mode}_checkpoint{shard_suffix}.json"),
+            mode=mode,
+        )
+        resume_window_minutes = options.get(
+            "resume_window_minutes", _DEFAULT_RESUME_WINDOW_MINUTES
+        )
+        resume_window = datetime.timedelta(minutes=resume_window_minutes)
+        ids_filename = options.get("ids_filename")
         self._client.connect()
 
-        try:
-            ids_of_remote_open_issues: set[int] = set()
-            for issue_status in (IssueStatus.FORWARDED, IssueStatus.OPEN):
-                fetch_ids = partial(self._client.fetch_ids_of_issues_with_status, issue_status)
-                issue_ids: list[int] = DebbugsRetry(fetch_ids, notify=self._notice)()
-                ids_of_remote_open_issues |= set(issue_ids)
-
-            self._close_all_issues_but(ids_of_remote_open_issues)
-            self._add_any_new_issues_from(ids_of_remote_open_issues)
-            self._update_stale_existing_issues(ids_of_remote_open_issues)
-
-            self._success("Successfully synced with Debbugs.")
-        except DebbugsRequestError as e:
-            raise CommandError(f"Import remote WNPP issues from Debbugs: {e}")
-        except KeyboardInterrupt:
-            sys.exit(128 + SIGINT)
+        # NOTE: Worker processes of shards run under the lock of their coordinator.
+        sync_lock = sync_advisory_lock() if self._shard is None else nullcontext(True)
+        with sync_lock as locked:
+            if not locked:
+                raise CommandError("Another sync is in progress, please try again later.")
+
+            try:
+                if ids_filename is not None:  # i.e. as handed over by the coordinator of shards
+                    with open(ids_filename) as f:
+                        ids_of_remote_open_issues = set(json.load(f))
+                else:
+                    ids_of_remote_open_issues = set()
+                    for issue_status in (IssueStatus.FORWARDED, IssueStatus.OPEN):
+                        fetch_ids = partial(
+                            self._client.fetch_ids_of_issues_with_status, issue_status
+                        )
+                        issue_ids: list[int] = DebbugsRetry(fetch_ids, notify=self._notice)()
+                        ids_of_remote_open_issues |= set(issue_ids)
+
+                # NOTE: Bootstrapping is a single transaction, so there is nothing to resume.
+                #       The coordinator of shards only closes issues, so it does not resume either.
+                resumable = not bootstrap and count_shards is None
+                if resumable and self._checkpoint.load(
+                    ids_of_remote_open_issues, max_age=resume_window
+                ):
+                    self._notice(
+                        f"Resuming interrupted run in phase {self._checkpoint.phase!r}"
+                        f" after issue #{self._checkpoint.last_ident}"
+                        f" for the same {len(ids_of_remote_open_issues)} remote open issue(s)..."
+                    )
+                elif resumable:
+                    self._checkpoint.start(ids_of_remote_open_issues)
+
+                if count_shards is not None:
+                    self._close_all_issues_but(ids_of_remote_open_issues)
+                    self._notice(
+                        f"Launching {count_shards} worker process(es) for phases 2 and 3..."
+                    )
+                    run_shard_workers(
+                        ids_of_remote_open_issues,
+                        count_shards,
+                        arguments=[
+                            f"--max-requests-in-flight={self._max_requests_in_flight}",
+                            f"--resume-window={resume_window_minutes}",
+                        ],
+                    )
+                elif bootstrap:
+                    self._bootstrap_from(ids_of_remote_open_issues)
+                elif upsert:
+                    if not self._checkpoint.has_completed(Phase.CLOSE):
+                        self._close_all_issues_but(ids_of_remote_open_issues, phases=2)
+                    self._upsert_new_and_stale_issues_from(ids_of_remote_open_issues)
+                elif quick:
+                    # NOTE: Only new and closed issues are taken care of, so that this mode
+                    #       is cheap enough to run every few minutes.
+                    if not self._checkpoint.has_completed(Phase.CLOSE):
+                        self._close_all_issues_but(ids_of_remote_open_issues, phases=2)
+                    self._add_any_new_issues_from(ids_of_remote_open_issues, phases=2)
+                else:
+                    # NOTE: With shards, closing issues is up to the coordinator.
+                    if self._shard is None and not self._checkpoint.has_completed(Phase.CLOSE):
+                        self._close_all_issues_but(ids_of_remote_open_issues)
+                    if not self._checkpoint.has_completed(Phase.ADD):
+                        self._add_any_new_issues_from(ids_of_remote_open_issues)
+                    self._update_stale_existing_issues()
+
+                if resumable:  # i.e. not a checkpoint of some other run
+                    self._checkpoint.clear()
+                self._success("Successfully synced with Debbugs.")
+            except DebbugsRequestError as e:
+                raise CommandError(f"Import remote WNPP issues from Debbugs: {e}")
+            except KeyboardInterrupt:
+                sys.exit(128 + SIGINT)
+            finally:
+                self._batch_size.save()
+                self._report_connection_usage()
@@ -3,161 +3,308 @@
 
 import datetime
 import gzip
+import hashlib
+import json
 import os
-import re
-from itertools import islice
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 
 import requests
+from django.core.management import CommandError
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 
-from wnpp_debian_net.management.commands._common import ReportingMixin
-from wnpp_debian_net.models import DebianPopcon
+from wnpp_debian_net.management.commands._common import (
+    ReportingMixin,
+    copy_rows_into,
+    sync_advisory_lock,
+    sync_popcon_copies,
+)
+from wnpp_debian_net.models import DebianWnpp
+from wnpp_debian_net.popcon import (
+    POPCON_FIELD_NAMES,
+    iterate_popcon_entries_in_file,
+    popcon_filename,
+)
 
 _BINARY_PACKAGES_POPCON_URL = "https://popcon.debian.org/by_inst.gz"
 _SOURCE_PACKAGES_POPCON_URL = "https://popcon.debian.org/source/by_inst.gz"
 
-_BATCH_SIZE = 500
+_DOWNLOAD_CHUNK_SIZE = 2**16
+_DOWNLOAD_TIMEOUT_SECONDS = 60
 _DEFAULT_MAXIMUM_STALE_DELTA = datetime.timedelta(hours=12)
 
+_URL_OF_CATEGORY = {
+    "source": _SOURCE_PACKAGES_POPCON_URL,
+    "binary": _BINARY_PACKAGES_POPCON_URL,
+}
+
+_SNAPSHOT_HEADER_PREFIX = "# sha256 "
+_SNAPSHOT_SCOPE_ALL = "all"
+_SNAPSHOT_SCOPE_REFERENCED = "referenced"  # i.e. by WNPP issues
+
 
 class Command(ReportingMixin, BaseCommand):
     help = "Import remote popcon stats into the local database"
 
-    def _download_url_to_disk(self, url, filename):
+    @staticmethod
+    def _load_validators(filename) -> dict[str, str]:
+        if not os.path.exists(filename):
+            return {}  # i.e. validators without the file they validate are of no use
+        try:
+            with open(f"{filename}.validators.json") as f:
+                validators = json.load(f)
+            return {name: str(value) for name, value in validators.items()}
+        except OSError, ValueError, AttributeError:
+            return {}
+
+    @staticmethod
+    def _save_validators(filename, response: requests.Response) -> None:
+        validators_filename = f"{filename}.validators.json"
+        validators = {
+            header_name: response.headers[header_name]
+            for header_name in ("ETag", "Last-Modified")
+            if header_name in response.headers
+        }
+        temp_filename = f"{validators_filename}.tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(validators, f)
+        os.replace(temp_filename, validators_filename)  # i.e. atomically
+
+    def _download_url_to_disk(self, url, filename) -> None:
+        """
+        Downloads ``url`` to ``filename`` (atomically, in chunks) unless the server
+        confirms that the existing copy is still current.
+        """
+        headers = {}
+        validators = self._load_validators(filename)
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+
         self._notice(f"Downloading {url} to file {filename}...")
-        r = requests.get(url, allow_redirects=True)
-        with open(filename, "wb") as f:
-            f.write(r.content)
+        with requests.get(
+            url,
+            headers=headers,
+            allow_redirects=True,
+            stream=True,
+            timeout=_DOWNLOAD_TIMEOUT_SECONDS,
+        ) as r:
+            if r.status_code == HTTPStatus.NOT_MODIFIED:
+                self._notice(f"Server confirmed that file {filename} is still current.")
+                os.utime(filename)  # i.e. reset the countdown to the next download
+                return
+            r.raise_for_status()
 
-    def _import_from_file_into_database(self, filename):
-        self._notice(f"Importing popcon stats from file {filename}...")
-        with gzip.open(filename, "r") as f:
-            # NOTE: Corrupted data like b'texl\xb1\xdbv\xd2\xc7atex-extra' has been observed
-            #       in practice
-            content = f.read().decode("utf-8", errors="backslashreplace")
+            temp_filename = f"{filename}.tmp"
+            try:
+                with open(temp_filename, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(temp_filename, filename)  # i.e. atomically
+            except BaseException:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise
 
-        extractor = re.compile(
-            r"^[0-9]+\s+(?P<name>[^ ]+)\s+(?P<inst>[0-9]+)\s+(?P<vote>[0-9]+)\s+(?P<old>[0-9]+)\s+(?P<recent>[0-9]+)\s+(?P<nofiles>[0-9]+)"
-        )
+            self._save_validators(filename, r)
 
-        entries_to_classify: dict[str, dict[str, Any]] = {}
+    @staticmethod
+    def _checksum_of_decompressed_file(filename) -> str:
+        checksum = hashlib.sha256()
+        with gzip.open(filename, "rb") as f:
+            while chunk := f.read(_DOWNLOAD_CHUNK_SIZE):
+                checksum.update(chunk)
+        return checksum.hexdigest()
 
-        for line in content.split("\n"):
-            match = extractor.search(line.rstrip())
-            if match is None:
-                continue
+    @staticmethod
+    def _load_snapshot_header(filename) -> tuple[str | None, str]:
+        """
+        Returns the checksum of the file that the snapshot was taken from
+        and the scope of the import that took it
+        """
+        try:
+            with open(f"{filename}.snapshot") as f:
+                header = f.readline()
+        except OSError:
+            return None, _SNAPSHOT_SCOPE_ALL
+        if not header.startswith(_SNAPSHOT_HEADER_PREFIX):
+            return None, _SNAPSHOT_SCOPE_ALL
+        checksum, _, scope = header[len(_SNAPSHOT_HEADER_PREFIX) :].rstrip("\n").partition(" ")
+        return checksum, scope or _SNAPSHOT_SCOPE_ALL
 
-            stats = match.groupdict()
+    @staticmethod
+    def _load_snapshot(filename) -> dict[str, tuple[int, ...]]:
+        try:
+            with open(f"{filename}.snapshot") as f:
+                next(f)  # i.e. the header with the checksum
+                return {
+                    package_name: tuple(int(value) for value in values)
+                    for package_name, *values in (line.rstrip("\n").split("\t") for line in f)
+                }
+        except OSError, ValueError, StopIteration:
+            return {}
 
-            package_name = stats["name"]
-            if package_name == "Total":
-                continue
-            del stats["name"]
+    @staticmethod
+    def _save_snapshot(
+        filename, entries: dict[str, tuple[int, ...]], checksum: str, scope: str
+    ) -> None:
+        snapshot_filename = f"{filename}.snapshot"
+        temp_filename = f"{snapshot_filename}.tmp"
+        with open(temp_filename, "w") as f:
+            f.write(f"{_SNAPSHOT_HEADER_PREFIX}{checksum} {scope}\n")
+            for package_name in sorted(entries):
+                f.write("\t".join((package_name, *map(str, entries[package_name]))) + "\n")
+        os.replace(temp_filename, snapshot_filename)  # i.e. atomically
 
-            entries_to_classify[package_name] = stats
+    def _import_from_file_into_database(self, filename, scoped: bool = False):
+        scope = _SNAPSHOT_SCOPE_REFERENCED if scoped else _SNAPSHOT_SCOPE_ALL
+        checksum = self._checksum_of_decompressed_file(filename)
+        previous_checksum, previous_scope = self._load_snapshot_header(filename)
+        # NOTE: A snapshot of a scoped import does not tell what made it into the database
+        #       for packages outside of that scope, so it is of no use to a full import.
+        snapshot_usable = previous_scope == _SNAPSHOT_SCOPE_ALL or scoped
+        if snapshot_usable and checksum == previous_checksum:
+            self._notice(f"Skipping import of unchanged file {filename}.")
+            return
 
-        self._notice(f"Processing {len(entries_to_classify)} entries...")
+        self._notice(f"Importing popcon stats from file {filename}...")
+        # NOTE: Later lines win over earlier lines about the same package
+        #       (e.g. "zxing-cpp" has been seen twice in a row in practice).
+        entries: dict[str, tuple[int, ...]] = {
+            entry[0]: entry[1:] for entry in iterate_popcon_entries_in_file(filename)
+        }
 
-        existing_packages: set[str] = set(
-            DebianPopcon.objects.order_by("package").values_list("package", flat=True)
-        )
+        # NOTE: Entries that were imported before, unchanged, are not sent to the database
+        #       again.  The comparison is of entries, not of lines, because lines
+        #       change with every shift in rank.
+        previous_entries = self._load_snapshot(filename) if snapshot_usable else {}
+        entries_to_merge = {
+            package_name: stats
+            for package_name, stats in entries.items()
+            if previous_entries.get(package_name) != stats
+        }
+        del previous_entries
 
-        # Collecting existing entries to update
-        entries_to_update: list[DebianPopcon] = []
-        for entry in DebianPopcon.objects.iterator(chunk_size=_BATCH_SIZE):
-            if entry.package not in entries_to_classify:
-                continue
-
-            changed = False
-            for field_name, new_value in entries_to_classify[entry.package].items():
-                old_value = getattr(entry, field_name)
-                new_value = max(int(new_value), old_value or 0)
-                if new_value != old_value:
-                    changed = True
-                    setattr(entry, field_name, new_value)
-            if changed:
-                entries_to_update.append(entry)
-
-        # Update existing entries
-        if entries_to_update:
-            count_entries_left_to_update = len(entries_to_update)
-            self._notice(f"Updating {count_entries_left_to_update} stale existing entries...")
-            all_fields_but_primary_keys = [
-                f.name for f in DebianPopcon._meta.fields if not f.primary_key
-            ]
-            it = iter(entries_to_update)
-            while True:
-                entries = list(islice(it, 0, _BATCH_SIZE))
-                if not entries:
-                    break
-
-                self._notice(
-                    f"Updating next {min(_BATCH_SIZE, count_entries_left_to_update)} entries(s) of {count_entries_left_to_update} left to update..."
-                )
-                count_entries_left_to_update -= _BATCH_SIZE
-
-                DebianPopcon.objects.bulk_update(entries, fields=all_fields_but_primary_keys)
-                del entries
-            del entries_to_update
-        else:
-            self._notice("No stale entries to update.")
-
-        # Add missing entries
-        new_packages = set(entries_to_classify.keys()) - existing_packages
-        del existing_packages
-        if new_packages:
-            count_entries_left_to_add = len(new_packages)
-            self._notice(f"Adding {count_entries_left_to_add} new entries...")
-            entries_to_create: list[DebianPopcon] = [
-                DebianPopcon(package=package_name, **entries_to_classify[package_name])
-                for package_name in new_packages
-            ]
-            del entries_to_classify
+        if scoped:
+            # NOTE: Packages out of scope are still recorded in the snapshot,
+            #       which importdebbugs uses as a lookup for packages of new issues.
+            referenced_packages = set(
+                DebianWnpp.objects.values_list("popcon_id", flat=True).distinct()
+            )
+            entries_to_merge = {
+                package_name: stats
+                for package_name, stats in entries_to_merge.items()
+                if package_name in referenced_packages
+            }
+            del referenced_packages
 
-            it = iter(entries_to_create)
-            while True:
-                entries = list(islice(it, 0, _BATCH_SIZE))
-                if not entries:
-                    break
+        self._notice(f"Merging {len(entries_to_merge)} of {len(entries)} entries...")
+        with transaction.atomic(), connection.cursor() as cursor:
+            # NOTE: Temporary tables are never WAL-logged.  The table is dropped explicitly
+            #       rather than "ON COMMIT" because we may be part of an outer transaction.
+            cursor.execute("CREATE TEMPORARY TABLE debian_popcon_staging (LIKE debian_popcon)")
+            copy_rows_into(
+                cursor,
+                "debian_popcon_staging",
+                ("package",) + POPCON_FIELD_NAMES,
+                ((package_name,) + stats for package_name, stats in entries_to_merge.items()),
+            )
+            del entries_to_merge
 
-                self._notice(
-                    f"Adding next {min(_BATCH_SIZE, count_entries_left_to_add)} entries(s) of {count_entries_left_to_add} left to add..."
+            # NOTE: Values never decrease, and ``GREATEST`` ignores ``NULL`` of existing rows.
+            #       Rows that would not change are left alone.
+            cursor.execute("""
+                INSERT INTO debian_popcon AS p (package, inst, vote, old, recent, nofiles)
+                SELECT package, inst, vote, old, recent, nofiles FROM debian_popcon_staging
+                ON CONFLICT (package) DO UPDATE SET
+                    inst = GREATEST(EXCLUDED.inst, p.inst),
+                    vote = GREATEST(EXCLUDED.vote, p.vote),
+                    old = GREATEST(EXCLUDED.old, p.old),
+                    recent = GREATEST(EXCLUDED.recent, p.recent),
+                    nofiles = GREATEST(EXCLUDED.nofiles, p.nofiles)
+                WHERE (p.inst, p.vote, p.old, p.recent, p.nofiles) IS DISTINCT FROM (
+                    GREATEST(EXCLUDED.inst, p.inst),
+                    GREATEST(EXCLUDED.vote, p.vote),
+                    GREATEST(EXCLUDED.old, p.old),
+                    GREATEST(EXCLUDED.recent, p.recent),
+                    GREATEST(EXCLUDED.nofiles, p.nofiles)
                 )
-                count_entries_left_to_add -= _BATCH_SIZE
-
-                DebianPopcon.objects.bulk_create(entries)
-        else:
-            self._notice("No new entries to add.")
-
-    def _import_popcon_stats(self, maximum_stale_delta, download_cache_dir):
-        for url, category in (
-            (_SOURCE_PACKAGES_POPCON_URL, "source"),
-            (_BINARY_PACKAGES_POPCON_URL, "binary"),
-        ):
-            filename = os.path.join(download_cache_dir, f"popcon_{category}_by_inst.gz")
+                RETURNING xmax = 0
+            """)
+            inserted_flags = [inserted for (inserted,) in cursor.fetchall()]
+
+            cursor.execute("DROP TABLE debian_popcon_staging")
+
+            if scoped:
+                cursor.execute("""
+                    DELETE FROM debian_popcon p
+                    WHERE NOT EXISTS (SELECT 1 FROM debian_wnpp w WHERE w.project = p.package)
+                """)
+                if cursor.rowcount:
+                    self._notice(f"Removed {cursor.rowcount} entries not referenced by issues.")
+
+            count_issues_synced = sync_popcon_copies(cursor)
+
+        self._save_snapshot(filename, entries, checksum, scope)
+
+        count_added = sum(inserted_flags)
+        self._notice(f"Added {count_added} new entries.")
+        self._notice(f"Updated {len(inserted_flags) - count_added} stale existing entries.")
+        self._notice(f"Updated popcon stats of {count_issues_synced} issues.")
+
+    def _import_popcon_stats(self, maximum_stale_delta, download_cache_dir, scoped):
+        stale_downloads: list[tuple[str, str]] = []
+        come_back_ins: list[datetime.timedelta] = []
+        for category, url in _URL_OF_CATEGORY.items():
+            filename = popcon_filename(download_cache_dir, category)
             if os.path.exists(filename):
                 stats = os.stat(filename)
                 last_modified_delta = datetime.datetime.now() - datetime.datetime.fromtimestamp(
                     stats.st_mtime
                 )
                 if last_modified_delta < maximum_stale_delta:
-                    come_back_in = maximum_stale_delta - last_modified_delta
-                    come_back_at = datetime.datetime.now() + come_back_in
-                    self._notice(
-                        f"Nothing to do for {come_back_in} (hh:mm:ss) more (until {come_back_at})."
-                    )
-                    return
-                os.remove(filename)
+                    come_back_ins.append(maximum_stale_delta - last_modified_delta)
+                    continue
             else:
                 os.makedirs(os.path.dirname(filename), exist_ok=True)
+            stale_downloads.append((url, filename))
+
+        if not stale_downloads:
+            come_back_in = min(come_back_ins)
+            come_back_at = datetime.datetime.now() + come_back_in
+            self._notice(
+                f"Nothing to do for {come_back_in} (hh:mm:ss) more (until {come_back_at})."
+            )
+            return
+
+        # NOTE: Only the downloads run in parallel, all database access stays in this thread.
+        with ThreadPoolExecutor(max_workers=len(stale_downloads)) as executor:
+            downloaded_futures = [
+                executor.submit(self._download_url_to_disk, url, filename)
+                for url, filename in stale_downloads
+            ]
+
+            # NOTE: Files that the server confirmed to be current are imported, too,
+            #       in case their last import failed; if it did not, the checksum
+            #       of the snapshot makes the import skip them early.
+            for (_url, filename), downloaded_future in zip(
+                stale_downloads, downloaded_futures, strict=True
+            ):
+                downloaded_future.result()
+                self._import_from_file_into_database(filename, scoped=scoped)
 
-            self._download_url_to_disk(url, filename)
-            self._import_from_file_into_database(filename)
+    def add_arguments(self, parser):
+        parser.add_argument("--scoped", action="store_true")
 
     def handle(self, *args, **options):
         maximum_stale_delta = options.get("maximum_stale_delta", _DEFAULT_MAXIMUM_STALE_DELTA)
         download_cache_dir = options.get(
             "download_cache_dir", os.path.expanduser("~/.local/cache")
         )
-        self._import_popcon_stats(maximum_stale_delta, download_cache_dir)
+        scoped = options.get("scoped", False)
+        with sync_advisory_lock() as locked:
+            if not locked:
+                raise CommandError("Another sync is in progress, please try again later.")
+            self._import_popcon_stats(maximum_stale_delta, download_cache_dir, scoped)
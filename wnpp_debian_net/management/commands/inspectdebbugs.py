@@ -18,7 +18,7 @@ class Command(BaseCommand):
         client = DebbugsWnppClient()
         client.connect()
 
-        properties_of_issue = client.fetch_issues(options["issue_ids"])
+        properties_of_issue = dict(client.fetch_issues(options["issue_ids"]))
 
         # NOTE: We're avoiding ``json.dump(.., self.stdout, ..)`` because
         #       ``BaseCommand.stdout`` is duplicating newlines in
@@ -0,0 +1,105 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import datetime
+import signal
+import threading
+import time
+from typing import Any
+
+import sentry_sdk
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...debbugs import DebbugsWnppClient, PooledHttpTransport
+from ._common import ReportingMixin, sync_advisory_lock
+from .importdebbugs import _DEFAULT_MAX_REQUESTS_IN_FLIGHT
+
+_LOCK_RETRY_DELAY = datetime.timedelta(minutes=1)
+
+
+class _Job:
+    def __init__(
+        self, interval: datetime.timedelta, command_name: str, *args: str, **options: Any
+    ):
+        self.name = " ".join((command_name,) + args)
+        self.interval = interval
+        self.command_name = command_name
+        self.args = args
+        self.options = options
+        self.next_run_at = time.monotonic()  # i.e. right away
+
+
+class Command(ReportingMixin, BaseCommand):
+    help = "Keep the local database in sync with Debbugs and popcon as a single resident process"
+
+    def _create_jobs(self) -> list[_Job]:
+        return [
+            _Job(datetime.timedelta(days=1), "truncatechangelog"),
+            _Job(datetime.timedelta(hours=1), "importdebbugs", client=self._client),
+            _Job(datetime.timedelta(minutes=5), "importdebbugs", "--quick", client=self._client),
+            _Job(datetime.timedelta(hours=6), "importpopcon"),
+        ]
+
+    @staticmethod
+    def _ensure_usable_database_connection() -> None:
+        # NOTE: The connection is kept open in between jobs, unless it broke
+        #       (e.g. due to a restart of PostgreSQL), in which case Django will reconnect.
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+    def _run(self, job: _Job) -> bool:
+        self._ensure_usable_database_connection()
+
+        with sync_advisory_lock() as locked:
+            if not locked:
+                self._notice(f"Skipping {job.name!r} for now, another sync is in progress.")
+                return False
+
+            self._notice(f"Running {job.name!r}...")
+            try:
+                call_command(
+                    job.command_name,
+                    *job.args,
+                    stdout=self.stdout,
+                    stderr=self.stderr,
+                    **job.options,
+                )
+            except Exception as e:  # i.e. one failing job should not take down the others
+                self._error(f"Job {job.name!r} failed: {e}")
+                sentry_sdk.capture_exception(e)
+            return True
+
+    def _handle_sigterm(self, _signum, _frame) -> None:
+        if self._stopping.is_set():
+            raise KeyboardInterrupt  # i.e. abort the current job, too
+
+        self._notice("Stopping after the current job (send SIGTERM again to abort it)...")
+        self._stopping.set()
+
+    def handle(self, *args, **options):
+        self._stopping = threading.Event()
+        previous_sigterm_handler = signal.signal(signal.SIGTERM, self._handle_sigterm)
+
+        # NOTE: A single client (with a pool of HTTP connections) is used for all runs.
+        self._client = options.get("client") or DebbugsWnppClient(
+            transport=PooledHttpTransport(pool_size=_DEFAULT_MAX_REQUESTS_IN_FLIGHT)
+        )
+        jobs = self._create_jobs()
+
+        try:
+            while not self._stopping.is_set():
+                job = min(jobs, key=lambda j: j.next_run_at)
+                if self._stopping.wait(timeout=max(0.0, job.next_run_at - time.monotonic())):
+                    break
+
+                started = time.monotonic()
+                if self._run(job):
+                    job.next_run_at = started + job.interval.total_seconds()
+                else:
+                    job.next_run_at = started + _LOCK_RETRY_DELAY.total_seconds()
+        finally:
+            signal.signal(signal.SIGTERM, previous_sigterm_handler)
+
+        self._success("Stopped.")
@@ -1,24 +1,53 @@
 # Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
 # Licensed under GNU Affero GPL v3 or later
 
+import argparse
 import datetime
+import json
+import os
+import threading
 from io import StringIO
-from unittest.mock import Mock
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
 
-from django.test import TestCase
+from django.core.management import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.utils.timezone import now
 
-from ....debbugs import IssueProperty
-from ....models import DebianWnpp, IssueKind
+from ....debbugs import DebbugsRequestError, DebbugsWnppClient, IssueProperty
+from ....models import (
+    DebianLogIndex,
+    DebianLogMods,
+    DebianPopcon,
+    DebianWnpp,
+    EventKind,
+    IssueKind,
+)
+from ....popcon import popcon_filename
 from ....tests.factories import DebianWnppFactory
-from ..importdebbugs import Command
+from .._checkpoint import Checkpoint, Phase
+from .._common import SYNC_ADVISORY_LOCK_KEY
+from .._pipeline import AdaptiveBatchSize, Prefetcher
+from .._shards import parse_shard
+from ..importdebbugs import _MAXIMUM_REFRESH_INTERVAL, _MINIMUM_REFRESH_INTERVAL, Command
 
 
 def _create_mock_debbugs_wnpp_client(issue_ids, properties_of_issues):
-    return Mock(
-        fetch_ids_of_issues_with_status=Mock(return_value=issue_ids),
-        fetch_issues=Mock(return_value=properties_of_issues),
-    )
+    # NOTE: Only the methods doing actual SOAP requests are mocked
+    #       so that e.g. ``.fetch_issues_concurrently`` is covered, too
+    client = DebbugsWnppClient()
+    client.connect = Mock()
+    client.fetch_ids_of_issues_with_status = Mock(return_value=issue_ids)
+    client.fetch_issues = Mock(return_value=properties_of_issues)
+    return client
+
+
+def _write_popcon_snapshots(cache_dir, lines_of_category: dict[str, list[str]]):
+    for category, lines in lines_of_category.items():
+        with open(f"{popcon_filename(cache_dir, category)}.snapshot", "w") as f:
+            f.write("# sha256 0123456789abcdef all\n")  # i.e. arbitrary checksum
+            f.writelines(f"{line}\n" for line in lines)
 
 
 def _create_wnpp_issue_subject(issue_kind: IssueKind, package_name: str, description):
@@ -45,9 +74,12 @@ class InspectDebbugsCommandTest(TestCase):
             for issue_id in self.issue_ids
         }
         self.mock_client = _create_mock_debbugs_wnpp_client(self.issue_ids, properties_of_issues)
+        self.popcon_snapshot_lines_of_category = {}
 
-    def _invoke_command(self):
-        self.command.handle(client=self.mock_client)
+    def _invoke_command(self, **options):
+        with TemporaryDirectory() as tempdir:
+            _write_popcon_snapshots(tempdir, self.popcon_snapshot_lines_of_category)
+            self.command.handle(client=self.mock_client, cache_dir=tempdir, **options)
 
     def test_addition(self):
         self.assertEqual(DebianWnpp.objects.filter(description=self.magic_description).count(), 0)
@@ -65,6 +97,12 @@ class InspectDebbugsCommandTest(TestCase):
 
         with self.assertRaises(DebianWnpp.DoesNotExist):
             issue_that_was_closed_remotely.refresh_from_db()
+        self.assertEqual(
+            list(
+                DebianLogIndex.objects.filter(event=EventKind.CLOSED).values_list("ident", "kind")
+            ),
+            [(issue_that_was_closed_remotely.ident, issue_that_was_closed_remotely.kind)],
+        )
 
     def test_updating(self):
         a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
@@ -73,7 +111,7 @@ class InspectDebbugsCommandTest(TestCase):
                 ident=issue_id,
                 kind=IssueKind.values[i],
                 description="will be updated",
-                cron_stamp=a_long_time_ago,
+                next_refresh_at=a_long_time_ago,
             )
             for i, issue_id in enumerate(self.issue_ids)
         ]
@@ -84,3 +122,680 @@ class InspectDebbugsCommandTest(TestCase):
             issue.refresh_from_db()
             self.assertEqual(issue.description, self.magic_description)
             self.assertEqual(issue.kind, self.issue_kind.value)
+
+    def test_remote_change_interval_smoothed(self):
+        for issue_id in self.issue_ids:
+            DebianWnppFactory(
+                ident=issue_id,
+                mod_stamp=now() - datetime.timedelta(days=10),
+                remote_change_interval=datetime.timedelta(days=30),
+                next_refresh_at=now() - datetime.timedelta(days=1),  # i.e. stale
+            )
+
+        self._invoke_command()
+
+        for change_interval in DebianWnpp.objects.values_list("remote_change_interval", flat=True):
+            self.assertAlmostEqual(
+                change_interval,
+                datetime.timedelta(days=20),  # i.e. between 10 days observed and 30 days before
+                delta=datetime.timedelta(minutes=1),
+            )
+
+    def test_unchanged_issues_only_touched(self):
+        self._invoke_command()
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        DebianWnpp.objects.update(cron_stamp=a_long_time_ago, next_refresh_at=a_long_time_ago)
+        DebianLogIndex.objects.all().delete()
+
+        self._invoke_command()
+
+        self.assertFalse(DebianLogIndex.objects.exists())
+        self.assertFalse(DebianWnpp.objects.filter(cron_stamp=a_long_time_ago).exists())
+        self.assertFalse(DebianWnpp.objects.filter(next_refresh_at__lte=now()).exists())
+
+    def test_popcon_stats_of_new_packages_from_snapshots(self):
+        self.popcon_snapshot_lines_of_category = {
+            "binary": ["aaa\t9\t9\t9\t9\t9", "package1\t5\t4\t3\t2\t1"],
+            "source": ["package1\t7\t1\t1\t1\t1", "zzz\t9\t9\t9\t9\t9"],
+        }
+
+        self._invoke_command()
+
+        self.assertEqual(
+            list(DebianPopcon.objects.values()),
+            [{"package": "package1", "inst": 7, "vote": 4, "old": 3, "recent": 2, "nofiles": 1}],
+        )
+        self.assertEqual(
+            set(DebianWnpp.objects.values_list("popcon_inst", "popcon_vote")), {(7, 4)}
+        )
+
+    def test_refused_while_locked_elsewhere(self):
+        other_connection = connection.copy()
+        self.addCleanup(other_connection.close)
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+
+        with self.assertRaises(CommandError):
+            self._invoke_command()
+
+        self.mock_client.fetch_ids_of_issues_with_status.assert_not_called()
+
+
+class UpsertModeTest(InspectDebbugsCommandTest):
+    def _invoke_command(self, **options):
+        super()._invoke_command(upsert=True, **options)
+
+    def test_logging(self):
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        changed_issue = DebianWnppFactory(
+            ident=self.issue_ids[0], kind=IssueKind.RFP, next_refresh_at=a_long_time_ago
+        )
+
+        self._invoke_command()
+
+        self.assertEqual(
+            sorted(DebianLogIndex.objects.values_list("ident", "event")),
+            [
+                (changed_issue.ident, EventKind.MODIFIED),
+                *((ident, EventKind.OPENED) for ident in self.issue_ids[1:]),
+            ],
+        )
+        self.assertEqual(
+            list(DebianLogMods.objects.values_list("log__ident", "old_kind", "new_kind")),
+            [(changed_issue.ident, IssueKind.RFP, self.issue_kind)],
+        )
+
+
+class QuickModeTest(TestCase):
+    def test_only_new_and_closed_issues_handled(self):
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        stale_issue = DebianWnppFactory(
+            ident=1, description="not updated", next_refresh_at=a_long_time_ago
+        )
+        closed_issue = DebianWnppFactory(ident=3)
+        properties_of_issues = {
+            2: {
+                IssueProperty.DATE.value: now().timestamp(),  # arbitrary
+                IssueProperty.LAST_MODIFIED.value: now().timestamp(),  # arbitrary
+                IssueProperty.SUBJECT.value: _create_wnpp_issue_subject(
+                    IssueKind.ITP, "package1", "new"
+                ),
+            },
+        }
+        mock_client = _create_mock_debbugs_wnpp_client([1, 2], properties_of_issues)
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(client=mock_client, cache_dir=tempdir, quick=True)
+
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", "description")),
+            [(1, "not updated"), (2, "new")],
+        )
+        with self.assertRaises(DebianWnpp.DoesNotExist):
+            closed_issue.refresh_from_db()
+        stale_issue.refresh_from_db()
+        self.assertEqual(stale_issue.next_refresh_at, a_long_time_ago)
+        self.assertEqual([call.args[0] for call in mock_client.fetch_issues.call_args_list], [[2]])
+
+
+class ShardingTest(TestCase):
+    def setUp(self):
+        self.issue_ids = [1, 2, 3, 4]  # arbitrary
+        self.properties_of_issues = {
+            issue_id: {
+                IssueProperty.DATE.value: now().timestamp(),  # arbitrary
+                IssueProperty.LAST_MODIFIED.value: now().timestamp(),  # arbitrary
+                IssueProperty.SUBJECT.value: _create_wnpp_issue_subject(
+                    IssueKind.ITP, f"package{issue_id}", "arbitrary"
+                ),
+            }
+            for issue_id in self.issue_ids
+        }
+        self.mock_client = _create_mock_debbugs_wnpp_client(self.issue_ids, {})
+        self.mock_client.fetch_issues = Mock(
+            side_effect=lambda issue_ids, properties=None: {
+                i: self.properties_of_issues[i] for i in issue_ids
+            }
+        )
+        self.issue_closed_remotely = DebianWnppFactory(
+            ident=9, next_refresh_at=now() + datetime.timedelta(hours=1)
+        )
+
+    def _invoke_command(self, **options):
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(
+                client=self.mock_client, cache_dir=tempdir, **options
+            )
+
+    def testparse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for text in ("4/4", "-1/4", "2", "two/4"):
+            with self.subTest(text=text), self.assertRaises(argparse.ArgumentTypeError):
+                parse_shard(text)
+
+    def test_worker(self):
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        DebianWnppFactory(ident=4, description="not updated", next_refresh_at=a_long_time_ago)
+        DebianWnppFactory(ident=5, description="to be updated", next_refresh_at=a_long_time_ago)
+        self.properties_of_issues[5] = self.properties_of_issues[3]
+
+        self._invoke_command(shard=(1, 2))
+
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", "description")),
+            [(1, "arbitrary"), (3, "arbitrary"), (4, "not updated"), (5, "arbitrary"), (9, None)],
+        )
+
+    def test_worker_runs_under_lock_of_coordinator(self):
+        other_connection = connection.copy()
+        self.addCleanup(other_connection.close)
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+
+        self._invoke_command(shard=(0, 2))
+
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", flat=True)), [2, 4, 9]
+        )
+
+    def test_worker_with_ids_from_coordinator(self):
+        with TemporaryDirectory() as tempdir:
+            ids_filename = os.path.join(tempdir, "ids.json")
+            with open(ids_filename, "w") as f:
+                json.dump([2, 4], f)
+
+            self._invoke_command(shard=(0, 2), ids_filename=ids_filename)
+
+        self.mock_client.fetch_ids_of_issues_with_status.assert_not_called()
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", flat=True)), [2, 4, 9]
+        )
+
+    def test_worker_not_resuming_checkpoint_for_other_ids_from_coordinator(self):
+        with TemporaryDirectory() as tempdir:
+            checkpoint = Checkpoint(
+                os.path.join(tempdir, "importdebbugs_regular_checkpoint_shard_0_of_2.json"),
+                mode="regular",
+            )
+            checkpoint.start([2])
+            checkpoint.begin(Phase.STALE)
+            ids_filename = os.path.join(tempdir, "ids.json")
+            with open(ids_filename, "w") as f:
+                json.dump([2, 4], f)
+
+            Command(stdout=StringIO()).handle(
+                client=self.mock_client,
+                cache_dir=tempdir,
+                shard=(0, 2),
+                ids_filename=ids_filename,
+            )
+
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", flat=True)), [2, 4, 9]
+        )
+
+    @patch("wnpp_debian_net.management.commands._shards.subprocess.Popen")
+    def test_coordinator(self, popen_mock):
+        popen_mock.return_value.wait.return_value = 0
+
+        self._invoke_command(count_shards=2)
+
+        with self.assertRaises(DebianWnpp.DoesNotExist):
+            self.issue_closed_remotely.refresh_from_db()
+        self.mock_client.fetch_issues.assert_not_called()
+        shard_args = [
+            [arg for arg in call.args[0] if arg.startswith("--shard=")]
+            for call in popen_mock.call_args_list
+        ]
+        self.assertEqual(shard_args, [["--shard=0/2"], ["--shard=1/2"]])
+
+    @patch("wnpp_debian_net.management.commands._shards.subprocess.Popen")
+    def test_coordinator_leaves_checkpoint_of_regular_run_alone(self, popen_mock):
+        popen_mock.return_value.wait.return_value = 0
+
+        with TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "importdebbugs_regular_checkpoint.json")
+            Checkpoint(filename, mode="regular").start([1, 2, 3])
+            with open(filename) as f:
+                checkpoint_before = f.read()
+
+            Command(stdout=StringIO()).handle(
+                client=self.mock_client, cache_dir=tempdir, count_shards=2
+            )
+
+            with open(filename) as f:
+                self.assertEqual(f.read(), checkpoint_before)
+
+    @patch("wnpp_debian_net.management.commands._shards.subprocess.Popen")
+    def test_coordinator_with_failing_worker(self, popen_mock):
+        popen_mock.return_value.wait.return_value = 1
+
+        with self.assertRaises(CommandError):
+            self._invoke_command(count_shards=2)
+
+
+class ConcurrentShardsTest(TransactionTestCase):
+    def test_new_package_shared_across_shards(self):
+        properties_of_issues = {
+            issue_id: {
+                IssueProperty.DATE.value: now().timestamp(),  # arbitrary
+                IssueProperty.LAST_MODIFIED.value: now().timestamp(),  # arbitrary
+                IssueProperty.SUBJECT.value: _create_wnpp_issue_subject(
+                    IssueKind.ITP, "package1", "arbitrary"
+                ),
+            }
+            for issue_id in (1, 2)
+        }
+        barrier = threading.Barrier(2, timeout=10)
+        original_create_missing_pocons_for = Command._create_missing_pocons_for
+        errors = []
+
+        def create_missing_pocons_in_lockstep(command, package_names):
+            popcons = original_create_missing_pocons_for(command, package_names)
+            barrier.wait()  # i.e. until both shards consider the package missing
+            return popcons
+
+        def run_shard(index: int):
+            mock_client = _create_mock_debbugs_wnpp_client([1, 2], {})
+            mock_client.fetch_issues = Mock(
+                side_effect=lambda issue_ids, properties=None: {
+                    i: properties_of_issues[i] for i in issue_ids
+                }
+            )
+            try:
+                with TemporaryDirectory() as tempdir:
+                    Command(stdout=StringIO()).handle(
+                        client=mock_client, cache_dir=tempdir, shard=(index, 2)
+                    )
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with patch.object(
+            Command, "_create_missing_pocons_for", create_missing_pocons_in_lockstep
+        ):
+            threads = [threading.Thread(target=run_shard, args=(index,)) for index in (0, 1)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("ident", "popcon_id")),
+            [(1, "package1"), (2, "package1")],
+        )
+
+
+class BootstrapModeTest(TestCase):
+    def setUp(self):
+        self.issue_ids = [1, 2]  # arbitrary
+        properties_of_issues = {
+            issue_id: {
+                IssueProperty.DATE.value: now().timestamp(),  # arbitrary
+                IssueProperty.LAST_MODIFIED.value: now().timestamp(),  # arbitrary
+                IssueProperty.SUBJECT.value: _create_wnpp_issue_subject(
+                    IssueKind.RFP,
+                    f"package{issue_id}",
+                    "Tab\tand back\\slash",  # i.e. in need of escaping
+                ),
+            }
+            for issue_id in self.issue_ids
+        }
+        self.mock_client = _create_mock_debbugs_wnpp_client(self.issue_ids, properties_of_issues)
+
+    def _invoke_command(self):
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(
+                client=self.mock_client, cache_dir=tempdir, bootstrap=True
+            )
+
+    def test_addition(self):
+        self._invoke_command()
+
+        self.assertEqual(
+            list(
+                DebianWnpp.objects.order_by("ident").values_list("ident", "popcon", "description")
+            ),
+            [
+                (1, "package1", "Tab\tand back\\slash"),
+                (2, "package2", "Tab\tand back\\slash"),
+            ],
+        )
+        self.assertEqual(
+            sorted(DebianLogIndex.objects.values_list("ident", "event")),
+            [(1, EventKind.OPENED), (2, EventKind.OPENED)],
+        )
+        self.assertEqual(
+            sorted(DebianPopcon.objects.values_list("package", flat=True)),
+            ["package1", "package2"],
+        )
+
+    def test_popcon_stats_of_new_packages_from_snapshots(self):
+        with TemporaryDirectory() as tempdir:
+            _write_popcon_snapshots(tempdir, {"binary": ["package2\t5\t4\t3\t2\t1"]})
+            Command(stdout=StringIO()).handle(
+                client=self.mock_client, cache_dir=tempdir, bootstrap=True
+            )
+
+        self.assertEqual(
+            list(DebianPopcon.objects.order_by("package").values_list("package", "inst")),
+            [("package1", None), ("package2", 5)],
+        )
+        self.assertEqual(
+            list(DebianWnpp.objects.order_by("ident").values_list("popcon_inst", "popcon_vote")),
+            [(0, 0), (5, 4)],
+        )
+
+    def test_refused_for_non_empty_database(self):
+        DebianWnppFactory()
+
+        with self.assertRaises(CommandError):
+            self._invoke_command()
+
+
+class StaleIssuePaginationTest(TestCase):
+    @patch("wnpp_debian_net.management.commands.importdebbugs._STALE_PAGE_SIZE", 2)
+    def test_keyset_pagination(self):
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        same_time = a_long_time_ago + datetime.timedelta(days=1)
+        for ident, next_refresh_at in (
+            (5, same_time),
+            (3, same_time),
+            (4, a_long_time_ago),
+            (1, same_time),
+            (2, now() + datetime.timedelta(hours=1)),  # i.e. not stale
+        ):
+            DebianWnppFactory(ident=ident, next_refresh_at=next_refresh_at)
+
+        pages = list(Command(stdout=StringIO())._iterate_pages_of_stale_issue_ids(now()))
+
+        self.assertEqual(pages, [[4, 1], [3, 5]])
+
+    @patch("wnpp_debian_net.management.commands.importdebbugs._STALE_PAGE_SIZE", 2)
+    def test_single_pipeline_across_pages(self):
+        issue_ids = range(5)
+        properties_of_issues = {
+            issue_id: {
+                IssueProperty.DATE.value: now().timestamp(),  # arbitrary
+                IssueProperty.LAST_MODIFIED.value: now().timestamp(),  # arbitrary
+                IssueProperty.SUBJECT.value: "ITP: package1 -- updated",
+            }
+            for issue_id in issue_ids
+        }
+        a_long_time_ago = now() - datetime.timedelta(days=5000)  # arbitrary
+        for issue_id in issue_ids:
+            DebianWnppFactory(ident=issue_id, next_refresh_at=a_long_time_ago)
+
+        with (
+            patch(
+                "wnpp_debian_net.management.commands.importdebbugs.Prefetcher", wraps=Prefetcher
+            ) as prefetcher_mock,
+            TemporaryDirectory() as tempdir,
+        ):
+            Command(stdout=StringIO()).handle(
+                client=_create_mock_debbugs_wnpp_client(issue_ids, properties_of_issues),
+                cache_dir=tempdir,
+            )
+
+        self.assertEqual(prefetcher_mock.call_count, 2)  # i.e. one for phase 2, one for phase 3
+        self.assertEqual(
+            set(DebianWnpp.objects.values_list("description", flat=True)), {"updated"}
+        )
+
+
+class NextRefreshAtTest(SimpleTestCase):
+    def _interval_for_dust(
+        self, dust: datetime.timedelta, change_interval: datetime.timedelta | None = None
+    ) -> datetime.timedelta:
+        before = now()
+        return Command._next_refresh_at(before - dust, change_interval) - before
+
+    def test_recently_modified_issues_refreshed_often(self):
+        self.assertAlmostEqual(
+            self._interval_for_dust(datetime.timedelta(minutes=5)),
+            _MINIMUM_REFRESH_INTERVAL,
+            delta=datetime.timedelta(seconds=5),
+        )
+
+    def test_grows_with_dust(self):
+        self.assertAlmostEqual(
+            self._interval_for_dust(datetime.timedelta(days=10)),
+            datetime.timedelta(days=1),
+            delta=datetime.timedelta(seconds=5),
+        )
+
+    def test_shortened_for_frequent_changes(self):
+        self.assertAlmostEqual(
+            self._interval_for_dust(
+                datetime.timedelta(days=40), change_interval=datetime.timedelta(days=10)
+            ),
+            datetime.timedelta(days=2),  # rather than 4 days for the dust alone
+            delta=datetime.timedelta(seconds=5),
+        )
+
+    def test_lengthened_for_rare_changes(self):
+        self.assertAlmostEqual(
+            self._interval_for_dust(
+                datetime.timedelta(days=10), change_interval=datetime.timedelta(days=40)
+            ),
+            datetime.timedelta(days=2),  # rather than 1 day for the dust alone
+            delta=datetime.timedelta(seconds=5),
+        )
+
+    def test_upper_bound(self):
+        self.assertAlmostEqual(
+            self._interval_for_dust(datetime.timedelta(days=5000)),
+            _MAXIMUM_REFRESH_INTERVAL,
+            delta=datetime.timedelta(seconds=5),
+        )
+
+
+class AdaptiveBatchSizeTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.filename = os.path.join(tempdir.name, "nested", "batch_size.json")
+
+    def test_grows_while_fast(self):
+        batch_size = AdaptiveBatchSize(self.filename)
+        self.assertEqual(batch_size.size, AdaptiveBatchSize.DEFAULT)
+
+        batch_size.adjust(batch_size.size, seconds_taken=1.0, count_attempts=1)
+
+        self.assertGreater(batch_size.size, AdaptiveBatchSize.DEFAULT)
+
+    def test_shrinks_when_slow(self):
+        batch_size = AdaptiveBatchSize(self.filename)
+
+        batch_size.adjust(
+            100, seconds_taken=AdaptiveBatchSize.TARGET_SECONDS * 2, count_attempts=1
+        )
+
+        self.assertEqual(batch_size.size, 50)
+
+    def test_shrinks_after_retry(self):
+        batch_size = AdaptiveBatchSize(self.filename)
+
+        batch_size.adjust(100, seconds_taken=1.0, count_attempts=2)
+
+        self.assertEqual(batch_size.size, 50)
+
+    def test_last_good_size_persisted(self):
+        batch_size = AdaptiveBatchSize(self.filename)
+        batch_size.adjust(100, seconds_taken=1.0, count_attempts=1)
+        batch_size.adjust(batch_size.size, seconds_taken=1.0, count_attempts=1)
+        batch_size.adjust(batch_size.size, seconds_taken=1.0, count_attempts=3)
+        batch_size.save()
+
+        self.assertEqual(AdaptiveBatchSize(self.filename).size, 125)
+        self.assertEqual(os.listdir(os.path.dirname(self.filename)), ["batch_size.json"])
+
+
+class CheckpointTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.filename = os.path.join(tempdir.name, "nested", "checkpoint.json")
+        self.window = datetime.timedelta(minutes=5)  # arbitrary
+
+    def test_watermark_lags_behind_out_of_order_commits(self):
+        checkpoint = Checkpoint(self.filename, mode="regular")
+        checkpoint.start([5, 1, 2, 3, 4])
+        checkpoint.begin(Phase.ADD, [1, 2, 3, 4, 5])
+
+        checkpoint.commit([3, 4])
+        self.assertIsNone(checkpoint.last_ident)
+        checkpoint.commit([1, 2])
+        self.assertEqual(checkpoint.last_ident, 4)
+
+        resumed = Checkpoint(self.filename, mode="regular")
+        self.assertTrue(resumed.load([1, 2, 3, 4, 5], max_age=self.window))
+        self.assertTrue(resumed.has_completed(Phase.CLOSE))
+        self.assertFalse(resumed.has_completed(Phase.ADD))
+        self.assertEqual(resumed.begin(Phase.ADD, [1, 2, 3, 4, 5]), [5])
+
+    def test_not_resumed_after_window(self):
+        Checkpoint(self.filename, mode="regular").start([1, 2, 3])
+
+        self.assertFalse(
+            Checkpoint(self.filename, mode="regular").load(
+                [1, 2, 3], max_age=datetime.timedelta(0)
+            )
+        )
+
+    def test_not_resumed_for_other_mode(self):
+        Checkpoint(self.filename, mode="regular").start([1, 2, 3])
+
+        self.assertFalse(
+            Checkpoint(self.filename, mode="upsert").load([1, 2, 3], max_age=self.window)
+        )
+
+    def test_not_resumed_for_other_remote_issues(self):
+        Checkpoint(self.filename, mode="regular").start([1, 2, 3])
+
+        self.assertFalse(
+            Checkpoint(self.filename, mode="regular").load([1, 2, 4], max_age=self.window)
+        )
+
+    def test_not_resumed_with_corrupt_file(self):
+        Checkpoint(self.filename, mode="regular").start([1, 2, 3])
+        with open(self.filename) as f:
+            doc = json.load(f)
+        del doc["digest"]
+        with open(self.filename, "w") as f:
+            json.dump(doc, f)
+
+        self.assertFalse(
+            Checkpoint(self.filename, mode="regular").load([1, 2, 3], max_age=self.window)
+        )
+
+
+class InterruptionTest(TestCase):
+    def test_pending_retries_cancelled(self):
+        attempted = threading.Event()
+        attempt_threads = []
+
+        def fetch_issues(issue_ids, properties=None):
+            attempt_threads.append(threading.current_thread())
+            attempted.set()
+            raise DebbugsRequestError("arbitrary")
+
+        def iterate_until_interrupted(_prefetcher):
+            attempted.wait(timeout=5)  # i.e. until the batch is in back-off
+            raise KeyboardInterrupt
+            yield
+
+        client = _create_mock_debbugs_wnpp_client([1], {})
+        client.fetch_issues = fetch_issues
+
+        with (
+            patch.object(Prefetcher, "__iter__", iterate_until_interrupted),
+            TemporaryDirectory() as tempdir,
+            self.assertRaises(SystemExit),
+        ):
+            Command(stdout=StringIO()).handle(client=client, cache_dir=tempdir)
+
+        [thread] = attempt_threads
+        thread.join(timeout=5)  # rather than minutes of back-off
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(attempt_threads), 1)
+
+
+class ResumptionTest(TestCase):
+    def _invoke_command_after_checkpoint_for(self, ids_of_remote_open_issues: list[int]):
+        self.mock_client = _create_mock_debbugs_wnpp_client([1, 2], {})
+
+        with TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "importdebbugs_regular_checkpoint.json")
+            checkpoint = Checkpoint(filename, mode="regular")
+            checkpoint.start(ids_of_remote_open_issues)
+            checkpoint.begin(Phase.STALE)
+
+            Command(stdout=StringIO()).handle(client=self.mock_client, cache_dir=tempdir)
+
+            self.assertFalse(os.path.exists(filename))
+
+        self.assertEqual(self.mock_client.fetch_ids_of_issues_with_status.call_count, 2)
+
+    def test_done_phases_skipped_for_same_remote_issues(self):
+        issue_not_closed_again = DebianWnppFactory(ident=3)
+
+        self._invoke_command_after_checkpoint_for([1, 2])
+
+        issue_not_closed_again.refresh_from_db()  # i.e. phase "close" was not re-run
+
+    def test_started_afresh_for_other_remote_issues(self):
+        issue_closed_remotely = DebianWnppFactory(ident=3)
+
+        self._invoke_command_after_checkpoint_for([1, 2, 3])
+
+        with self.assertRaises(DebianWnpp.DoesNotExist):
+            issue_closed_remotely.refresh_from_db()
+
+
+class PrefetcherTest(SimpleTestCase):
+    def test_items_in_order(self):
+        with Prefetcher(iter(range(10)), max_prefetched=2) as prefetcher:
+            self.assertEqual(list(prefetcher), list(range(10)))
+
+    def test_error_propagation(self):
+        def source():
+            yield 1
+            raise ValueError("arbitrary")
+
+        with Prefetcher(source(), max_prefetched=2) as prefetcher:
+            it = iter(prefetcher)
+            self.assertEqual(next(it), 1)
+            with self.assertRaises(ValueError):
+                next(it)
+
+    def test_run_in_consumer(self):
+        consumer_thread = threading.current_thread()
+
+        def source():
+            yield prefetcher.run_in_consumer(threading.current_thread)
+            yield 2
+
+        prefetcher = Prefetcher(source(), max_prefetched=2)
+        with prefetcher:
+            self.assertEqual(list(prefetcher), [consumer_thread, 2])
+
+    def test_source_closed_when_consumer_fails(self):
+        source_closed = threading.Event()
+
+        def source():
+            try:
+                yield from range(1000)
+            finally:
+                source_closed.set()
+
+        with self.assertRaises(KeyboardInterrupt):
+            with Prefetcher(source(), max_prefetched=2) as prefetcher:
+                for _ in prefetcher:
+                    raise KeyboardInterrupt
+
+        self.assertTrue(source_closed.wait(timeout=5))
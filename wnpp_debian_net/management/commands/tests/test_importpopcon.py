@@ -2,20 +2,33 @@
 # Licensed under GNU Affero GPL v3 or later
 
 import gzip
+import json
+import os
 from datetime import timedelta
 from http import HTTPStatus
 from importlib import resources
 from io import StringIO
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
+import requests
 import responses
+from django.core.management import CommandError
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from responses import matchers
 
 from wnpp_debian_net.models import DebianPopcon
-from wnpp_debian_net.tests.factories import DebianPopconFactory
+from wnpp_debian_net.popcon import PopconLookup
+from wnpp_debian_net.tests.factories import DebianPopconFactory, DebianWnppFactory
 
 from .. import tests
-from ..importpopcon import _BINARY_PACKAGES_POPCON_URL, _SOURCE_PACKAGES_POPCON_URL, Command
+from .._common import SYNC_ADVISORY_LOCK_KEY
+from ..importpopcon import (
+    _BINARY_PACKAGES_POPCON_URL,
+    _SOURCE_PACKAGES_POPCON_URL,
+    Command,
+)
 
 
 class ImportPopconCommandTest(TestCase):
@@ -56,10 +69,10 @@ class ImportPopconCommandTest(TestCase):
             .values()
         )
 
-    def _add_response(self, url, body_basename):
+    def _add_response(self, url, body_basename, headers=None):
         path = resources.files(tests.__name__).joinpath("popcon_test_data", body_basename)
         body = gzip.compress(path.read_bytes())
-        responses.add(responses.GET, url, body=body, status=HTTPStatus.OK)
+        responses.add(responses.GET, url, body=body, status=HTTPStatus.OK, headers=headers)
 
     @responses.activate
     def test_addition(self):
@@ -86,6 +99,115 @@ class ImportPopconCommandTest(TestCase):
 
         self.assertEqual(self._get_actual_values_from_database(), self.expected_values)
 
+    @responses.activate
+    def test_values_never_decrease(self):
+        self._setup()
+        DebianPopconFactory(package="dpkg", inst=999999, vote=None, old=1590, recent=1, nofiles=0)
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+
+        self.assertEqual(
+            DebianPopcon.objects.filter(package="dpkg").values()[0],
+            {
+                "package": "dpkg",
+                "inst": 999999,
+                "vote": 188471,
+                "old": 1590,
+                "recent": 14877,
+                "nofiles": 26,
+            },
+        )
+
+    @responses.activate
+    def test_unchanged_file_skips_import(self):
+        self._setup()
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+            DebianPopcon.objects.all().delete()
+            stdout = StringIO()
+
+            Command(stdout=stdout).handle(
+                download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+            )
+
+        self.assertEqual(stdout.getvalue().count("Skipping import of unchanged file"), 2)
+        self.assertFalse(DebianPopcon.objects.exists())  # i.e. no import
+
+    @responses.activate
+    def test_only_changed_entries_merged(self):
+        self._setup()
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+            responses.reset()
+            path = resources.files(tests.__name__).joinpath(
+                "popcon_test_data", "by_inst_binary_head_13_tail_4.txt"
+            )
+            body = path.read_text().replace(" 204964 188471 ", " 204965 188471 ")
+            responses.add(
+                responses.GET,
+                _BINARY_PACKAGES_POPCON_URL,
+                body=gzip.compress(body.encode()),
+                status=HTTPStatus.OK,
+            )
+            self._add_response(_SOURCE_PACKAGES_POPCON_URL, "by_inst_source_head_15_tail_4.txt")
+            stdout = StringIO()
+
+            Command(stdout=stdout).handle(
+                download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+            )
+
+        self.assertIn("Merging 1 of 4 entries", stdout.getvalue())
+        self.assertEqual(stdout.getvalue().count("Skipping import of unchanged file"), 1)
+        self.assertEqual(DebianPopcon.objects.get(package="dpkg").inst, 204965)
+
+    @responses.activate
+    def test_scoped(self):
+        self._setup()
+        issue = DebianWnppFactory(popcon=DebianPopconFactory(package="dpkg"))
+        DebianPopconFactory(package="not-referenced")
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir, scoped=True)
+            stats_of_package = PopconLookup(tempdir).stats_of(["libreoffice", "tar", "unknown"])
+
+        self.assertEqual(self._get_actual_values_from_database(), self.expected_values[:1])
+        self.assertFalse(DebianPopcon.objects.filter(package="not-referenced").exists())
+        issue.refresh_from_db()
+        self.assertEqual(
+            (issue.popcon_inst, issue.popcon_vote),
+            (self.expected_values[0]["inst"], self.expected_values[0]["vote"]),
+        )
+        self.assertEqual(
+            stats_of_package,
+            {
+                "libreoffice": dict(list(self.expected_values[1].items())[1:]),
+                "tar": {
+                    "inst": 204964,
+                    "vote": 184527,
+                    "old": 4859,
+                    "recent": 15549,
+                    "nofiles": 29,
+                },
+            },
+        )
+
+    @responses.activate
+    def test_full_import_after_scoped_import(self):
+        self._setup()
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir, scoped=True)
+            self.assertFalse(DebianPopcon.objects.exists())
+
+            Command(stdout=StringIO()).handle(
+                download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+            )
+
+        self.assertEqual(self._get_actual_values_from_database(), self.expected_values)
+
     @responses.activate
     def test_stale_time_respected(self):
         self._setup()
@@ -107,3 +229,112 @@ class ImportPopconCommandTest(TestCase):
 
                 assertion = self.assertIn if expect_nothing_to_do else self.assertNotIn
                 assertion("Nothing to do", stdout.getvalue())
+
+    @responses.activate
+    def test_conditional_download(self):
+        last_modified = "Sun, 18 Oct 2026 10:00:00 GMT"
+        for url, basename in (
+            (_BINARY_PACKAGES_POPCON_URL, "by_inst_binary_head_13_tail_4.txt"),
+            (_SOURCE_PACKAGES_POPCON_URL, "by_inst_source_head_15_tail_4.txt"),
+        ):
+            self._add_response(
+                url, basename, headers={"ETag": f'"{basename}"', "Last-Modified": last_modified}
+            )
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+
+            with open(os.path.join(tempdir, "popcon_binary_by_inst.gz.validators.json")) as f:
+                self.assertEqual(
+                    json.load(f),
+                    {
+                        "ETag": '"by_inst_binary_head_13_tail_4.txt"',
+                        "Last-Modified": last_modified,
+                    },
+                )
+
+            DebianPopcon.objects.all().delete()
+            responses.reset()
+            for url, basename in (
+                (_BINARY_PACKAGES_POPCON_URL, "by_inst_binary_head_13_tail_4.txt"),
+                (_SOURCE_PACKAGES_POPCON_URL, "by_inst_source_head_15_tail_4.txt"),
+            ):
+                responses.add(
+                    responses.GET,
+                    url,
+                    status=HTTPStatus.NOT_MODIFIED,
+                    match=[
+                        matchers.header_matcher(
+                            {"If-None-Match": f'"{basename}"', "If-Modified-Since": last_modified}
+                        )
+                    ],
+                )
+            stdout = StringIO()
+
+            Command(stdout=stdout).handle(
+                download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+            )
+
+        self.assertEqual(stdout.getvalue().count("Skipping import of unchanged file"), 2)
+        self.assertFalse(DebianPopcon.objects.exists())  # i.e. no import
+
+    @responses.activate
+    def test_failed_import_retried_after_not_modified(self):
+        self._setup()
+
+        with TemporaryDirectory() as tempdir:
+            with (
+                patch.object(
+                    Command, "_import_from_file_into_database", side_effect=DatabaseError
+                ),
+                self.assertRaises(DatabaseError),
+            ):
+                Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+            responses.reset()
+            for url in (_BINARY_PACKAGES_POPCON_URL, _SOURCE_PACKAGES_POPCON_URL):
+                responses.add(responses.GET, url, status=HTTPStatus.NOT_MODIFIED)
+
+            Command(stdout=StringIO()).handle(
+                download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+            )
+
+        self.assertEqual(
+            sorted(DebianPopcon.objects.values_list("package", flat=True)),
+            sorted(self.expected_packages),
+        )
+
+    @responses.activate
+    def test_failed_download_keeps_previous_file(self):
+        self._setup()
+
+        with TemporaryDirectory() as tempdir:
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+            filename = os.path.join(tempdir, "popcon_source_by_inst.gz")
+            with open(filename, "rb") as f:
+                previous_content = f.read()
+            responses.reset()
+            responses.add(
+                responses.GET, _SOURCE_PACKAGES_POPCON_URL, status=HTTPStatus.SERVICE_UNAVAILABLE
+            )
+            self._add_response(_BINARY_PACKAGES_POPCON_URL, "by_inst_binary_head_13_tail_4.txt")
+
+            with self.assertRaises(requests.HTTPError):
+                Command(stdout=StringIO()).handle(
+                    download_cache_dir=tempdir, maximum_stale_delta=timedelta()
+                )
+
+            with open(filename, "rb") as f:
+                self.assertEqual(f.read(), previous_content)
+            self.assertFalse(os.path.exists(f"{filename}.tmp"))
+
+    @responses.activate
+    def test_refused_while_locked_elsewhere(self):
+        other_connection = connection.copy()
+        self.addCleanup(other_connection.close)
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+
+        with TemporaryDirectory() as tempdir, self.assertRaises(CommandError):
+            Command(stdout=StringIO()).handle(download_cache_dir=tempdir)
+
+        self.assertEqual(len(responses.calls), 0)
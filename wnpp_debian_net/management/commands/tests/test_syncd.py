@@ -0,0 +1,89 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import signal
+from io import StringIO
+from unittest.mock import Mock, patch
+
+from django.core.management import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from .._common import SYNC_ADVISORY_LOCK_KEY, sync_advisory_lock
+from ..syncd import Command
+
+
+class SyncdCommandTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.command = Command(stdout=StringIO(), stderr=StringIO())
+        self.client = Mock()
+        self.calls = []
+
+    def _record_call_and_stop_after(self, count_calls):
+        def call_command(command_name, *args, **options):
+            self.calls.append((command_name, *args, options.get("client")))
+            if len(self.calls) >= count_calls:
+                self.command._stopping.set()
+
+        return call_command
+
+    def test_jobs_run_in_order_with_shared_client(self):
+        with patch(
+            "wnpp_debian_net.management.commands.syncd.call_command",
+            side_effect=self._record_call_and_stop_after(4),
+        ):
+            self.command.handle(client=self.client)
+
+        self.assertEqual(
+            self.calls,
+            [
+                ("truncatechangelog", None),
+                ("importdebbugs", self.client),
+                ("importdebbugs", "--quick", self.client),
+                ("importpopcon", None),
+            ],
+        )
+        self.assertIn("Stopped.", self.command.stdout.getvalue())
+
+    def test_failing_job_does_not_stop_others(self):
+        record_call = self._record_call_and_stop_after(2)
+
+        def call_command(command_name, *args, **options):
+            record_call(command_name, *args, **options)
+            raise CommandError("arbitrary")
+
+        with patch("wnpp_debian_net.management.commands.syncd.call_command", call_command):
+            self.command.handle(client=self.client)
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertIn("failed: arbitrary", self.command.stderr.getvalue())
+
+    def test_skipped_while_locked_elsewhere(self):
+        other_connection = connection.copy()
+        self.addCleanup(other_connection.close)
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [SYNC_ADVISORY_LOCK_KEY])
+
+        call_command_mock = Mock()
+        with patch("wnpp_debian_net.management.commands.syncd.call_command", call_command_mock):
+            self.command._client = self.client
+            ran = self.command._run(self.command._create_jobs()[0])
+
+        self.assertFalse(ran)
+        call_command_mock.assert_not_called()
+
+    def test_lock_can_be_taken_again_by_jobs(self):
+        with sync_advisory_lock() as locked_by_syncd:
+            with sync_advisory_lock() as locked_by_job:
+                self.assertTrue(locked_by_syncd)
+                self.assertTrue(locked_by_job)
+
+    def test_sigterm(self):
+        self.command._stopping = Mock(is_set=Mock(return_value=False))
+        self.command._handle_sigterm(signal.SIGTERM, None)
+        self.command._stopping.set.assert_called_once()
+
+        self.command._stopping.is_set.return_value = True
+        with self.assertRaises(KeyboardInterrupt):
+            self.command._handle_sigterm(signal.SIGTERM, None)
@@ -0,0 +1,17 @@
+# Generated by Django 6.1 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0002_debianwnpp_has_smaller_sibling"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="remote_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.1 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0003_debianwnpp_remote_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="next_refresh_at",
+            field=models.DateTimeField(null=True),
+        ),
+        # NOTE: This keeps the previous schedule (of a refresh every two hours)
+        #       for existing issues, until their first refresh.
+        migrations.RunSQL(
+            "UPDATE debian_wnpp SET next_refresh_at = cron_stamp + interval '2 hours'",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="debianwnpp",
+            name="next_refresh_at",
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                fields=["next_refresh_at", "ident"], name="debian_wnpp_next_refresh_ident"
+            ),
+        ),
+    ]
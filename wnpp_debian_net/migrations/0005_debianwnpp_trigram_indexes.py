@@ -0,0 +1,29 @@
+# Generated by Django 6.1 on 2026-10-18 16:12
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0004_debianwnpp_next_refresh_at"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["description"],
+                name="debian_wnpp_description_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["popcon"], name="debian_wnpp_project_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.1 on 2026-10-18 17:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0005_debianwnpp_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        "popcon", config="english", weight="A"
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        "description", config="english", weight="B"
+                    ),
+                    django.contrib.postgres.search.SearchConfig("english"),
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="debian_wnpp_search_vector"
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.1 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0006_debianwnpp_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["mod_stamp", "ident"],
+                name="debian_wnpp_keyset_dust",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["open_stamp", "ident"],
+                name="debian_wnpp_keyset_age",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["kind", "ident"],
+                name="debian_wnpp_keyset_type",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["description", "ident"],
+                name="debian_wnpp_keyset_description",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["charge_person", "ident"],
+                name="debian_wnpp_keyset_owner",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["open_person", "ident"],
+                name="debian_wnpp_keyset_reporter",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.1 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0007_debianwnpp_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="remote_change_interval",
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
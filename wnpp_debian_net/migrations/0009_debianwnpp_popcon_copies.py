@@ -0,0 +1,51 @@
+# Generated by Django 6.1 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wnpp_debian_net", "0008_debianwnpp_remote_change_interval"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="popcon_inst",
+            field=models.IntegerField(db_default=0),
+        ),
+        migrations.AddField(
+            model_name="debianwnpp",
+            name="popcon_vote",
+            field=models.IntegerField(db_default=0),
+        ),
+        # NOTE: Management commands "importpopcon" and "importdebbugs" keep these current
+        #       from here on.
+        migrations.RunSQL(
+            """
+            UPDATE debian_wnpp w SET popcon_inst = p.inst, popcon_vote = p.vote
+            FROM (
+                SELECT package, COALESCE(inst, 0) AS inst, COALESCE(vote, 0) AS vote
+                FROM debian_popcon
+            ) AS p
+            WHERE p.package = w.project
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["popcon_inst", "ident"],
+                name="debian_wnpp_keyset_installs",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="debianwnpp",
+            index=models.Index(
+                condition=models.Q(("has_smaller_sibling", False)),
+                fields=["popcon_vote", "ident"],
+                name="debian_wnpp_keyset_users",
+            ),
+        ),
+    ]
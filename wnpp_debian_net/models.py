@@ -1,11 +1,15 @@
 # Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
 # Licensed under GNU Affero GPL v3 or later
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
-from django.db.models import CASCADE, DO_NOTHING, ForeignKey, OneToOneField, TextChoices
+from django.db.models import CASCADE, DO_NOTHING, ForeignKey, OneToOneField, Q, TextChoices
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
+SEARCH_CONFIG = "english"
+
 
 class IssueKind(TextChoices):
     ITA = "ITA", _("ITA (Intent to adopt)")
@@ -81,9 +85,66 @@ class DebianWnpp(models.Model):
     charge_person = models.CharField(max_length=255, blank=True, null=True)
     cron_stamp = models.DateTimeField()
     has_smaller_sibling = models.BooleanField(default=False)
+    # Digest of the remote properties this issue was last imported from,
+    # so that management command "importdebbugs" can skip unchanged issues cheaply
+    remote_hash = models.CharField(max_length=64, blank=True, null=True)
+    # When management command "importdebbugs" is to refresh this issue next,
+    # depending on how recently and how often it has been modified remotely
+    next_refresh_at = models.DateTimeField()
+    # Smoothed interval between the remote modifications that management command
+    # "importdebbugs" has observed, for scheduling refreshes; unknown until a first change
+    remote_change_interval = models.DurationField(blank=True, null=True)
+    # Copies of the popcon stats of column "project" (0 if unknown) for sorting the front page
+    # by installs and users from an index; kept current by management commands "importpopcon"
+    # and "importdebbugs" (see function "sync_popcon_copies")
+    popcon_inst = models.IntegerField(db_default=0)
+    popcon_vote = models.IntegerField(db_default=0)
+    # for the full-text search ("q") of the front page, kept current by PostgreSQL itself
+    search_vector = models.GeneratedField(
+        expression=SearchVector("popcon", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="B", config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         db_table = "debian_wnpp"
+        indexes = [
+            # for keyset pagination over stale issues in management command "importdebbugs"
+            models.Index(
+                fields=["next_refresh_at", "ident"], name="debian_wnpp_next_refresh_ident"
+            ),
+            # for the (case-insensitive substring) text filters of the front page
+            GinIndex(
+                fields=["description"],
+                name="debian_wnpp_description_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["popcon"], name="debian_wnpp_project_trgm", opclasses=["gin_trgm_ops"]
+            ),
+            GinIndex(fields=["search_vector"], name="debian_wnpp_search_vector"),
+            # for keyset pagination of the front page, one per column to sort by,
+            # on issues that it shows only; the index of foreign key "popcon" serves
+            # sorting by project just as well.
+            *(
+                models.Index(
+                    fields=[field_name, "ident"],
+                    name=f"debian_wnpp_keyset_{column_name}",
+                    condition=Q(has_smaller_sibling=False),
+                )
+                for column_name, field_name in (
+                    ("dust", "mod_stamp"),
+                    ("age", "open_stamp"),
+                    ("type", "kind"),
+                    ("description", "description"),
+                    ("owner", "charge_person"),
+                    ("reporter", "open_person"),
+                    ("installs", "popcon_inst"),
+                    ("users", "popcon_vote"),
+                )
+            ),
+        ]
 
     def age_days(self, until=None) -> int:
         if until is None:
@@ -0,0 +1,109 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import gzip
+import mmap
+import os
+import re
+from collections.abc import Collection, Iterable, Iterator
+
+POPCON_CATEGORIES = ("source", "binary")
+POPCON_FIELD_NAMES = ("inst", "vote", "old", "recent", "nofiles")
+POPCON_LINE_EXTRACTOR = re.compile(
+    r"^[0-9]+\s+(?P<name>[^ ]+)\s+(?P<inst>[0-9]+)\s+(?P<vote>[0-9]+)\s+(?P<old>[0-9]+)\s+(?P<recent>[0-9]+)\s+(?P<nofiles>[0-9]+)"
+)
+
+PopconEntry = tuple[str, int, int, int, int, int]  # i.e. package name and POPCON_FIELD_NAMES
+
+
+def iterate_popcon_entries(lines: Iterable[str]) -> Iterator[PopconEntry]:
+    """
+    Parses lines of a popcon ``by_inst`` file one by one, skipping comments and totals.
+    Well-formed lines are handled by splitting; the regular expression
+    is only consulted for anything else.
+    """
+    for line in lines:
+        fields = line.split(None, 7)
+        if len(fields) >= 7 and fields[0].isascii() and fields[0].isdigit():
+            try:
+                entry = (fields[1], *map(int, fields[2:7]))
+            except ValueError:
+                pass
+            else:
+                if entry[0] != "Total":
+                    yield entry
+                continue
+
+        match = POPCON_LINE_EXTRACTOR.search(line.rstrip())
+        if match is None or match["name"] == "Total":
+            continue
+        yield (match["name"],) + tuple(int(match[name]) for name in POPCON_FIELD_NAMES)
+
+
+def iterate_popcon_entries_in_file(filename: str) -> Iterator[PopconEntry]:
+    # NOTE: Corrupted data like b'texl\xb1\xdbv\xd2\xc7atex-extra' has been observed
+    #       in practice
+    with gzip.open(filename, "rt", encoding="utf-8", errors="backslashreplace") as f:
+        yield from iterate_popcon_entries(f)
+
+
+def popcon_filename(download_cache_dir: str, category: str) -> str:
+    return os.path.join(download_cache_dir, f"popcon_{category}_by_inst.gz")
+
+
+class PopconLookup:
+    """
+    Looks up popcon stats of individual packages in the snapshots left by ``importpopcon``
+    (one line per package, sorted by package name) using binary search over memory-mapped files,
+    e.g. for packages that a scoped import left out of the database
+    """
+
+    def __init__(self, download_cache_dir: str):
+        self._snapshot_filenames = [
+            f"{popcon_filename(download_cache_dir, category)}.snapshot"
+            for category in POPCON_CATEGORIES
+        ]
+
+    @staticmethod
+    def _find_line(mapped: mmap.mmap, package_name: bytes) -> bytes | None:
+        lo = mapped.find(b"\n") + 1  # i.e. past the header
+        hi = len(mapped)
+        while lo < hi:  # NOTE: ``lo`` and ``hi`` are always at the start of a line
+            start = (mapped.rfind(b"\n", lo, (lo + hi) // 2) + 1) or lo
+            end = mapped.find(b"\n", start)
+            line = mapped[start:end]
+            candidate = line.split(b"\t", 1)[0]
+            if candidate == package_name:
+                return line
+            if candidate < package_name:
+                lo = end + 1
+            else:
+                hi = start
+        return None
+
+    def stats_of(self, package_names: Collection[str]) -> dict[str, dict[str, int]]:
+        """
+        Returns stats of those of ``package_names`` that are known,
+        with the greater of source and binary package stats per field,
+        like importing both lists into the database would
+        """
+        stats_of_package: dict[str, dict[str, int]] = {}
+        for snapshot_filename in self._snapshot_filenames:
+            try:
+                with (
+                    open(snapshot_filename, "rb") as f,
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped,
+                ):
+                    for package_name in package_names:
+                        line = self._find_line(mapped, package_name.encode())
+                        if line is None:
+                            continue
+                        values = [int(value) for value in line.split(b"\t")[1:]]
+                        previous_stats = stats_of_package.get(package_name, {})
+                        stats_of_package[package_name] = {
+                            field_name: max(value, previous_stats.get(field_name, value))
+                            for field_name, value in zip(POPCON_FIELD_NAMES, values, strict=True)
+                        }
+            except OSError, ValueError:  # e.g. no snapshot yet, or an empty file
+                continue
+        return stats_of_package
@@ -15,3 +15,12 @@ def url_for_page(context, page_number):
     """
     url = context["request"].get_full_path()
     return url_with_query(url, page=page_number)
+
+
+@register.simple_tag(takes_context=True)
+def url_for_cursor(context, cursor):
+    """
+    Produces the current request URLs with `[?&]after=<cursor>` applied
+    """
+    url = context["request"].get_full_path()
+    return url_with_query(url, after=cursor)
@@ -59,4 +59,7 @@ def self_url_with_sorting_for(context, future_column):
 
     future_sort = combine_sort_param(future_column, internal_direction_prefix)
 
+    if "after" in context["request"].GET:  # i.e. keyset pagination, back to its first page
+        return url_with_query(url, sort=future_sort, page=1, after="")
+
     return url_with_query(url, sort=future_sort, page=1)
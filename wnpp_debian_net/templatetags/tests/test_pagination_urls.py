@@ -6,7 +6,7 @@ from unittest import TestCase
 from django.test import RequestFactory
 from parameterized import parameterized
 
-from ..pagination_urls import url_for_page
+from ..pagination_urls import url_for_cursor, url_for_page
 
 
 class UrlForPageTest(TestCase):
@@ -26,3 +26,21 @@ class UrlForPageTest(TestCase):
         actual_url = url_for_page(context, page_number)
 
         self.assertEqual(actual_url, expected_url)
+
+
+class UrlForCursorTest(TestCase):
+    @parameterized.expand(
+        [
+            ("/hello", "/hello?after=abc"),
+            ("/hello?other=1", "/hello?other=1&after=abc"),
+            ("/hello?after=def", "/hello?after=abc"),
+        ]
+    )
+    def test_url_for_cursor(self, current_url, expected_url):
+        context = {
+            "request": RequestFactory().get(current_url),
+        }
+
+        actual_url = url_for_cursor(context, "abc")
+
+        self.assertEqual(actual_url, expected_url)
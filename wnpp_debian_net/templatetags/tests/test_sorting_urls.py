@@ -21,6 +21,7 @@ class SortingUrlsTest(TestCase):
             ("/hello?sort=col1%2Fdesc", "/hello?sort=col1%2Fasc&page=1"),
             ("/hello?sort=col1%3Bdesc", "/hello?sort=col1%2Fasc&page=1"),
             ("/hello?sort=col4", "/hello?sort=col1%2Fasc&page=1"),
+            ("/hello?after=abc", "/hello?after=&sort=col1%2Fasc&page=1"),
         ]
     )
     def test_resets_page_to_1(self, current_page_url, expected_url):
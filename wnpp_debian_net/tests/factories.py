@@ -2,7 +2,7 @@
 # Licensed under GNU Affero GPL v3 or later
 
 from django.utils.timezone import now
-from factory import LazyFunction, Sequence
+from factory import LazyAttribute, LazyFunction, Sequence
 from factory.django import DjangoModelFactory
 
 from ..models import DebianLogIndex, DebianLogMods, DebianPopcon, DebianWnpp, IssueKind
@@ -34,4 +34,14 @@ class DebianWnppFactory(DjangoModelFactory):
     cron_stamp = LazyFunction(now)
     mod_stamp = LazyFunction(now)
     open_stamp = LazyFunction(now)
+    next_refresh_at = LazyFunction(now)
     kind = IssueKind.RFA.value  # anything that matches the default filters
+    # NOTE: Copies of the popcon stats of a given popcon instance, like
+    #       management commands "importpopcon" and "importdebbugs" would make
+    popcon_inst = LazyAttribute(lambda o: _popcon_stat_of(o, "inst"))
+    popcon_vote = LazyAttribute(lambda o: _popcon_stat_of(o, "vote"))
+
+
+def _popcon_stat_of(issue, field_name: str) -> int:
+    popcon = getattr(issue, "popcon", None)
+    return (getattr(popcon, field_name) or 0) if popcon is not None else 0
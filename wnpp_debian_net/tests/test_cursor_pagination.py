@@ -0,0 +1,125 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+import base64
+from datetime import UTC, datetime
+
+from bs4 import BeautifulSoup
+from django.template.loader import get_template
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from parameterized import parameterized
+
+from ..cursor_pagination import CursorPage, decode_cursor, encode_cursor, paginate_by_cursor
+from ..models import DebianWnpp
+from .factories import DebianWnppFactory
+
+
+class CursorTokenTest(SimpleTestCase):
+    def test_round_trip(self):
+        key_value = datetime(2021, 2, 3, 4, 5, 6, 789, tzinfo=UTC)
+
+        cursor = encode_cursor(key_value, 123, 51)
+
+        self.assertEqual(decode_cursor(cursor), ("2021-02-03T04:05:06.000789+00:00", 123, 51))
+        self.assertNotIn("=", cursor)
+
+    @parameterized.expand(
+        [
+            ("not base64", "!!!"),
+            ("not JSON", base64.urlsafe_b64encode(b"[1,").decode()),
+            ("not a list", base64.urlsafe_b64encode(b"123").decode()),
+            ("too short", base64.urlsafe_b64encode(b"[1,2]").decode()),
+            ("bad primary key", base64.urlsafe_b64encode(b'[1,"2",3]').decode()),
+            ("bad start index", base64.urlsafe_b64encode(b"[1,2,0]").decode()),
+        ]
+    )
+    def test_malformed(self, _label, cursor):
+        with self.assertRaises(ValueError):
+            decode_cursor(cursor)
+
+
+class PaginateByCursorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for ident, charge_person in enumerate(["b", None, "a", "b", None, "c", "a", None, "b"]):
+            DebianWnppFactory(ident=ident, charge_person=charge_person)
+
+    def _paginate_all(self, key, descending, nullable, per_page) -> list[CursorPage]:
+        pages = [
+            paginate_by_cursor(
+                DebianWnpp.objects.all(), key, descending, nullable, cursor="", per_page=per_page
+            )
+        ]
+        while pages[-1].has_next():
+            pages.append(
+                paginate_by_cursor(
+                    DebianWnpp.objects.all(),
+                    key,
+                    descending,
+                    nullable,
+                    cursor=pages[-1].next_cursor,
+                    per_page=per_page,
+                )
+            )
+        return pages
+
+    @parameterized.expand(
+        [
+            ("ascending, nullable", "charge_person", False, True),
+            ("descending, nullable", "charge_person", True, True),
+            ("ascending", "ident", False, False),
+            ("descending", "ident", True, False),
+        ]
+    )
+    def test_pages_cover_order(self, _label, key, descending, nullable):
+        direction_prefix = "-" if descending else ""
+        expected_object_list = list(
+            DebianWnpp.objects.order_by(direction_prefix + key, direction_prefix + "pk")
+        )
+
+        for per_page in (1, 2, 3, 9, 10):
+            with self.subTest(per_page=per_page):
+                pages = self._paginate_all(key, descending, nullable, per_page)
+
+                actual_object_list = [item for page in pages for item in page.object_list]
+                self.assertEqual(actual_object_list, expected_object_list)
+                self.assertEqual(
+                    [page.start_index() for page in pages],
+                    list(range(1, len(expected_object_list) + 1, per_page)),
+                )
+
+    def test_null_cursor_for_non_nullable_key(self):
+        cursor = encode_cursor(None, 1, 2)
+
+        with self.assertRaises(ValueError):
+            paginate_by_cursor(DebianWnpp.objects.all(), "ident", False, False, cursor, 3)
+
+
+class CursorPaginationTemplateTest(SimpleTestCase):
+    def _render(self, page: CursorPage) -> str:
+        context = {
+            "page_obj": page,
+            "request": RequestFactory().get("/", {"after": "abc"}),
+        }
+        return get_template("cursor_pagination.html").render(context)
+
+    @staticmethod
+    def _extract_links(content) -> list[tuple[str, str]]:
+        soup = BeautifulSoup(markup=content, features="html.parser")
+        return [(a_tag.string, a_tag["href"]) for a_tag in soup.find_all("a")]
+
+    def test_first_page(self):
+        page = CursorPage(object_list=[1, 2], start_index=1, next_cursor="def", count=5)
+
+        content = self._render(page)
+
+        self.assertEqual(self._extract_links(content), [("First", "#"), ("Next", "/?after=def")])
+        self.assertIn("(1 to 2; 5 total)", content)
+
+    def test_last_page(self):
+        page = CursorPage(object_list=[5], start_index=5, next_cursor=None, count=5)
+
+        content = self._render(page)
+
+        self.assertEqual(self._extract_links(content), [("First", "/?after="), ("Next", "#")])
+        self.assertIn("(5 to 5; 5 total)", content)
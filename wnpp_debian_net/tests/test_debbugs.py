@@ -1,7 +1,25 @@
 # Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
 # Licensed under GNU Affero GPL v3 or later
 
-from ..debbugs import DebbugsWnppClient, IssueStatus
+import gzip
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import yaml
+from pysimplesoap.client import SoapFault
+
+from ..debbugs import (
+    DebbugsRequestError,
+    DebbugsWnppClient,
+    IssueProperty,
+    IssueStatus,
+    PooledHttpTransport,
+)
+from ..fake_debbugs_server import FakeDebbugsServer
 from .fake_vcr_unittest import FakeVcrTestCase
 
 ISSUE_IDS_OF_INTEREST = [
@@ -67,13 +85,317 @@ class DebbugsWnppClientTest(FakeVcrTestCase):
         self.client.connect()
 
     def test_fetch_issues(self):
-        properties_of_issue = self.client.fetch_issues(ISSUE_IDS_OF_INTEREST)
+        properties_of_issue = dict(self.client.fetch_issues(ISSUE_IDS_OF_INTEREST))
 
         self.assertEqual(properties_of_issue, EXPECTED_PROPERTIES_OF_ISSUE)
 
+    def test_fetch_issues_with_projection(self):
+        properties = (IssueProperty.MERGEDWITH, IssueProperty.SUBJECT)
+
+        properties_of_issue = dict(self.client.fetch_issues(ISSUE_IDS_OF_INTEREST, properties))
+
+        self.assertEqual(
+            properties_of_issue,
+            {
+                issue_id: {
+                    p.value: expected_properties[p.value]
+                    for p in properties
+                    if p.value in expected_properties
+                }
+                for issue_id, expected_properties in EXPECTED_PROPERTIES_OF_ISSUE.items()
+            },
+        )
+
+    def test_fetch_issues_concurrently(self):
+        batches = list(
+            self.client.fetch_issues_concurrently(
+                [ISSUE_IDS_OF_INTEREST], max_requests_in_flight=2, notify=Mock()
+            )
+        )
+
+        self.assertEqual(batches, [(ISSUE_IDS_OF_INTEREST, EXPECTED_PROPERTIES_OF_ISSUE)])
+
     def test_fetch_ids_of_issues_with_status(self):
         ids_of_open_issues = self.client.fetch_ids_of_issues_with_status(IssueStatus.OPEN)
 
         self.assertEqual(len(ids_of_open_issues), 6256)
         self.assertEqual(ids_of_open_issues[0], 119911)
         self.assertEqual(ids_of_open_issues[-1], 982926)
+
+
+class FetchIssuesConcurrentlyTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = DebbugsWnppClient()
+        self.failed_issue_ids = set()
+
+        def fetch_issues(issue_ids, properties=None):
+            if issue_ids[0] % 2 and issue_ids[0] not in self.failed_issue_ids:
+                self.failed_issue_ids.add(issue_ids[0])
+                raise DebbugsRequestError("arbitrary")
+            return {i: {} for i in issue_ids}
+
+        self.client.fetch_issues = fetch_issues
+
+    @patch("wnpp_debian_net.debbugs._sleep")
+    def test_failed_batches_are_retried_individually(self, _sleep_mock):
+        issue_id_batches = [[i * 10 + 1, i * 10 + 2] for i in range(5)]
+
+        batches = list(
+            self.client.fetch_issues_concurrently(
+                issue_id_batches, max_requests_in_flight=3, notify=Mock()
+            )
+        )
+
+        self.assertEqual(
+            sorted(issue_ids for issue_ids, _ in batches),
+            issue_id_batches,
+        )
+        self.assertEqual(self.failed_issue_ids, {1, 11, 21, 31, 41})
+        for issue_ids, properties_of_issue in batches:
+            self.assertEqual(sorted(properties_of_issue), issue_ids)
+
+    def test_retries_stopped_when_interrupted(self):
+        failed = threading.Event()
+        attempts_of_failing_batch = []
+
+        def fetch_issues(issue_ids, properties=None):
+            if issue_ids == [1]:
+                attempts_of_failing_batch.append(threading.current_thread())
+                failed.set()
+                raise DebbugsRequestError("arbitrary")
+            failed.wait(timeout=5)  # i.e. until the other batch is in back-off
+            return {i: {} for i in issue_ids}
+
+        self.client.fetch_issues = fetch_issues
+        batches = self.client.fetch_issues_concurrently(
+            [[2], [1]], max_requests_in_flight=2, notify=Mock()
+        )
+
+        self.assertEqual(next(batches), ([2], {2: {}}))
+        batches.close()  # e.g. KeyboardInterrupt in the consumer
+
+        [thread] = attempts_of_failing_batch
+        thread.join(timeout=5)  # rather than minutes of back-off
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(attempts_of_failing_batch), 1)
+
+
+class IterateIssuesInStatusResponseTest(TestCase):
+    @staticmethod
+    def _create_response(map_content: str) -> bytes:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><soap:Envelope'
+            ' xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+            f"<get_statusResponse><s-gensym3>{map_content}</s-gensym3></get_statusResponse>"
+            "</soap:Body></soap:Envelope>"
+        ).encode()
+
+    @patch("wnpp_debian_net.debbugs._PARSE_CHUNK_SIZE", 7)
+    def test_chunked(self):
+        content = self._create_response(
+            "<item><key>1</key><value><subject>RFP: one -- &lt;1&gt;</subject><tags/></value></item>"
+            "<item><key>2</key><value><subject>ITP: two -- “2”</subject></value></item>"
+        )
+
+        issues = list(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+        self.assertEqual(
+            issues,
+            [
+                (1, {"subject": "RFP: one -- <1>"}),
+                (2, {"subject": "ITP: two -- “2”"}),
+            ],
+        )
+
+    def test_chunks_as_they_come_in(self):
+        content = self._create_response(
+            "<item><key>1</key><value><subject>RFP: one</subject></value></item>"
+        )
+
+        issues = list(
+            DebbugsWnppClient.iterate_issues_in_status_response(iter([content[:50], content[50:]]))
+        )
+
+        self.assertEqual(issues, [(1, {"subject": "RFP: one"})])
+
+    def test_malformed_issue_id(self):
+        content = self._create_response("<item><key>one</key><value/></item>")
+
+        with self.assertRaises(DebbugsRequestError):
+            list(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+    def test_base64_decoding_by_type_only(self):
+        content = self._create_response(
+            "<item><key>1</key><value>"
+            '<subject xsi:type="xsd:base64Binary">UkZQOiBvbmU=</subject>'
+            '<location xsi:type="xsd:string">db-h</location>'
+            "</value></item>"
+        )
+
+        issues = list(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+        self.assertEqual(issues, [(1, {"subject": "RFP: one", "location": "db-h"})])
+
+    def test_property_with_child_elements(self):
+        content = self._create_response(
+            "<item><key>1</key><value><found_versions><item>1.0</item></found_versions>"
+            "</value></item>"
+        )
+
+        issues = list(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+        self.assertEqual(issues, [(1, {"found_versions": None})])
+
+    def test_fault(self):
+        content = (
+            b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+            b"<soap:Fault><faultcode>soap:Server</faultcode><faultstring>Oops</faultstring>"
+            b"</soap:Fault></soap:Body></soap:Envelope>"
+        )
+
+        with self.assertRaises(SoapFault) as catcher:
+            list(DebbugsWnppClient.iterate_issues_in_status_response(content))
+
+        self.assertEqual(catcher.exception.faultstring, "Oops")
+
+
+class _GzipResponder(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # for keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+
+        body = self.server.response_body
+        self.send_response(HTTPStatus.OK)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+            self.server.count_compressed_responses += 1
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): ...
+
+
+class _StallingResponder(BaseHTTPRequestHandler):
+    """
+    Sends the response body in two parts, the second not before the server is told to resume
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+
+        body = self.server.response_body
+        split_offset = body.index(self.server.split_before)
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:split_offset])
+        self.wfile.flush()
+        self.server.resume.wait(timeout=5)
+        self.wfile.write(body[split_offset:])
+        self.server.completed = True
+
+    def log_message(self, *args): ...
+
+
+class PooledHttpTransportTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        cassette_filename = os.path.join(
+            os.path.dirname(__file__), "cassettes", "DebbugsWnppClientTest.test_fetch_issues.yaml"
+        )
+        with open(cassette_filename) as f:
+            cassette_doc = yaml.safe_load(f)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _GzipResponder)
+        self.server.response_body = cassette_doc["interactions"][0]["response"]["body"][
+            "string"
+        ].encode("utf-8")
+        self.server.count_compressed_responses = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        patcher = patch(
+            "wnpp_debian_net.debbugs._SOAP_LOCATION",
+            f"http://127.0.0.1:{self.server.server_port}/",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connection_reuse_and_gzip(self):
+        transport = PooledHttpTransport()
+        client = DebbugsWnppClient(transport=transport)
+        client.connect()
+
+        for _ in range(3):
+            self.assertEqual(
+                dict(client.fetch_issues(ISSUE_IDS_OF_INTEREST)), EXPECTED_PROPERTIES_OF_ISSUE
+            )
+
+        self.assertEqual(transport.count_connections_opened, 1)
+        self.assertEqual(transport.count_connections_reused, 2)
+        self.assertEqual(self.server.count_compressed_responses, 3)
+
+    @patch("wnpp_debian_net.debbugs._PARSE_CHUNK_SIZE", 1)
+    def test_streaming(self):
+        self.server.RequestHandlerClass = _StallingResponder
+        self.server.split_before = f"{ISSUE_IDS_OF_INTEREST[1]}</key>".encode()
+        self.server.resume = threading.Event()
+        self.server.completed = False
+        client = DebbugsWnppClient(transport=PooledHttpTransport())
+        client.connect()
+
+        issues = client.fetch_issues(ISSUE_IDS_OF_INTEREST)
+        first_issue = next(issues)
+        completed_before_first_issue = self.server.completed
+        self.server.resume.set()
+        properties_of_issue = dict([first_issue, *issues])
+
+        self.assertFalse(completed_before_first_issue)
+        self.assertEqual(properties_of_issue, EXPECTED_PROPERTIES_OF_ISSUE)
+
+
+class FakeDebbugsServerTest(TestCase):
+    def test_get_bugs_and_get_status(self):
+        with FakeDebbugsServer(count_issues=30) as server:
+            client = DebbugsWnppClient(transport=PooledHttpTransport(), location=server.location)
+
+            forwarded_ids = client.fetch_ids_of_issues_with_status(IssueStatus.FORWARDED)
+            open_ids = client.fetch_ids_of_issues_with_status(IssueStatus.OPEN)
+            properties_of_issue = dict(
+                client.fetch_issues(
+                    [100_000, 100_001], properties=[IssueProperty.OWNER, IssueProperty.SUBJECT]
+                )
+            )
+
+        self.assertEqual(forwarded_ids, [100_000, 100_010, 100_020])
+        self.assertEqual(sorted(forwarded_ids + open_ids), list(server.issue_ids))
+        self.assertEqual(
+            properties_of_issue,
+            {
+                100_000: {
+                    "owner": "owner100000@example.org",
+                    "subject": "ITA: package100000 -- Synthetic package number 100000 — “fake”",
+                },
+                100_001: {
+                    "subject": "RFH: package100001 -- Synthetic package number 100001 — “fake”",
+                },
+            },
+        )
+        self.assertEqual(server.count_requests, 3)
+
+    def test_error_injection(self):
+        with FakeDebbugsServer(count_issues=3, error_rate=1.0) as server:
+            client = DebbugsWnppClient(location=server.location)
+
+            for _ in range(4):
+                with self.assertRaises(DebbugsRequestError):
+                    list(client.fetch_issues([100_000]))
+
+        self.assertEqual(server.count_errors, 4)
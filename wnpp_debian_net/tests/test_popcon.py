@@ -0,0 +1,64 @@
+# Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
+# Licensed under GNU Affero GPL v3 or later
+
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase
+
+from ..popcon import PopconLookup, iterate_popcon_entries, popcon_filename
+
+
+class IteratePopconEntriesTest(SimpleTestCase):
+    def test_regular_lines(self):
+        lines = [
+            "#rank name    inst  vote   old recent no-files (maintainer)\n",
+            "1     dpkg  204964 188471  1590 14877    26 (Dpkg Developers)  \n",
+            "2     tar   204964 184527  4859 15549    29\n",
+            "------------------------------------------------------------------\n",
+            "180196 Total 288833535 73508742 96587139 23963797 94773857 0 \n",
+        ]
+
+        self.assertEqual(
+            list(iterate_popcon_entries(lines)),
+            [
+                ("dpkg", 204964, 188471, 1590, 14877, 26),
+                ("tar", 204964, 184527, 4859, 15549, 29),
+            ],
+        )
+
+    def test_irregular_lines_fall_back_to_regex(self):
+        lines = [
+            "3     texl\\xb1\\xdbv 12 11 1 0 0(Not in sid)\n",  # i.e. no space before "("
+            "²     zip 1 1 0 0 0\n",  # i.e. not a rank
+            "5     short 1 2 3\n",
+        ]
+
+        self.assertEqual(
+            list(iterate_popcon_entries(lines)),
+            [
+                ("texl\\xb1\\xdbv", 12, 11, 1, 0, 0),
+            ],
+        )
+
+
+class PopconLookupTest(SimpleTestCase):
+    def test_binary_search(self):
+        package_names = sorted(f"package{i}" for i in range(1000))
+        with TemporaryDirectory() as tempdir:
+            with open(f"{popcon_filename(tempdir, 'binary')}.snapshot", "w") as f:
+                f.write("# sha256 0123456789abcdef all\n")  # i.e. arbitrary checksum
+                for i, package_name in enumerate(package_names):
+                    f.write(f"{package_name}\t{i}\t{i}\t{i}\t{i}\t{i}\n")
+
+            stats_of_package = PopconLookup(tempdir).stats_of(
+                package_names + ["package", "package1000", "zzz", "a"]
+            )
+
+        self.assertEqual(
+            {package_name: stats["inst"] for package_name, stats in stats_of_package.items()},
+            {package_name: i for i, package_name in enumerate(package_names)},
+        )
+
+    def test_without_snapshots(self):
+        with TemporaryDirectory() as tempdir:
+            self.assertEqual(PopconLookup(tempdir).stats_of(["dpkg"]), {})
@@ -1,15 +1,19 @@
 # Copyright (C) 2021 Sebastian Pipping <sebastian@pipping.org>
 # Licensed under GNU Affero GPL v3 or later
 
+import hashlib
 from typing import Any
 
-from django.core.exceptions import SuspiciousOperation
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation, ValidationError
 from django.core.paginator import Page, Paginator
 from django.db.models import F, Q, QuerySet
-from django.db.models.functions import Coalesce
+from django.db.models.lookups import IContains
 from django.views.generic import ListView
 
-from ..models import DebianWnpp, IssueKind
+from ..cursor_pagination import paginate_by_cursor
+from ..models import SEARCH_CONFIG, DebianWnpp, IssueKind
 from ..override import overrive
 from ..pagination import iterate_page_items
 from ..templatetags.sorting_urls import (
@@ -20,6 +24,8 @@ from ..templatetags.sorting_urls import (
 
 _INSTANCES_PER_PAGE = 50
 
+_CURSOR_COUNT_CACHE_SECONDS = 5 * 60
+
 _INTERNAL_FIELDS_FOR_COLUMN_NAME = {
     # NOTE: First item is for data access and ordering, second item is for .only(..)
     "dust": ("mod_stamp", "mod_stamp"),
@@ -28,8 +34,8 @@ _INTERNAL_FIELDS_FOR_COLUMN_NAME = {
     "project": ("popcon_id", "popcon_id"),
     "ident": ("ident", "ident"),
     "description": ("description", "description"),
-    "users": ("popcon__vote_nonnull", "popcon__vote"),
-    "installs": ("popcon__inst_nonnull", "popcon__inst"),
+    "users": ("popcon_vote", "popcon_vote"),
+    "installs": ("popcon_inst", "popcon_inst"),
     "owner": ("charge_person", "charge_person"),
     "reporter": ("open_person", "open_person"),
 }
@@ -47,6 +53,18 @@ _DEFAULT_COLUMNS = [
 assert all((column in _COLUMN_NAMES) for column in _DEFAULT_COLUMNS)
 
 
+class _ILike(IContains):
+    """
+    Case-insensitive substring match as ``ILIKE`` rather than ``UPPER(..) LIKE UPPER(..)``
+    (as with lookup ``icontains``), so that trigram indexes on the plain column apply
+    """
+
+    lookup_name = "ilike"  # i.e. anything but "icontains", to keep the column out of UPPER(..)
+
+    def get_rhs_op(self, connection, rhs):
+        return f"ILIKE {rhs}"
+
+
 class FrontPageView(ListView):
     model = DebianWnpp
     paginate_by = _INSTANCES_PER_PAGE
@@ -59,10 +77,13 @@ class FrontPageView(ListView):
         self._description_filter = self.request.GET.get("description", "")
         self._owners = self.request.GET.getlist("owner[]", ["yes", "no"])
         self._project_filter = self.request.GET.get("project", "")
-        self._sort = self.request.GET.get(
-            "sort", combine_sort_param("installs", INTERNAL_DIRECTION_PREFIX_DESCENDING)
+        self._query = self.request.GET.get("q", "").strip()
+        self._sort_requested = bool(self.request.GET.get("sort"))
+        self._sort = self.request.GET.get("sort") or combine_sort_param(
+            "installs", INTERNAL_DIRECTION_PREFIX_DESCENDING
         )
         self._kinds = set(self.request.GET.getlist("type[]", IssueKind.values))
+        self._cursor = self.request.GET.get("after")  # i.e. keyset pagination unless None
 
         # Validation
         self._sort_external_column, self._sort_internal_direction_prefix = parse_sort_param(
@@ -81,13 +102,6 @@ class FrontPageView(ListView):
         # Out of a group of merged issues, only show the one with the smallest ID
         qs = qs.filter(has_smaller_sibling=False)
 
-        if "installs" in self._col or "users" in self._col:
-            qs = qs.select_related("popcon")
-            if "installs" in self._col:
-                qs = qs.annotate(popcon__inst_nonnull=Coalesce("popcon__inst", 0))
-            if "users" in self._col:
-                qs = qs.annotate(popcon__vote_nonnull=Coalesce("popcon__vote", 0))
-
         evential_columns = self._col | {
             "project",  # always needed because the column is unconditional in the template
             "type",  # always needed because the table row is colored by issue type
@@ -96,7 +110,7 @@ class FrontPageView(ListView):
         qs = qs.only(*fields)
 
         if self._description_filter:
-            qs = qs.filter(description__icontains=self._description_filter)
+            qs = qs.filter(_ILike(F("description"), self._description_filter))
 
         if self._owners:
             without_owner_filter = Q(charge_person__isnull=True) | Q(charge_person="")
@@ -108,13 +122,19 @@ class FrontPageView(ListView):
         if self._project_filter:
             # NOTE: Django doesn't let us do "popcon_id__icontains=[..]"
             #       since it's used as a foreign key
-            qs = qs.annotate(package_name=F("popcon_id")).filter(
-                package_name__icontains=self._project_filter
-            )
+            qs = qs.filter(_ILike(F("popcon_id"), self._project_filter))
 
         if self._kinds:
             qs = qs.filter(kind__in=self._kinds)
 
+        if self._query:
+            search_query = SearchQuery(self._query, config=SEARCH_CONFIG, search_type="websearch")
+            qs = qs.filter(search_vector=search_query)
+            if not self._sort_requested:
+                qs = qs.annotate(
+                    search_rank=SearchRank(F("search_vector"), search_query)
+                ).order_by("-search_rank", "ident")
+
         return qs
 
     @overrive
@@ -128,15 +148,53 @@ class FrontPageView(ListView):
             )[0]
         )
 
+    def _get_keyset_ordering(self, queryset: QuerySet) -> tuple[str, bool, bool]:
+        """Return the sort key, whether it is descending and whether it is nullable."""
+        if self._query and not self._sort_requested:
+            return "search_rank", True, False
+        key = self.get_ordering().lstrip("-")
+        nullable = key not in queryset.query.annotations and DebianWnpp._meta.get_field(key).null
+        return key, self._sort_internal_direction_prefix == "-", nullable
+
+    @staticmethod
+    def _get_cached_count(queryset: QuerySet) -> int:
+        unordered = queryset.order_by()
+        cache_key = "front_page_count_" + hashlib.sha256(str(unordered.query).encode()).hexdigest()
+        return cache.get_or_set(cache_key, unordered.count, _CURSOR_COUNT_CACHE_SECONDS)
+
+    @overrive
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate the queryset, if needed."""
+        if self._cursor is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        key, descending, nullable = self._get_keyset_ordering(queryset)
+        try:
+            page = paginate_by_cursor(
+                queryset,
+                key=key,
+                descending=descending,
+                nullable=nullable,
+                cursor=self._cursor,
+                per_page=page_size,
+                count=self._get_cached_count(queryset),
+            )
+        except ValueError, TypeError, ValidationError:
+            raise SuspiciousOperation from None
+        return None, page, page.object_list, True
+
     @overrive
     def get_context_data(self, *, object_list=None, **kwargs) -> dict[str, Any]:
         context = super().get_context_data(object_list=object_list, **kwargs)
 
         context.update(
             {
+                "cursor_pagination": self._cursor is not None,
                 "description_filter": self._description_filter,
                 "project_filter": self._project_filter,
+                "q": self._query,
                 "sort": self._sort,
+                "sort_requested": self._sort_requested,
                 "with_owner": "yes" in self._owners,
                 "without_owner": "no" in self._owners,
             }
@@ -148,12 +206,13 @@ class FrontPageView(ListView):
         for column_name in _COLUMN_NAMES:
             context[f"show_{column_name}"] = column_name in self._col
 
-        paginator: Paginator = context["paginator"]
-        page_obj: Page = context["page_obj"]
-        context["page_items"] = list(
-            iterate_page_items(
-                total_page_count=paginator.num_pages, current_page_number=page_obj.number
+        if self._cursor is None:
+            paginator: Paginator = context["paginator"]
+            page_obj: Page = context["page_obj"]
+            context["page_items"] = list(
+                iterate_page_items(
+                    total_page_count=paginator.num_pages, current_page_number=page_obj.number
+                )
             )
-        )
 
         return context
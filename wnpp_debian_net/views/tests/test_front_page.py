@@ -3,11 +3,15 @@
 
 from http import HTTPStatus
 
+from django.core.cache import cache
+from django.db import connection
 from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse_lazy
 from parameterized import parameterized
 
-from ...models import DebianPopcon, IssueKind
+from ...management.commands._common import sync_popcon_copies
+from ...models import DebianPopcon, DebianWnpp, IssueKind
 from ...tests.factories import DebianPopconFactory, DebianWnppFactory
 from ..front_page import (
     _COLUMN_NAMES,
@@ -151,6 +155,120 @@ class TextBasedFilterTest(_FrontPageTestCase):
         self.assertNotIn(self.issue3, object_list)
 
 
+class FullTextSearchTest(_FrontPageTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.issue_by_description = DebianWnppFactory(
+            ident=1,
+            description="Library for parsing spreadsheets",
+            popcon=DebianPopconFactory(package="libcalc", inst=20),
+        )
+        cls.issue_by_name = DebianWnppFactory(
+            ident=2,
+            description="Something else entirely",
+            popcon=DebianPopconFactory(package="spreadsheet", inst=10),
+        )
+        cls.unrelated_issue = DebianWnppFactory(
+            ident=3,
+            description="Tool for images",
+            popcon=DebianPopconFactory(package="imagetool", inst=30),
+        )
+
+    def test_default(self):
+        response = self.client.get(self.url, {"q": ""})
+
+        self.assertEqual(len(response.context_data["object_list"]), 3)
+
+    def test_ranked_without_explicit_sort(self):
+        response = self.client.get(self.url, {"q": "spreadsheet"})
+
+        object_list = list(response.context_data["object_list"])
+        # NOTE: Matches in package names outweigh those (stemmed) in descriptions
+        self.assertEqual(object_list, [self.issue_by_name, self.issue_by_description])
+        self.assertEqual(response.context_data["q"], "spreadsheet")
+
+    def test_explicit_sort_respected(self):
+        data = {"q": "spreadsheet", "sort": "installs/desc"}
+
+        response = self.client.get(self.url, data)
+
+        object_list = list(response.context_data["object_list"])
+        self.assertEqual(object_list, [self.issue_by_description, self.issue_by_name])
+
+    def test_web_search_syntax(self):
+        response = self.client.get(self.url, {"q": "spreadsheet -library"})
+
+        object_list = list(response.context_data["object_list"])
+        self.assertEqual(object_list, [self.issue_by_name])
+
+
+class IndexUsageTest(_FrontPageTestCase):
+    count_issues = 2000  # i.e. enough for the planner to tell selective indexes from others
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        DebianPopcon.objects.bulk_create(
+            DebianPopcon(package=f"package{i}", inst=i) for i in range(cls.count_issues)
+        )
+        DebianWnpp.objects.bulk_create(
+            DebianWnppFactory.build(
+                ident=i, description=f"description {i}", popcon_id=f"package{i}"
+            )
+            for i in range(cls.count_issues)
+        )
+        with connection.cursor() as cursor:
+            sync_popcon_copies(cursor)
+            for index_name in (
+                "debian_wnpp_description_trgm",
+                "debian_wnpp_project_trgm",
+                "debian_wnpp_search_vector",
+            ):  # i.e. what VACUUM would do
+                cursor.execute("SELECT gin_clean_pending_list(%s::regclass)", [index_name])
+            cursor.execute("ANALYZE debian_popcon, debian_wnpp")
+
+    @parameterized.expand(
+        [
+            ("description", "1234", "debian_wnpp_description_trgm"),
+            ("project", "1234", "debian_wnpp_project_trgm"),
+            ("q", "1234", "debian_wnpp_search_vector"),
+        ]
+    )
+    def test_filter_index_used(self, param_name, param_value, expected_index_name):
+        front_page = FrontPageView()
+        front_page.setup(RequestFactory().get(self.url, {param_name: param_value}))
+        qs = front_page.get_queryset()
+        with connection.cursor() as cursor:
+            # NOTE: A table this small would otherwise be scanned as a whole (sequentially
+            #       or along some unrelated index), so only (bitmap) scans of indexes
+            #       are left to the planner, to pick the one that supports the filter best.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_indexscan = off")
+
+        plan = qs.explain()
+
+        self.assertIn(expected_index_name, plan)
+
+    @parameterized.expand(
+        [
+            ("age/desc", "debian_wnpp_keyset_age"),
+            ("installs/desc", "debian_wnpp_keyset_installs"),
+        ]
+    )
+    def test_keyset_index_used(self, sort, expected_index_name):
+        data = {"sort": sort}
+        first_page = self.client.get(self.url, {**data, "after": ""}).context_data["page_obj"]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url, {**data, "after": first_page.next_cursor})
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN " + captured.captured_queries[-1]["sql"])
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn(expected_index_name, plan)
+        self.assertNotIn("Sort", plan)  # i.e. ordered by the index
+
+
 class KindFilterTest(_FrontPageTestCase):
     @classmethod
     def setUpClass(cls):
@@ -252,3 +370,70 @@ class SortingEffectTest(_FrontPageTestCase):
         actual_object_list = list(response.context_data["object_list"])
         self.assertEqual(actual_object_list, expected_object_list)
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class CursorPaginationTest(_FrontPageTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for i in range(2 * _INSTANCES_PER_PAGE + 1):
+            DebianWnppFactory(
+                charge_person=f"contact{i % 7}@example.org" if i % 3 else None,
+                popcon=DebianPopconFactory(package=f"package{i}", inst=i % 5),
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()  # for the cached count
+
+    def _get_all_pages(self, data) -> list:
+        responses = [self.client.get(self.url, {**data, "after": ""})]
+        while responses[-1].context_data["page_obj"].has_next():
+            next_cursor = responses[-1].context_data["page_obj"].next_cursor
+            responses.append(self.client.get(self.url, {**data, "after": next_cursor}))
+        return responses
+
+    @parameterized.expand(
+        [
+            ("installs/desc", "popcon_inst"),
+            ("owner/asc", "charge_person"),
+            ("owner/desc", "charge_person"),
+        ]
+    )
+    def test_pages_cover_classic_order(self, sort, key):
+        data = {"col[]": list(_COLUMN_NAMES), "sort": sort}
+        front_page = FrontPageView()
+        front_page.setup(RequestFactory().get(self.url, data))
+        direction_prefix = "-" if sort.endswith("/desc") else ""
+        expected_object_list = list(
+            front_page.get_queryset().order_by(direction_prefix + key, direction_prefix + "pk")
+        )
+
+        responses = self._get_all_pages(data)
+
+        actual_object_list = [
+            issue for response in responses for issue in response.context_data["object_list"]
+        ]
+        self.assertEqual(actual_object_list, expected_object_list)
+        self.assertEqual(len(responses), 3)
+        self.assertContains(responses[-1], f"(101 to 101; {DebianWnpp.objects.count()} total)")
+
+    def test_ranked_search(self):
+        responses = self._get_all_pages({"q": "package7 or package77 or package17"})
+
+        actual_idents = [
+            issue.ident for response in responses for issue in response.context_data["object_list"]
+        ]
+        self.assertEqual(len(actual_idents), 3)
+
+    def test_count_cached(self):
+        self.client.get(self.url, {"after": ""})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"after": ""})
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_bad_cursor(self):
+        response = self.client.get(self.url, {"after": "bad"})
+
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)